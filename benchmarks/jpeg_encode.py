@@ -0,0 +1,83 @@
+"""
+Fixed quality=95 vs the size-targeted encoder (publish and preview budgets).
+
+Runs over a folder of photos, or over a synthetic photo-like image when none
+is given, and reports bytes, bytes saved and encode time per image.
+
+    python -m benchmarks.jpeg_encode
+    python -m benchmarks.jpeg_encode --images path/to/photos
+"""
+import io
+import os
+import time
+import argparse
+from PIL import Image, ImageFilter
+
+from src.tools.jpeg_encoder import encode_to_budget, PUBLISH_BUDGET_BYTES, PREVIEW_BUDGET_BYTES
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def synthetic_photo(size=(1080, 1350)) -> Image.Image:
+    """Gradient + noise + blurred shapes, compresses roughly like a product photo."""
+    base = Image.linear_gradient("L").resize(size).convert("RGB")
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    img = Image.blend(base, noise, 0.35)
+    return Image.blend(img, img.filter(ImageFilter.GaussianBlur(6)), 0.5)
+
+
+def baseline(img: Image.Image):
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=95)
+    return len(buffer.getvalue()), (time.perf_counter() - start) * 1000
+
+
+def budgeted(img: Image.Image, budget: int):
+    start = time.perf_counter()
+    data, quality, _ = encode_to_budget(img, budget)
+    return len(data), quality, (time.perf_counter() - start) * 1000
+
+
+def load_images(folder):
+    if not folder:
+        return [("synthetic", synthetic_photo())]
+    images = []
+    for name in sorted(os.listdir(folder)):
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+            with Image.open(os.path.join(folder, name)) as img:
+                img = img.convert("RGB")
+                if img.width > 1080:
+                    img = img.resize((1080, int(img.height * 1080 / img.width)), Image.Resampling.LANCZOS)
+                images.append((name, img))
+    return images
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Folder with photos (default: one synthetic image)")
+    args = parser.parse_args()
+
+    print(f"🚀 JPEG benchmark (publish budget {PUBLISH_BUDGET_BYTES // 1024} KB, "
+          f"preview budget {PREVIEW_BUDGET_BYTES // 1024} KB)\n")
+    print(f"{'image':<24} | {'q95':>15} | {'publish':>22} | {'preview':>22}")
+
+    totals = [0, 0, 0]
+    for name, img in load_images(args.images):
+        base_bytes, base_ms = baseline(img)
+        pub_bytes, pub_q, pub_ms = budgeted(img, PUBLISH_BUDGET_BYTES)
+        pre_bytes, pre_q, pre_ms = budgeted(img, PREVIEW_BUDGET_BYTES)
+        totals[0] += base_bytes
+        totals[1] += pub_bytes
+        totals[2] += pre_bytes
+        print(f"{name[:24]:<24} | {base_bytes // 1024:>6} KB {base_ms:>5.0f}ms "
+              f"| {pub_bytes // 1024:>6} KB q{pub_q:<2} {pub_ms:>5.0f}ms "
+              f"| {pre_bytes // 1024:>6} KB q{pre_q:<2} {pre_ms:>5.0f}ms")
+
+    print(f"\nBytes saved vs q95: publish {(totals[0] - totals[1]) // 1024} KB "
+          f"({100 * (1 - totals[1] / totals[0]):.0f}%), "
+          f"preview {(totals[0] - totals[2]) // 1024} KB ({100 * (1 - totals[2] / totals[0]):.0f}%)")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,201 @@
+"""
+Concurrent webhook load test.
+
+Starts the local Twilio / Meta / Gemini stand-ins (benchmarks.loadtest.stubs),
+boots the real app in a uvicorn subprocess pointed at them, then drives mixed
+WhatsApp sessions at increasing concurrency:
+
+    media (image or video) -> wait for preview -> caption edit -> POST or VERWIJDER
+
+Reports per level: webhook latency p50/p95/p99, time-to-preview (webhook in ->
+preview media sent via "Twilio"), sessions per minute and error rate.
+
+    python -m benchmarks.loadtest.run
+    python -m benchmarks.loadtest.run --levels 1 4 16 --sessions 2 --video-share 0.3
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+
+import httpx
+import uvicorn
+
+from benchmarks.loadtest.stubs import RECORDER, LATENCY, create_stub_app, make_sample_media
+
+STUB_PORT = 8765
+APP_PORT = 8766
+PREVIEW_TIMEOUT = 300
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def start_stubs(media_dir: str) -> uvicorn.Server:
+    stub_base = f"http://127.0.0.1:{STUB_PORT}"
+    app = create_stub_app(media_dir, stub_base)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=STUB_PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def start_app(work_dir: str) -> subprocess.Popen:
+    stub_base = f"http://127.0.0.1:{STUB_PORT}"
+    env = dict(
+        os.environ,
+        TWILIO_ACCOUNT_SID="ACloadtest",
+        TWILIO_AUTH_TOKEN="loadtest",
+        TWILIO_API_BASE=stub_base,
+        WHATSAPP_NUMBER="whatsapp:+10000000000",
+        BASE_URL=f"http://127.0.0.1:{APP_PORT}",
+        GOOGLE_API_KEY="loadtest",
+        GEMINI_API_BASE=stub_base,
+        META_GRAPH_API_BASE=stub_base,
+        META_GRAPH_VIDEO_API_BASE=stub_base,
+        FB_PAGE_ID="1001",
+        IG_USER_ID="2002",
+        META_ACCESS_TOKEN="loadtest",
+        MEDIA_DIR=os.path.join(work_dir, "app_media"),
+        JOB_DB_PATH=os.path.join(work_dir, "jobs.sqlite"),
+        MEDIA_DEDUP="false",  # Every session sends the same samples
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1",
+         "--port", str(APP_PORT), "--log-level", "warning"],
+        cwd=PROJECT_ROOT, env=env,
+    )
+
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{APP_PORT}/ready", timeout=2).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise SystemExit("❌ App exited during startup")
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit("❌ App did not become ready within 120s")
+
+
+async def wait_for_preview(sender: str, since: float) -> float:
+    """Seconds until the first media message to sender after `since`."""
+    deadline = since + PREVIEW_TIMEOUT
+    while time.monotonic() < deadline:
+        for sent_at, _, media_urls in RECORDER.messages_for(sender):
+            if sent_at >= since and media_urls:
+                return sent_at - since
+        await asyncio.sleep(0.1)
+    raise TimeoutError(f"no preview for {sender} within {PREVIEW_TIMEOUT}s")
+
+
+async def run_session(client: httpx.AsyncClient, sender: str, samples: dict, video_share: float, stats: dict):
+    kind = "video" if "video" in samples and random.random() < video_share else "image"
+    name, mime_type = samples[kind]
+
+    async def webhook(**form) -> None:
+        start = time.monotonic()
+        try:
+            response = await client.post("/whatsapp", data={"From": sender, **form})
+            response.raise_for_status()
+        except httpx.HTTPError:
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["webhook_latencies"].append(time.monotonic() - start)
+
+    sent_at = time.monotonic()
+    await webhook(NumMedia="1", Body="Nieuwe partij binnen", MediaUrl0=f"http://127.0.0.1:{STUB_PORT}/media/{name}",
+                  MediaContentType0=mime_type)
+    try:
+        stats["preview_times"][kind].append(await wait_for_preview(sender, sent_at))
+    except TimeoutError:
+        stats["errors"] += 1
+        return
+
+    await webhook(NumMedia="0", Body="Nu met 20% korting!")
+    await webhook(NumMedia="0", Body=random.choice(["POST", "VERWIJDER"]))
+    stats["completed"] += 1
+
+
+async def run_level(concurrency: int, sessions_per_worker: int, samples: dict, video_share: float) -> dict:
+    RECORDER.reset()
+    stats = {"webhook_latencies": [], "preview_times": {"image": [], "video": []}, "errors": 0, "completed": 0}
+
+    async def worker(index: int):
+        # One sender per worker: a sender only ever has one draft in flight
+        sender = f"whatsapp:+31600{concurrency:03d}{index:04d}"
+        for _ in range(sessions_per_worker):
+            try:
+                await run_session(client, sender, samples, video_share, stats)
+            except httpx.HTTPError:
+                pass
+
+    start = time.monotonic()
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{APP_PORT}", timeout=60) as client:
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    stats["seconds"] = time.monotonic() - start
+    stats["calls"] = dict(RECORDER.calls)
+    return stats
+
+
+def report(concurrency: int, stats: dict, sessions: int):
+    latencies = [s * 1000 for s in stats["webhook_latencies"]]
+    total = concurrency * sessions
+    print(f"\n👥 Concurrency {concurrency}: {stats['completed']}/{total} sessions in {stats['seconds']:.1f}s "
+          f"({stats['completed'] / stats['seconds'] * 60:.1f} sessions/min), "
+          f"errors {stats['errors']} ({stats['errors'] / max(total, 1):.0%})")
+    print(f"   webhook latency   p50 {percentile(latencies, 50):7.1f} ms | p95 {percentile(latencies, 95):7.1f} ms "
+          f"| p99 {percentile(latencies, 99):7.1f} ms")
+    for kind, times in stats["preview_times"].items():
+        if times:
+            print(f"   preview [{kind:5s}]   p50 {percentile(times, 50):7.2f} s  | p95 {percentile(times, 95):7.2f} s  "
+                  f"| max {max(times):7.2f} s  (n={len(times)}, mean {statistics.mean(times):.2f} s)")
+    print(f"   stub calls: {stats['calls']}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Concurrent webhook load test against local stand-ins")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--sessions", type=int, default=2, help="Sessions per concurrent sender")
+    parser.add_argument("--video-share", type=float, default=0.25)
+    parser.add_argument("--gemini-latency", type=float, default=LATENCY["gemini_generate"])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    LATENCY["gemini_generate"] = args.gemini_latency
+
+    with tempfile.TemporaryDirectory(prefix="loadtest_") as work_dir:
+        samples = make_sample_media(os.path.join(work_dir, "media"))
+        stubs = start_stubs(os.path.join(work_dir, "media"))
+        app_proc = start_app(work_dir)
+        print(f"🚦 Load test: levels {args.levels}, {args.sessions} sessions/sender, "
+              f"{args.video_share:.0%} video ({', '.join(samples)})")
+        try:
+            for concurrency in args.levels:
+                stats = asyncio.run(run_level(concurrency, args.sessions, samples, args.video_share))
+                report(concurrency, stats, args.sessions)
+        finally:
+            app_proc.terminate()
+            app_proc.wait(timeout=30)
+            stubs.should_exit = True
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,225 @@
+"""
+Local stand-ins for the external services the webhook talks to.
+
+One FastAPI app serves:
+  - Twilio REST      POST /2010-04-01/Accounts/{sid}/Messages.json
+  - Meta Graph       /v21.0/{page}/photos, /videos, /{ig}/media, /media_publish,
+                     GET /v21.0/{id} (images / status_code), batch POST /v21.0/
+  - Gemini           upload/v1beta/files (resumable), v1beta/models/{model}:generateContent,
+                     v1beta/cachedContents
+  - Sample media     GET /media/{name}  (what Twilio's MediaUrl0 would point at)
+
+Every outbound WhatsApp message is recorded in RECORDER so the driver can
+measure time-to-preview. Latencies are configurable to mimic the real services.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import threading
+import subprocess
+from collections import defaultdict
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, FileResponse
+
+from src.tools.media_probe import FFMPEG_BINARY
+
+# Simulated service latencies (seconds)
+LATENCY = {
+    "twilio": 0.15,
+    "meta": 0.3,
+    "gemini_upload": 0.4,
+    "gemini_generate": 2.5,
+}
+
+STUB_CAPTION = "🔥 Nieuwe partij binnen! Kom snel langs, OP = OP! 📍 Dokkum"
+BATCH_REFERENCE = re.compile(r"\{result=(\w+):\$\.id\}")  # Only the JSONPath the app uses
+
+
+class Recorder:
+    """Thread-safe log of outbound messages and API calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.messages = defaultdict(list)  # to -> [(timestamp, body, media_urls)]
+        self.calls = defaultdict(int)      # service -> count
+
+    def message(self, to: str, body: str, media_urls: list):
+        with self._lock:
+            self.messages[to].append((time.monotonic(), body, media_urls))
+
+    def call(self, service: str):
+        with self._lock:
+            self.calls[service] += 1
+
+    def messages_for(self, to: str) -> list:
+        with self._lock:
+            return list(self.messages[to])
+
+    def reset(self):
+        with self._lock:
+            self.messages.clear()
+            self.calls.clear()
+
+
+RECORDER = Recorder()
+
+
+def make_sample_media(media_dir: str) -> dict:
+    """Creates the files the fake Twilio media URLs serve. Video needs ffmpeg."""
+    from PIL import Image
+
+    os.makedirs(media_dir, exist_ok=True)
+    samples = {}
+
+    image_path = os.path.join(media_dir, "product.jpg")
+    if not os.path.exists(image_path):
+        Image.effect_noise((1600, 2000), 60).convert("RGB").save(image_path, "JPEG", quality=90)
+    samples["image"] = ("product.jpg", "image/jpeg")
+
+    video_path = os.path.join(media_dir, "product.mp4")
+    if not os.path.exists(video_path):
+        try:
+            subprocess.run([
+                FFMPEG_BINARY, "-y", "-v", "error",
+                "-f", "lavfi", "-i", "testsrc2=size=720x1280:rate=30:duration=12",
+                "-f", "lavfi", "-i", "sine=frequency=440:duration=12",
+                "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-c:a", "aac",
+                "-shortest", video_path,
+            ], check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"⚠️ Could not create sample video ({e}), video traffic disabled")
+    if os.path.exists(video_path):
+        samples["video"] = ("product.mp4", "video/mp4")
+    return samples
+
+
+def create_stub_app(media_dir: str, public_base: str) -> FastAPI:
+    app = FastAPI(title="Load test stand-ins")
+    counter = {"id": 0}
+
+    def next_id() -> str:
+        counter["id"] += 1
+        return str(10_000 + counter["id"])
+
+    # --- Sample media ---
+    @app.get("/media/{name}")
+    async def media(name: str):
+        return FileResponse(os.path.join(media_dir, name))
+
+    # --- Twilio ---
+    @app.post("/2010-04-01/Accounts/{sid}/Messages.json")
+    async def twilio_message(sid: str, request: Request):
+        form = await request.form()
+        await asyncio.sleep(LATENCY["twilio"])
+        RECORDER.call("twilio")
+        RECORDER.message(form.get("To", ""), form.get("Body", ""), form.getlist("MediaUrl"))
+        message_sid = f"SM{uuid.uuid4().hex}"
+        return JSONResponse(status_code=201, content={
+            "sid": message_sid, "account_sid": sid, "to": form.get("To"), "from": form.get("From"),
+            "body": form.get("Body"), "status": "queued", "num_media": str(len(form.getlist("MediaUrl"))),
+            "uri": f"/2010-04-01/Accounts/{sid}/Messages/{message_sid}.json",
+        })
+
+    # --- Meta Graph ---
+    def _graph_get(object_id: str, fields: str) -> dict:
+        if "images" in fields:
+            return {"id": object_id, "images": [{"source": f"{public_base}/media/product.jpg"}]}
+        if "status_code" in fields:
+            return {"id": object_id, "status_code": "FINISHED"}
+        return {"id": object_id}
+
+    def _graph_post(path: str) -> dict:
+        RECORDER.call(f"meta:{path.rsplit('/', 1)[-1]}")
+        return {"id": next_id()}
+
+    @app.post("/v21.0/")
+    async def graph_batch(request: Request):
+        form = await request.form()
+        batch = json.loads(form.get("batch", "[]"))
+        await asyncio.sleep(LATENCY["meta"])
+        RECORDER.call("meta:batch")
+        # Like Meta: a named request that later items reference returns null on success,
+        # unless it sets omit_response_on_success to false
+        referenced = {name for item in batch for name in BATCH_REFERENCE.findall(item["relative_url"])}
+        named, results = {}, []
+        for item in batch:
+            url = BATCH_REFERENCE.sub(lambda m: named[m.group(1)]["id"], item["relative_url"])
+            path, _, query = url.partition("?")
+            if item["method"] == "GET":
+                body = _graph_get(path.strip("/"), query)
+            else:
+                body = _graph_post(path)
+            if item.get("name"):
+                named[item["name"]] = body
+            if item.get("name") in referenced and item.get("omit_response_on_success", True):
+                results.append(None)
+            else:
+                results.append({"code": 200, "headers": [], "body": json.dumps(body)})
+        return results
+
+    @app.post("/v21.0/{path:path}")
+    async def graph_post(path: str):
+        await asyncio.sleep(LATENCY["meta"])
+        return _graph_post(path)
+
+    @app.get("/v21.0/{object_id}")
+    async def graph_get(object_id: str, fields: str = ""):
+        await asyncio.sleep(LATENCY["meta"])
+        RECORDER.call("meta:get")
+        return _graph_get(object_id, fields)
+
+    # --- Gemini ---
+    @app.post("/upload/v1beta/files")
+    async def gemini_upload_start(request: Request):
+        upload_id = uuid.uuid4().hex
+        return Response(
+            content="{}", media_type="application/json",
+            headers={"x-goog-upload-url": f"{public_base}/upload/v1beta/files/session/{upload_id}",
+                     "x-goog-upload-status": "active"},
+        )
+
+    @app.post("/upload/v1beta/files/session/{upload_id}")
+    async def gemini_upload_chunk(upload_id: str, request: Request):
+        await request.body()
+        await asyncio.sleep(LATENCY["gemini_upload"])
+        RECORDER.call("gemini:upload")
+        name = f"files/{upload_id[:12]}"
+        file_info = {"name": name, "uri": f"{public_base}/v1beta/{name}", "mimeType": "image/jpeg", "state": "ACTIVE"}
+        return JSONResponse(content={"file": file_info}, headers={"x-goog-upload-status": "final"})
+
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini_generate(model_action: str, request: Request):
+        body = await request.json()
+        if model_action.endswith(":countTokens"):
+            # Rough estimate (4 characters per token) for the prompt cache's minimum-size check
+            text = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+            return {"totalTokens": len(text) // 4}
+        await asyncio.sleep(LATENCY["gemini_generate"])
+        RECORDER.call("gemini:generate")
+        text = STUB_CAPTION
+        if body.get("generationConfig", {}).get("responseMimeType") == "application/json":
+            # Caption variants (structured output)
+            text = json.dumps({"captions": [f"{STUB_CAPTION} (versie {i})" for i in range(1, 4)]})
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": 900, "candidatesTokenCount": 60, "totalTokenCount": 960},
+        }
+
+    @app.post("/v1beta/cachedContents")
+    async def gemini_cache_create():
+        RECORDER.call("gemini:cache")
+        return {"name": f"cachedContents/{uuid.uuid4().hex[:12]}", "model": "models/gemini-2.5-flash"}
+
+    @app.patch("/v1beta/cachedContents/{cache_id}")
+    async def gemini_cache_update(cache_id: str):
+        return {"name": f"cachedContents/{cache_id}"}
+
+    @app.delete("/v1beta/cachedContents/{cache_id}")
+    async def gemini_cache_delete(cache_id: str):
+        return {}
+
+    return app
@@ -0,0 +1,92 @@
+"""
+Near-duplicate lookups: multi-index hashing vs a linear scan.
+
+Fills an index with random image signatures (1k, 10k, 50k entries) and reports
+lookup latency for resends (signatures a few bits off) and for new media, plus
+whether the resend was found. With --images it also hashes each photo and a
+WhatsApp-like resend of it (2% crop, downscale, JPEG quality 60) and prints
+the Hamming distance against MEDIA_DEDUP_MAX_DISTANCE.
+
+    python -m benchmarks.media_index
+    python -m benchmarks.media_index --images path/to/photos
+"""
+import io
+import os
+import time
+import random
+import argparse
+from PIL import Image
+
+from src.tools.media_index import (
+    MultiIndexHash, DEDUP_MAX_DISTANCE, FRAME_BITS, frame_hash, hamming, image_signature,
+)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+SIZES = [1_000, 10_000, 50_000]
+QUERIES = 500
+
+
+def resend(signature: int) -> int:
+    """Same media after WhatsApp: up to the threshold bits flipped."""
+    for bit in random.sample(range(FRAME_BITS), random.randint(0, DEDUP_MAX_DISTANCE)):
+        signature ^= 1 << bit
+    return signature
+
+
+def linear_scan(signatures: list, query: int):
+    return sorted((hamming(query, s), i) for i, s in enumerate(signatures) if hamming(query, s) <= DEDUP_MAX_DISTANCE)
+
+
+def per_query_ms(search, queries: list) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def whatsapp_copy(img: Image.Image) -> Image.Image:
+    w, h = img.size
+    cropped = img.crop((int(w * 0.02), int(h * 0.02), w - int(w * 0.02), h - int(h * 0.02)))
+    cropped = cropped.resize((cropped.width * 3 // 4, cropped.height * 3 // 4), Image.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    cropped.convert("RGB").save(buffer, "JPEG", quality=60)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Folder with photos to check resend distances on")
+    args = parser.parse_args()
+
+    random.seed(42)
+    print(f"🚀 Media index benchmark (radius {DEDUP_MAX_DISTANCE} of {FRAME_BITS} bits, {QUERIES} queries)")
+    print(f"{'entries':>8} | {'index resend':>12} | {'index new':>10} | {'scan':>9} | {'found':>7}")
+    for size in SIZES:
+        signatures = [random.getrandbits(FRAME_BITS) for _ in range(size)]
+        index = MultiIndexHash(FRAME_BITS, DEDUP_MAX_DISTANCE)
+        for i, signature in enumerate(signatures):
+            index.add(i, signature)
+
+        targets = random.sample(range(size), QUERIES)
+        resends = [resend(signatures[i]) for i in targets]
+        new = [random.getrandbits(FRAME_BITS) for _ in range(QUERIES)]
+        found = sum(any(entry == i for _, entry in index.search(q)) for i, q in zip(targets, resends))
+
+        print(f"{size:>8} | {per_query_ms(index.search, resends):>9.3f} ms | {per_query_ms(index.search, new):>7.3f} ms | "
+              f"{per_query_ms(lambda q: linear_scan(signatures, q), resends[:50]):>6.2f} ms | {found:>3}/{QUERIES}")
+
+    if args.images:
+        print("\n📷 Resend distances")
+        for name in sorted(os.listdir(args.images)):
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.join(args.images, name)
+            with Image.open(path) as img:
+                copy = frame_hash(whatsapp_copy(img))
+            distance = hamming(image_signature(path), copy)
+            print(f"{name:<30} {distance:>3} bits {'✅' if distance <= DEDUP_MAX_DISTANCE else '❌'}")
+
+
+if __name__ == "__main__":
+    run()
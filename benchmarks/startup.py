@@ -0,0 +1,62 @@
+"""
+Cold start benchmark.
+
+Measures how long `import src.main` takes in a fresh interpreter (what Render
+pays on scale-from-zero before the port opens), then how long the background
+warm-up needs, and lists the slowest imports from `python -X importtime`.
+
+    python -m benchmarks.startup
+"""
+import re
+import sys
+import subprocess
+
+RUNS = 3
+TOP_IMPORTS = 15
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import src.main
+print(f"IMPORT {time.perf_counter() - start:.4f}")
+from src.warmup import warm_up, WARMUP_STATE
+start = time.perf_counter()
+warm_up()
+print(f"WARMUP {time.perf_counter() - start:.4f} {WARMUP_STATE['status']}")
+"""
+
+
+def run_once():
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit("❌ Could not import src.main")
+    import_s = float(re.search(r"IMPORT ([\d.]+)", result.stdout).group(1))
+    warmup = re.search(r"WARMUP ([\d.]+) (\w+)", result.stdout)
+    return import_s, float(warmup.group(1)), warmup.group(2)
+
+
+def slowest_imports():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import src.main"],
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(.*)", line)
+        if match:
+            rows.append((int(match.group(2)), match.group(3).strip()))
+    return sorted(rows, reverse=True)[:TOP_IMPORTS]
+
+
+def run():
+    print(f"🚀 Cold start benchmark ({RUNS} runs)")
+    for i in range(RUNS):
+        import_s, warmup_s, status = run_once()
+        print(f"   run {i + 1}: import src.main {import_s * 1000:7.1f} ms | warm-up {warmup_s * 1000:7.1f} ms ({status})")
+
+    print("\nSlowest imports during `import src.main` (cumulative):")
+    for micros, module in slowest_imports():
+        print(f"   {micros / 1000:8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,83 @@
+"""
+Video analysis input: individual keyframes vs one contact sheet.
+
+For each clip, runs both VIDEO_ANALYSIS_MODE variants and reports extraction
+time, number of parts sent, bytes sent and an estimate of Gemini image input
+tokens. With --live (needs GOOGLE_API_KEY) it also generates a caption with
+each mode and prints end-to-end latency and both captions for comparison.
+
+    python -m benchmarks.video_analysis
+    python -m benchmarks.video_analysis --videos clip1.mp4 clip2.mp4 --live
+"""
+import os
+import math
+import time
+import asyncio
+import argparse
+from PIL import Image
+
+from benchmarks.video_encode import make_clip
+from src.agent.graph import ANALYSIS_FRAMES
+from src.agent.gemini_client import generate_social_post
+from src.agent.prompts import KOOISTRA_PROMPT
+from src.tools.video_ops import extract_keyframes, extract_contact_sheet
+
+CONTEXT = "Nieuwe partij binnen, vandaag in de winkel."
+
+
+def estimate_image_tokens(path: str) -> int:
+    """Gemini: 258 tokens when both sides <= 384 px, otherwise 258 per 768x768 tile."""
+    with Image.open(path) as img:
+        width, height = img.size
+    if width <= 384 and height <= 384:
+        return 258
+    return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+
+def measure(extract, clip: str, num_frames: int):
+    start = time.perf_counter()
+    paths = extract(clip, num_frames)
+    elapsed = time.perf_counter() - start
+    return paths, elapsed, sum(os.path.getsize(p) for p in paths), sum(estimate_image_tokens(p) for p in paths)
+
+
+async def caption(paths: list, inline: bool):
+    start = time.perf_counter()
+    text = await generate_social_post(paths, CONTEXT, KOOISTRA_PROMPT, prompt_slot="kooistra", inline_media=inline)
+    return text, time.perf_counter() - start
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", nargs="+", help="Clips to analyse (default: a synthetic 20 s clip)")
+    parser.add_argument("--live", action="store_true", help="Also call Gemini with both modes")
+    parser.add_argument("--workdir", default="/tmp/video_bench")
+    args = parser.parse_args()
+
+    clips = args.videos
+    if not clips:
+        os.makedirs(args.workdir, exist_ok=True)
+        clips = [os.path.join(args.workdir, "clip_20s.mp4")]
+        make_clip(clips[0], 20)
+
+    print(f"🚀 Video analysis benchmark ({len(clips)} clip(s){', live Gemini' if args.live else ''})")
+    for clip in clips:
+        frames = measure(extract_keyframes, clip, ANALYSIS_FRAMES["frames"])
+        sheet = measure(extract_contact_sheet, clip, ANALYSIS_FRAMES["contact_sheet"])
+
+        print(f"\n🎬 {os.path.basename(clip)}")
+        print(f"{'mode':<14} | {'extract':>8} | {'parts':>5} | {'bytes':>9} | {'~img tokens':>11}")
+        for mode, (paths, elapsed, size, tokens) in (("frames", frames), ("contact_sheet", sheet)):
+            print(f"{mode:<14} | {elapsed:>7.2f}s | {len(paths):>5} | {size // 1024:>6} KB | {tokens:>11}")
+
+        if args.live:
+            for mode, paths, inline in (("frames", frames[0], False), ("contact_sheet", sheet[0], True)):
+                text, elapsed = asyncio.run(caption(paths, inline))
+                print(f"\n--- {mode}: {elapsed:.2f}s end-to-end ---\n{text}")
+
+        for path in frames[0] + sheet[0]:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,64 @@
+"""
+Single-process vs segment-parallel brand_video.
+
+Generates synthetic 1080x1920 / 30 fps clips with audio (ffmpeg testsrc2 + sine),
+brands each one with both paths and reports wall time and speedup.
+
+    python -m benchmarks.video_encode
+    python -m benchmarks.video_encode --durations 30 60 --workdir /tmp/bench
+"""
+import os
+import time
+import argparse
+import subprocess
+
+from src.tools.media_probe import FFMPEG_BINARY
+from src.tools.video_ops import brand_video, _encode_workers
+
+DEFAULT_DURATIONS = [30, 60, 90]
+
+
+def make_clip(path: str, seconds: int):
+    if os.path.exists(path):
+        return
+    print(f"   generating {seconds}s test clip...")
+    subprocess.run([
+        FFMPEG_BINARY, "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=1080x1920:rate=30:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:v", "libx264", "-preset", "veryfast", "-g", "60", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    output = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    os.remove(output)
+    return elapsed
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=int, nargs="+", default=DEFAULT_DURATIONS)
+    parser.add_argument("--workdir", default="/tmp/video_bench")
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+
+    print(f"🚀 brand_video benchmark ({os.cpu_count()} cores, {_encode_workers()} workers)")
+    rows = []
+    for seconds in args.durations:
+        clip = os.path.join(args.workdir, f"clip_{seconds}s.mp4")
+        make_clip(clip, seconds)
+        single = timed(brand_video, clip, parallel=False)
+        parallel = timed(brand_video, clip, parallel=True)
+        rows.append((seconds, single, parallel))
+
+    print(f"\n{'clip':>6} | {'single':>9} | {'parallel':>9} | speedup")
+    for seconds, single, parallel in rows:
+        print(f"{seconds:>5}s | {single:>8.1f}s | {parallel:>8.1f}s | {single / parallel:5.2f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,5 @@
+# Kept dependency-free so src.main can catch these without importing the Gemini SDK
+
+
+class CaptionGenerationError(Exception):
+    """Raised when Gemini could not produce a caption (the job should fail, not save a draft)."""
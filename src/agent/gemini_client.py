@@ -1,60 +1,289 @@
 import os
+import json
 import time
-from typing import List, Union
+import random
+import asyncio
+import mimetypes
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Union, Optional, TypedDict
 from google import genai
 from google.genai import types
+from google.genai import errors as genai_errors
 
-# Initialize client
-client = genai.Client(api_key=os.environ.get("GOOGLE_API_KEY"))
+from src.agent.errors import CaptionGenerationError
+from src.agent.prompt_cache import PromptCache
 
-def generate_social_post(media_paths: Union[str, List[str]], context_text: str, prompt_template: str):
+# --- CONFIGURATION ---
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+REQUEST_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", "60"))         # Per attempt (seconds)
+UPLOAD_TIMEOUT = float(os.environ.get("GEMINI_UPLOAD_TIMEOUT", "120"))  # Per file upload
+MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.environ.get("GEMINI_BACKOFF_BASE", "1.0"))
+HEDGE_ENABLED = os.environ.get("GEMINI_HEDGE", "false").lower() == "true"
+MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "4"))   # Keeps bursts inside our quota
+PROMPT_CACHE_ENABLED = os.environ.get("GEMINI_PROMPT_CACHE", "true").lower() == "true"
+PROMPT_CACHE_TTL = int(os.environ.get("GEMINI_PROMPT_CACHE_TTL", "3600"))
+CAPTION_VARIANTS = int(os.environ.get("GEMINI_CAPTION_VARIANTS", "3"))  # Alternatives per WhatsApp draft
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+HEDGE_MIN_SAMPLES = 20
+
+
+class CaptionResult(TypedDict):
+    variants: List[str]   # First one is the default caption
+    media: List[dict]     # {"uri", "mime_type"} per uploaded file or {"path", "mime_type"} per inline part
+
+
+# Shared by every job on the event loop
+_limiter = asyncio.Semaphore(MAX_CONCURRENCY)
+_latencies = deque(maxlen=200)
+
+
+@lru_cache(maxsize=1)
+def get_client() -> genai.Client:
+    """Client is built on first use (or by the warm-up), not at import time."""
+    # GEMINI_API_BASE points the SDK at a local stand-in for load tests
+    api_base = os.environ.get("GEMINI_API_BASE")
+    http_options = types.HttpOptions(base_url=api_base) if api_base else None
+    return genai.Client(api_key=os.environ.get("GOOGLE_API_KEY"), http_options=http_options)
+
+
+@lru_cache(maxsize=1)
+def get_prompt_cache() -> PromptCache:
+    return PromptCache(get_client(), GEMINI_MODEL, ttl_seconds=PROMPT_CACHE_TTL)
+
+
+async def preload_prompt_caches(prompts: Dict[str, str]):
+    """Creates the cache handle of every prompt slot up front, so no job pays for caches.create."""
+    if PROMPT_CACHE_ENABLED:
+        await asyncio.gather(*(get_prompt_cache().get(slot, prompt) for slot, prompt in prompts.items()))
+
+
+def _p95_latency() -> Optional[float]:
+    """p95 of recent successful calls, or None until we have enough samples."""
+    if len(_latencies) < HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(_latencies)
+    return ordered[int(len(ordered) * 0.95) - 1]
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    return isinstance(error, genai_errors.APIError) and error.code in RETRYABLE_STATUS
+
+
+async def _with_retries(label: str, make_call):
+    """Runs make_call() with exponential backoff + jitter on timeouts, 429s and 5xx."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await make_call()
+        except Exception as e:
+            if not _is_retryable(e) or attempt == MAX_RETRIES:
+                raise CaptionGenerationError(f"{label} failed: {e!r}") from e
+            delay = BACKOFF_BASE * (2 ** attempt) + random.uniform(0, BACKOFF_BASE)
+            print(f"⚠️ {label} attempt {attempt + 1} failed ({e!r}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def _generate_once(contents, config):
+    async with _limiter:
+        start = time.monotonic()
+        response = await asyncio.wait_for(
+            get_client().aio.models.generate_content(model=GEMINI_MODEL, contents=contents, config=config),
+            timeout=REQUEST_TIMEOUT,
+        )
+        _latencies.append(time.monotonic() - start)
+        return response
+
+
+async def _generate_hedged(contents, config):
     """
-    Uploads one or multiple images/frames to Gemini and generates a caption.
+    If hedging is on and the first request is slower than our p95,
+    fire a second identical request and take whichever finishes first.
     """
-    print(f"Uploading media to Gemini...")
-    
+    hedge_after = _p95_latency() if HEDGE_ENABLED else None
+    if hedge_after is None:
+        return await _generate_once(contents, config)
+
+    primary = asyncio.create_task(_generate_once(contents, config))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    print(f"⏱️ Gemini slower than p95 ({hedge_after:.1f}s), sending hedge request")
+    pending = {primary, asyncio.create_task(_generate_once(contents, config))}
+    first_error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                first_error = first_error or task.exception()
+        raise first_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _upload(path: str):
+    print(f"   - Uploading: {os.path.basename(path)}")
+    return await asyncio.wait_for(get_client().aio.files.upload(file=path), timeout=UPLOAD_TIMEOUT)
+
+
+def _inline_part(path: str) -> types.Part:
+    """Small images (e.g. the video contact sheet) go inline with the request, no upload round trip."""
+    with open(path, "rb") as f:
+        data = f.read()
+    mime_type = mimetypes.guess_type(path)[0] or "image/jpeg"
+    print(f"   - Inline: {os.path.basename(path)} ({len(data) // 1024} KB)")
+    return types.Part.from_bytes(data=data, mime_type=mime_type)
+
+
+async def _build_config(prompt_template: str, prompt_slot: str, **overrides) -> types.GenerateContentConfig:
+    """The static prompt goes in as system instruction, served from the context cache when possible."""
+    cached_name = None
+    if PROMPT_CACHE_ENABLED:
+        try:
+            cached_name = await get_prompt_cache().get(prompt_slot, prompt_template)
+        except Exception as e:
+            # The cache is only an optimisation, never a reason to fail the caption
+            print(f"⚠️ Prompt cache lookup failed for '{prompt_slot}', sending the prompt inline: {e}")
+    if cached_name:
+        return types.GenerateContentConfig(temperature=0.7, cached_content=cached_name, **overrides)
+    return types.GenerateContentConfig(temperature=0.7, system_instruction=prompt_template, **overrides)
+
+
+def _variants_schema(count: int) -> types.Schema:
+    """Structured output: {"captions": [count strings]}."""
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "captions": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(type=types.Type.STRING),
+                min_items=count,
+                max_items=count,
+            ),
+        },
+        required=["captions"],
+    )
+
+
+def _parse_variants(text: str) -> List[str]:
+    try:
+        captions = json.loads(text)["captions"]
+    except (ValueError, KeyError, TypeError):
+        # Not the JSON we asked for: treat the whole answer as one caption
+        return [text]
+    return [caption.strip() for caption in captions if isinstance(caption, str) and caption.strip()]
+
+
+async def _media_parts(paths: List[str], inline_media: bool):
+    """Returns (content parts, reusable references) for the media."""
+    if inline_media:
+        parts = [_inline_part(path) for path in paths]
+        refs = [{"path": path, "mime_type": part.inline_data.mime_type} for path, part in zip(paths, parts)]
+        return parts, refs
+    files = await asyncio.gather(*[
+        _with_retries("Gemini upload", lambda p=path: _upload(p)) for path in paths
+    ])
+    return list(files), [{"uri": f.uri, "mime_type": f.mime_type} for f in files]
+
+
+def _ref_part(ref: dict) -> Optional[types.Part]:
+    if ref.get("uri"):
+        return types.Part.from_uri(file_uri=ref["uri"], mime_type=ref["mime_type"])
+    if ref.get("path") and os.path.exists(ref["path"]):
+        return _inline_part(ref["path"])
+    return None
+
+
+async def generate_caption_variants(media_paths: Union[str, List[str]], context_text: str, prompt_template: str,
+                                    prompt_slot: str = "default", inline_media: bool = False,
+                                    count: int = CAPTION_VARIANTS) -> CaptionResult:
+    """
+    Uploads one or multiple images/frames to Gemini and generates `count` caption variants
+    in a single request (structured output). The media references are returned so
+    revise_caption can reuse them without uploading again.
+    With inline_media the files are sent as inline parts instead of uploaded (keep them small).
+    Raises CaptionGenerationError instead of returning an error string.
+    """
+    print(f"{'Attaching' if inline_media else 'Uploading'} media to Gemini...")
+
     # 1. Normalize input to a list
     if isinstance(media_paths, str):
         media_paths = [media_paths]
-        
-    uploaded_files = []
-    
-    # 2. Upload all files
-    try:
-        for path in media_paths:
-            # Check if file exists
-            if not os.path.exists(path):
-                print(f"Warning: File not found {path}, skipping.")
-                continue
-                
-            # Upload
-            print(f"   - Uploading: {os.path.basename(path)}")
-            file_obj = client.files.upload(file=path)
-            uploaded_files.append(file_obj)
-            
-            # Small delay to ensure Google processes it (rarely needed but safer)
-            time.sleep(0.5)
-
-        if not uploaded_files:
-            return "Error: No media files could be uploaded."
-
-        # 3. Construct the prompt
-        # We pass the list of file objects AND the text prompt
-        contents = uploaded_files + [f"{prompt_template}\n\nEXTRA CONTEXT:\n{context_text}"]
-
-        print("Generating content...")
-        
-        # 4. Call the model
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=contents,
-            config=types.GenerateContentConfig(
-                temperature=0.7
-            )
-        )
 
-        return response.text
+    existing = []
+    for path in media_paths:
+        if not os.path.exists(path):
+            print(f"Warning: File not found {path}, skipping.")
+            continue
+        existing.append(path)
+
+    if not existing:
+        raise CaptionGenerationError("No media files could be uploaded.")
+
+    # 2. Upload all files (concurrently) while the prompt cache is looked up
+    overrides = {}
+    if count > 1:
+        overrides = {"response_mime_type": "application/json", "response_schema": _variants_schema(count)}
+    (parts, refs), config = await asyncio.gather(
+        _media_parts(existing, inline_media),
+        _build_config(prompt_template, prompt_slot, **overrides),
+    )
+
+    # 3. Construct the prompt
+    # Only the files and the per-request context go in the user turn
+    contents = parts + [f"EXTRA CONTEXT:\n{context_text}"]
+    if count > 1:
+        contents.append(f"Schrijf {count} verschillende versies van de post, elk met een andere opening en invalshoek.")
+
+    print(f"Generating content ({count} variant{'s' if count > 1 else ''})...")
+
+    # 4. Call the model
+    response = await _with_retries("Gemini generate", lambda: _generate_hedged(contents, config))
+
+    if not response.text:
+        raise CaptionGenerationError("Gemini returned an empty caption.")
+    variants = _parse_variants(response.text) if count > 1 else [response.text]
+    if not variants:
+        raise CaptionGenerationError("Gemini returned no caption variants.")
+    return {"variants": variants, "media": refs}
+
+
+async def generate_social_post(media_paths: Union[str, List[str]], context_text: str, prompt_template: str,
+                               prompt_slot: str = "default", inline_media: bool = False) -> str:
+    """Single caption (see generate_caption_variants)."""
+    result = await generate_caption_variants(media_paths, context_text, prompt_template, prompt_slot,
+                                             inline_media=inline_media, count=1)
+    return result["variants"][0]
+
+
+async def revise_caption(caption: str, instruction: str, media: List[dict], context_text: str,
+                         prompt_template: str, prompt_slot: str = "default") -> str:
+    """
+    Rewrites an existing caption following a short instruction ("korter", "meer emoji").
+    Reuses the media references from generate_caption_variants (no upload); uploaded
+    files expire after 48 hours, then the revision is done on the text alone.
+    """
+    parts = [part for part in (_ref_part(ref) for ref in media) if part is not None]
+    request = (f"EXTRA CONTEXT:\n{context_text}\n\nHUIDIGE POST:\n{caption}\n\n"
+               f"Herschrijf de post volgens deze instructie en geef alleen de nieuwe post terug: {instruction}")
+    config = await _build_config(prompt_template, prompt_slot)
+
+    print(f"Revising caption ({len(parts)} media reference(s)): {instruction}")
+    try:
+        response = await _with_retries("Gemini revise", lambda: _generate_hedged(parts + [request], config))
+    except CaptionGenerationError:
+        if not parts:
+            raise
+        print("⚠️ Revision with media failed (expired file handles?), retrying on the text alone")
+        response = await _with_retries("Gemini revise", lambda: _generate_hedged([request], config))
 
-    except Exception as e:
-        print(f"Gemini Error: {e}")
-        return "Error generating caption. Please try again."
\ No newline at end of file
+    if not response.text:
+        raise CaptionGenerationError("Gemini returned an empty revision.")
+    return response.text
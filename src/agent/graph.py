@@ -1,10 +1,22 @@
+import os
+import asyncio
+from functools import lru_cache
 from typing import TypedDict, Optional, List
 from langgraph.graph import StateGraph, END
 
 # Import tools
-from src.tools.image_ops import process_image, apply_branding
-from src.agent.gemini_client import generate_social_post
-from src.agent.prompts import KOOISTRA_PROMPT
+from src.tools.image_ops import process_image, apply_branding, make_preview_image
+from src.tools.video_ops import make_preview_proxy, extract_keyframes, extract_contact_sheet
+from src.agent.gemini_client import generate_caption_variants
+from src.tools.tenants import current_tenant
+from src.tools.profiling import profile_stage, profiled_to_thread
+from src.tools.job_tracker import raise_if_superseded
+
+# How Gemini "sees" a video:
+#   contact_sheet -> one labelled mosaic of downscaled frames, sent inline (1 part, no uploads)
+#   frames        -> individual full-resolution keyframes, each uploaded separately
+VIDEO_ANALYSIS_MODE = os.environ.get("VIDEO_ANALYSIS_MODE", "contact_sheet").lower()
+ANALYSIS_FRAMES = {"contact_sheet": 6, "frames": 5}
 
 # 1. Define the State
 class AgentState(TypedDict):
@@ -14,68 +26,113 @@ class AgentState(TypedDict):
     
     # For AI Analysis
     analysis_frame_paths: Optional[List[str]] # List of images for Gemini to "see"
+    analysis_inline: Optional[bool]           # Send them inline (contact sheet) instead of uploading
     
     # Outputs
     processed_path: Optional[str] # The final branded file (Image or Video)
+    preview_path: Optional[str]   # Smaller copy for the WhatsApp preview (proxy video / preview JPEG)
     generated_caption: Optional[str]
+    caption_variants: Optional[List[str]]     # Alternatives from the same call ("2", "3" on WhatsApp)
+    media_refs: Optional[List[dict]]          # Gemini file handles, reused for caption revisions
 
 # 2. Define the Nodes
-def processing_node(state: AgentState):
+@profile_stage("process_media")
+async def processing_node(state: AgentState):
     """
     Handles Branding.
     - If Image: Resize + Brand.
-    - If Video: Skip (Branding is done in main.py via video_ops to save state complexity).
+    - If Video: Preview proxy + Keyframes from the source (full-quality branding
+      runs in main.py in an isolated worker, in parallel with this graph).
     """
     print("--- 1. PROCESSING MEDIA ---")
+    raise_if_superseded("processing")
     
     if state["is_video"]:
-        # videos are branded in main.py
-        return {"processed_path": state["input_path"]}
+        contact_sheet = VIDEO_ANALYSIS_MODE == "contact_sheet"
+        extract = extract_contact_sheet if contact_sheet else extract_keyframes
+        preview_path, keyframes = await asyncio.gather(
+            profiled_to_thread(make_preview_proxy, state["input_path"], current_tenant()["assets_dir"]),
+            profiled_to_thread(extract, state["input_path"], ANALYSIS_FRAMES.get(VIDEO_ANALYSIS_MODE, 5))
+        )
+        return {
+            "processed_path": state["input_path"],
+            "preview_path": preview_path,
+            "analysis_frame_paths": keyframes,
+            "analysis_inline": contact_sheet and bool(keyframes)
+        }
     
     else:
         # Resize
-        resized = process_image(state["input_path"])
+        resized = await profiled_to_thread(process_image, state["input_path"])
 
         # Brand
         # NOT USED SO COMMENTED OUT
         #branded = apply_branding(resized)
         
+        # Preview gets its own (smaller) byte budget
+        preview = await profiled_to_thread(make_preview_image, resized)
+        
         # For images, the "Analysis Frames" is just the single branded image
         return {
             "processed_path": resized, 
+            "preview_path": preview,
             "analysis_frame_paths": [resized]
         }
 
-def content_generation_node(state: AgentState):
-    """Calls Gemini to write the caption using the analysis frames."""
+@profile_stage("generate_caption")
+async def content_generation_node(state: AgentState):
+    """Calls Gemini to write the caption using the analysis frames (run via ainvoke)."""
     print("--- 2. GENERATING CAPTION ---")
+    raise_if_superseded("caption generation")
     
-    # If video, state['analysis_frame_paths'] was passed in by main.py (keyframes)
-    # If image, it was set by processing_node above (single image)
+    # If video, state['analysis_frame_paths'] are the keyframes (or the contact sheet) from processing_node
+    # If image, it is the single processed image
     
     media_inputs = state.get("analysis_frame_paths", [])
     
     if not media_inputs:
         media_inputs = [state["input_path"]]
 
-    caption = generate_social_post(
+    context_text = state["context_text"]
+    if state.get("analysis_inline"):
+        # Tell the model what the mosaic is, otherwise it describes "a collage"
+        context_text = ("(De afbeelding is een contactsheet: stilstaande beelden uit één video, "
+                        "op volgorde, met tijdstempel linksboven.)\n" + context_text)
+
+    # Each shop has its own prompt (and Gemini prompt cache slot)
+    tenant = current_tenant()
+    result = await generate_caption_variants(
         media_paths=media_inputs,
-        context_text=state["context_text"],
-        prompt_template=KOOISTRA_PROMPT
+        context_text=context_text,
+        prompt_template=tenant["prompt"],
+        prompt_slot=tenant["prompt_slot"],
+        inline_media=bool(state.get("analysis_inline"))
     )
-    return {"generated_caption": caption}
+    return {
+        "generated_caption": result["variants"][0],
+        "caption_variants": result["variants"],
+        "media_refs": result["media"]
+    }
 
 # 3. Build the Graph
-workflow = StateGraph(AgentState)
+def build_workflow() -> StateGraph:
+    workflow = StateGraph(AgentState)
+
+    # Add nodes
+    workflow.add_node("process_media", processing_node)
+    workflow.add_node("generate_caption", content_generation_node)
 
-# Add nodes
-workflow.add_node("process_media", processing_node)
-workflow.add_node("generate_caption", content_generation_node)
+    # Add edges
+    workflow.set_entry_point("process_media")
+    workflow.add_edge("process_media", "generate_caption")
+    workflow.add_edge("generate_caption", END)
+    return workflow
 
-# Add edges
-workflow.set_entry_point("process_media")
-workflow.add_edge("process_media", "generate_caption")
-workflow.add_edge("generate_caption", END)
+@lru_cache(maxsize=1)
+def get_agent_app():
+    """Compiles the graph once, on first use (or during warm-up) instead of at import."""
+    return build_workflow().compile()
 
-# Compile
-app = workflow.compile()
\ No newline at end of file
+def compile_durable_app(checkpointer):
+    """Same graph, checkpointed after every node so a restarted job resumes at the next one."""
+    return build_workflow().compile(checkpointer=checkpointer)
\ No newline at end of file
@@ -0,0 +1,143 @@
+import time
+import asyncio
+import hashlib
+from typing import Dict, Optional
+from google.genai import types
+
+# Explicit caches are billed per hour, keep them short and refresh while in use
+DEFAULT_TTL_SECONDS = 3600
+REFRESH_MARGIN_SECONDS = 300     # Extend the TTL when less than this is left
+FAILURE_BACKOFF_SECONDS = 600    # Don't hammer caches.create when it keeps failing
+
+# Explicit caches need a minimum prompt size (tokens); smaller prompts are sent uncached
+MIN_CACHE_TOKENS = {"gemini-2.5-pro": 4096}
+DEFAULT_MIN_CACHE_TOKENS = 1024
+
+
+def min_cache_tokens(model: str) -> int:
+    return next((tokens for prefix, tokens in MIN_CACHE_TOKENS.items() if model.startswith(prefix)),
+                DEFAULT_MIN_CACHE_TOKENS)
+
+
+def prompt_fingerprint(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class PromptCache:
+    """
+    Keeps one Gemini cached-content handle per prompt slot (e.g. "kooistra").
+    - Created lazily on first use.
+    - TTL is extended shortly before it expires.
+    - Deleted and recreated when the prompt text of a slot changes.
+    - Never created for prompts below the model's minimum cacheable size
+      (tokens counted once per prompt version).
+    get() returns None when caching is unavailable, callers then send the
+    prompt as a plain system instruction.
+    """
+
+    def __init__(self, client, model: str, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 refresh_margin: int = REFRESH_MARGIN_SECONDS, clock=time.monotonic):
+        self._client = client
+        self._model = model
+        self._ttl = ttl_seconds
+        self._margin = refresh_margin
+        self._clock = clock
+        self._lock = asyncio.Lock()
+        # slot -> {"fingerprint", "name", "expires_at"} (name None = creation failed)
+        self._entries: Dict[str, dict] = {}
+
+    async def get(self, slot: str, prompt: str) -> Optional[str]:
+        fingerprint = prompt_fingerprint(prompt)
+        async with self._lock:
+            entry = self._entries.get(slot)
+            now = self._clock()
+
+            if entry and entry["fingerprint"] != fingerprint:
+                print(f"Prompt for '{slot}' changed, invalidating cache")
+                await self._delete(entry)
+                entry = None
+
+            if entry and entry["name"] is None:
+                # Recent failure (or prompt too small to cache), stay uncached until the backoff passes
+                if now < entry["expires_at"]:
+                    return None
+                entry = None
+
+            if entry and now < entry["expires_at"] - self._margin:
+                return entry["name"]
+
+            if entry:
+                entry = await self._refresh(entry)
+            if not entry:
+                too_small = await self._too_small(slot, prompt)
+                if too_small is None:
+                    # Size unknown: stay uncached, count again after the backoff
+                    entry = {"fingerprint": fingerprint, "name": None, "expires_at": now + FAILURE_BACKOFF_SECONDS}
+                elif too_small:
+                    entry = {"fingerprint": fingerprint, "name": None, "expires_at": float("inf")}
+                else:
+                    entry = await self._create(slot, prompt, fingerprint)
+
+            self._entries[slot] = entry
+            return entry["name"]
+
+    async def invalidate(self, slot: str):
+        async with self._lock:
+            entry = self._entries.pop(slot, None)
+            if entry:
+                await self._delete(entry)
+
+    async def _too_small(self, slot: str, prompt: str) -> Optional[bool]:
+        """Whether the prompt is below the model's cache minimum, None if it could not be counted."""
+        minimum = min_cache_tokens(self._model)
+        try:
+            counted = await self._client.aio.models.count_tokens(model=self._model, contents=prompt)
+            total = getattr(counted, "total_tokens", None)
+        except Exception as e:
+            print(f"⚠️ Could not count prompt tokens for '{slot}': {e}")
+            return None
+        if not isinstance(total, int):
+            print(f"⚠️ No token count for '{slot}' ({counted!r}), sending it uncached")
+            return None
+        if total < minimum:
+            print(f"Prompt for '{slot}' is {total} tokens, below the {minimum} "
+                  "token cache minimum, sending it uncached")
+            return True
+        return False
+
+    async def _create(self, slot: str, prompt: str, fingerprint: str) -> dict:
+        try:
+            cache = await self._client.aio.caches.create(
+                model=self._model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"{slot}-{fingerprint}",
+                    system_instruction=prompt,
+                    ttl=f"{self._ttl}s",
+                ),
+            )
+            print(f"Gemini prompt cache created for '{slot}': {cache.name}")
+            return {"fingerprint": fingerprint, "name": cache.name, "expires_at": self._clock() + self._ttl}
+        except Exception as e:
+            # Most common cause: prompt is below the model's minimum cacheable size
+            print(f"⚠️ Could not create prompt cache for '{slot}': {e}")
+            return {"fingerprint": fingerprint, "name": None, "expires_at": self._clock() + FAILURE_BACKOFF_SECONDS}
+
+    async def _refresh(self, entry: dict) -> Optional[dict]:
+        try:
+            await self._client.aio.caches.update(
+                name=entry["name"],
+                config=types.UpdateCachedContentConfig(ttl=f"{self._ttl}s"),
+            )
+            return {**entry, "expires_at": self._clock() + self._ttl}
+        except Exception as e:
+            # Already expired or deleted server-side, caller recreates it
+            print(f"⚠️ Prompt cache refresh failed ({e}), recreating")
+            return None
+
+    async def _delete(self, entry: dict):
+        if not entry["name"]:
+            return
+        try:
+            await self._client.aio.caches.delete(name=entry["name"])
+        except Exception as e:
+            print(f"⚠️ Could not delete prompt cache {entry['name']}: {e}")
@@ -1,37 +1,85 @@
 import os
+import asyncio
 import shutil
 import uuid
+import time
 import mimetypes
+import secrets
+import importlib
+from contextlib import asynccontextmanager, AsyncExitStack
+from typing import Optional
 
 # 1. Load env
 from dotenv import load_dotenv
 load_dotenv()
 
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from twilio.twiml.messaging_response import MessagingResponse
-from twilio.rest import Client
 
 # Import Tools
-from src.agent.graph import app as agent_app
+# NOTE: LangGraph, Gemini, MoviePy and the Twilio REST SDK are imported lazily
+# (see src/warmup.py) so the server can start listening right away.
+from src.agent.errors import CaptionGenerationError
 from src.tools.downloader import download_image_from_url
-from src.tools.notifications import send_whatsapp_preview
-from src.tools.state_manager import save_draft, get_draft, update_draft_caption, clear_draft
+from src.tools.notifications import send_whatsapp_preview, get_twilio_client
+from src.tools.state_manager import save_draft, get_draft, update_draft_caption, clear_draft, set_draft_media, mark_post_when_ready, select_variant, confirm_duplicate_post
+from src.warmup import WARMUP_STATE, start_background_warmup
 
 # Import Video Tools
-from src.tools.video_ops import brand_video, extract_keyframes
+from src.tools.video_ops import prepare_video_for_reels
+from src.tools.job_runner import run_video_job, terminate_job, JOB_METRICS
+from src.tools.job_journal import JOB_DB_PATH, init_db, create_job, get_job, update_job, open_jobs
+from src.tools.job_tracker import JobSuperseded, supersede, finish as finish_tracked_job, job_scope, raise_if_superseded
+from src.tools.media_probe import is_video as is_video_file
+from src.tools.media_store import TEMP_DIR, public_media_url, share_media, ensure_local
+from src.tools.profiling import job_profile, profiled_to_thread, configure as configure_profiling, list_profiles, profile_file
+from src.tools.tenants import load_tenants, get_tenant, tenant_for_sender, tenant_scope, tenant_quota
+from src.tools.media_index import DEDUP_ENABLED, caption_reusable, check_duplicate, get_media_index
 
 # Import Official API
-from src.tools.official_api import post_to_facebook, post_to_instagram, post_reel_to_instagram, post_video_to_facebook, get_fb_picture_url
+from src.tools.official_api import upload_photo_with_source, post_to_instagram, post_reel_to_instagram, post_video_to_facebook
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with AsyncExitStack() as stack:
+        # An invalid TENANTS_FILE stops the server here, not at a shop's first post
+        load_tenants()
+        # Heavy imports happen in the background after the server is up
+        start_background_warmup()
+        # Job journal + recovery of jobs interrupted by a restart
+        journal_task = asyncio.create_task(open_job_journal(stack))
+        # One Gemini prompt cache per tenant, created before the first job needs it
+        prompts_task = asyncio.create_task(preload_tenant_prompts())
+        yield
+        journal_task.cancel()
+        prompts_task.cancel()
 
 # Initialize FastAPI
-app = FastAPI(title="Social Media AI Agent")
+app = FastAPI(title="Social Media AI Agent", lifespan=lifespan)
 
-# Define directories
-TEMP_DIR = "/tmp"
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
+def get_agent_app():
+    from src.agent.graph import get_agent_app as _get_agent_app
+    return _get_agent_app()
+
+async def preload_tenant_prompts():
+    try:
+        # Imported in a thread: the SDK import is the slow part of the warm-up
+        gemini_client = await asyncio.to_thread(importlib.import_module, "src.agent.gemini_client")
+        tenants, _ = load_tenants()
+        await gemini_client.preload_prompt_caches({tenant["prompt_slot"]: tenant["prompt"] for tenant in tenants.values()})
+    except Exception as e:
+        # Not fatal: caches are created lazily on first use
+        print(f"⚠️ Prompt cache preload failed: {e}")
+
+def resolve_tenant(tenant_id: Optional[str]):
+    """Tenant for an API request (default tenant when none is given)."""
+    try:
+        return get_tenant(tenant_id)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # --- MOUNT STATIC FILES ---
 app.mount("/static", StaticFiles(directory=TEMP_DIR), name="static")
@@ -49,35 +97,37 @@ def execute_post(media_path: str, caption: str, dry_run: bool = False):
     """
     Uploads to FB (Binary) -> Gets FB URL -> Uploads to IG.
     """
-    # 1. Define Public URL (Still useful for video or fallback)
-    base_url = os.environ.get("BASE_URL", "").rstrip("/")
-    filename = os.path.basename(media_path)
-    public_url = f"{base_url}/static/{filename}"
-    
-    is_video = media_path.lower().endswith(".mp4")
+    # 0. The draft may have been made on another instance
+    media_path = ensure_local(media_path)
+
+    is_video = is_video_file(media_path)
 
     print(f"STARTING UPLOAD ({'VIDEO' if is_video else 'IMAGE'})")
     print(f"File: {media_path}")
 
     if is_video:
         # Video Logic (Keep as is, or apply similar binary logic if needed)
+        # Meta fetches videos by URL; a dry run needs none (no S3 upload, no BASE_URL)
+        try:
+            public_url = media_path if dry_run else public_media_url(media_path)
+        except ValueError as e:
+            # Local store without BASE_URL: Meta has nowhere to fetch the video from
+            print(f"❌ No public URL for {media_path}: {e}")
+            return False
         fb_success = post_video_to_facebook(public_url, caption, dry_run=dry_run)
         ig_success = post_reel_to_instagram(public_url, caption, dry_run=dry_run)
     else:
         # --- IMAGE OPTIMIZED FLOW ---
         
-        # 1. Upload to Facebook (Using LOCAL FILE path for reliability)
-        fb_id = post_to_facebook(media_path, caption, dry_run=dry_run)
+        # 1+2. Upload to Facebook (LOCAL FILE for reliability) and get the Meta-hosted URL
+        #      (trusted by Instagram) in one batch request
+        fb_id, high_quality_url = upload_photo_with_source(media_path, caption, dry_run=dry_run)
         fb_success = bool(fb_id)
         
         ig_success = False
         if fb_success:
-            # 2. Get the Meta-hosted URL (Trusted by Instagram)
             if dry_run:
-                high_quality_url = public_url
-            else:
-                print("🔄 Fetching Facebook CDN URL for Instagram...")
-                high_quality_url = get_fb_picture_url(fb_id)
+                high_quality_url = media_path
 
             if high_quality_url:
                 # 3. Upload to Instagram using the Facebook URL
@@ -96,9 +146,7 @@ def execute_post(media_path: str, caption: str, dry_run: bool = False):
 # Helper: Send Reply
 def send_reply(to_number: str, body_text: str):
     try:
-        account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
-        auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
-        client = Client(account_sid, auth_token)
+        client = get_twilio_client()
         
         from_number = os.environ.get("WHATSAPP_NUMBER")
 
@@ -111,74 +159,421 @@ def send_reply(to_number: str, body_text: str):
     except Exception as e:
         print(f"Failed to send reply: {e}")
 
-# --- BACKGROUND TASK ---
-# Updated to accept mime_type and handle Video vs Image logic
-def process_incoming_media(media_url: str, mime_type: str, context_text: str, sender_number: str):
-    print(f"Background Processing Started for {sender_number} [{mime_type}]")
-    
+# Helper: Show the sender the caption that will be posted
+def send_caption_update(to_number: str, caption: str, heading: str):
+    msg_body = (
+        f"{heading}\n\n"
+        "Hier is de nieuwe versie:\n"
+        "------------------\n"
+        f"{caption}\n"
+        "------------------\n"
+        "Antwoord *POST* om te publiceren."
+    )
+    send_reply(to_number, msg_body)
+
+# Replies starting with this are instructions for Gemini ("AI: korter"), any other text replaces the caption
+REVISION_PREFIX = "AI:"
+
+def revision_instruction(text: str) -> Optional[str]:
+    """The instruction after REVISION_PREFIX (case-insensitive), None for a replacement caption."""
+    if text[:len(REVISION_PREFIX)].upper() != REVISION_PREFIX:
+        return None
+    return text[len(REVISION_PREFIX):].strip() or None
+
+# Helper: Rewrite the draft caption with Gemini, reusing the media it already has
+async def revise_draft(sender_number: str, draft: dict, instruction: str):
+    from src.agent.gemini_client import revise_caption
+
+    tenant = tenant_for_sender(sender_number)
     try:
-        # 1. Download Content
-        local_path = download_image_from_url(media_url)
-        
-        # 2. Check if Video or Image
-        is_video = "video" in mime_type or local_path.endswith(".mp4")
-        
-        agent_inputs = {
-            "context_text": context_text or "Maak een professionele post.",
-            "is_video": is_video
-        }
+        caption = await revise_caption(
+            draft["caption"], instruction, draft.get("media_refs") or [], draft.get("context_text", ""),
+            tenant["prompt"], prompt_slot=tenant["prompt_slot"]
+        )
+    except CaptionGenerationError as e:
+        print(f"Caption revision failed: {e}")
+        await asyncio.to_thread(send_reply, sender_number, "Aanpassen is mislukt. Stuur de volledige tekst om de beschrijving te vervangen.")
+        return
+
+    current = get_draft(sender_number)
+    if not current or current.get("job_id") != draft.get("job_id"):
+        print("Draft was posted, cancelled or replaced during the revision, discarding it")
+        return
+    update_draft_caption(sender_number, caption)
+    if current.get("job_id"):
+        update_job(current["job_id"], caption=caption)
+    await asyncio.to_thread(send_caption_update, sender_number, caption, "*Beschrijving aangepast!*")
+
+# Helper: Mark the job behind a draft as finished (posted or cancelled)
+def close_draft_job(draft: dict):
+    if draft.get("job_id"):
+        update_job(draft["job_id"], status="closed")
+
+def format_date(timestamp: float) -> str:
+    return time.strftime("%d-%m-%Y", time.localtime(timestamp))
+
+# Helper: Remember the posted caption (and date) for resends of the same media
+def record_published(draft: dict):
+    indexed_job = (draft.get("duplicate") or {}).get("job_id") or draft.get("job_id")
+    if DEDUP_ENABLED and indexed_job:
+        get_media_index().update(indexed_job, caption=draft["caption"], posted_at=time.time())
+
+# Helper: Publish a draft whose media is ready
+async def publish_draft(sender_number: str, draft: dict):
+    # Posts to the sender's shop pages
+    try:
+        with tenant_scope(tenant_for_sender(sender_number)):
+            success = await asyncio.to_thread(execute_post, draft["image_path"], draft["caption"])
+    except Exception as e:
+        # Runs as a background task: nobody else would tell the sender or record it
+        print(f"❌ Publishing failed: {e}")
+        if draft.get("job_id"):
+            update_job(draft["job_id"], status="failed", error=f"publish: {e}")
+        await asyncio.to_thread(send_reply, sender_number, "Publicatie mislukt. Controleer de logs.")
+        return
+
+    if success:
+        clear_draft(sender_number)
+        close_draft_job(draft)
+        await asyncio.to_thread(record_published, draft)
+        await asyncio.to_thread(send_reply, sender_number, "Gepubliceerd op social media.")
+    else:
+        if draft.get("job_id"):
+            update_job(draft["job_id"], status="failed", error="publish failed")
+        await asyncio.to_thread(send_reply, sender_number, "Publicatie mislukt. Controleer de logs.")
 
-        if is_video:
-            print("🎥 Video detected. Starting branding and frame extraction...")
-            # A. Brand the video (Heavy Task)
-            branded_video_path = brand_video(local_path)
-            
-            # B. Extract Keyframes (For the AI to see)
-            keyframes = extract_keyframes(branded_video_path, num_frames=5)
-            
-            # C. Prepare Inputs
-            agent_inputs["input_path"] = branded_video_path # The file to post
-            agent_inputs["analysis_frame_paths"] = keyframes # The files to look at
-            
-        else:
+# Helper: Attach the full-quality render to the draft once it is done
+async def attach_full_render(sender_number: str, job_id: str, render_task: asyncio.Task):
+    try:
+        branded_video_path = await render_task
+    except Exception as e:
+        # Killed because newer media from this sender replaced the job
+        raise_if_superseded("attaching the render")
+        draft = get_draft(sender_number)
+        if not draft or draft.get("job_id") != job_id:
+            # Killed because the sender cancelled the draft (VERWIJDER)
+            print(f"Draft for job {job_id} was cancelled, render stopped")
+            return
+        print(f"Full-quality render failed: {e}")
+        update_job(job_id, status="failed", error=str(e))
+        clear_draft(sender_number)
+        await asyncio.to_thread(send_reply, sender_number, "Het afwerken van de video is mislukt. Stuur de video opnieuw.")
+        return
+
+    raise_if_superseded("attaching the render")
+    await asyncio.to_thread(share_media, branded_video_path)
+    update_job(job_id, branded_path=branded_video_path, status="done")
+    if DEDUP_ENABLED:
+        await asyncio.to_thread(get_media_index().update, job_id, processed_path=branded_video_path)
+    await attach_media(sender_number, job_id, branded_video_path)
+
+async def attach_media(sender_number: str, job_id: str, media_path: str):
+    draft = set_draft_media(sender_number, job_id, media_path)
+    if draft is None:
+        print(f"Draft for job {job_id} was cancelled or replaced, discarding render")
+    elif draft["post_when_ready"]:
+        print("POST was already requested, publishing now")
+        await publish_draft(sender_number, draft)
+
+# --- DURABLE JOBS ---
+# Stage outputs are journalled: download + final render in the jobs table,
+# preview/keyframes/caption in the LangGraph checkpoint (thread = job id).
+MAX_RECOVERIES = 3
+_journal_ready = asyncio.Event()
+_durable = {}
+_recovered_tasks = set()  # Strong references, the event loop only keeps weak ones
+
+async def open_job_journal(stack: AsyncExitStack):
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    from src.agent.graph import compile_durable_app
+
+    try:
+        await asyncio.to_thread(init_db)
+        saver = await stack.enter_async_context(AsyncSqliteSaver.from_conn_string(JOB_DB_PATH))
+        _durable["app"] = compile_durable_app(saver)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"❌ Job journal could not be opened, WhatsApp jobs will be refused: {e}")
+        _durable["error"] = str(e)
+        return
+    finally:
+        # Also on failure, so waiting jobs are refused instead of hanging
+        _journal_ready.set()
+    await recover_jobs()
+
+async def get_durable_agent_app():
+    """Raises RuntimeError when the job journal failed to open."""
+    await _journal_ready.wait()
+    if "app" not in _durable:
+        raise RuntimeError(f"Job journal unavailable: {_durable.get('error')}")
+    return _durable["app"]
+
+def _paths_exist(values: dict) -> bool:
+    paths = [values.get("input_path"), values.get("processed_path"), values.get("preview_path")]
+    paths += values.get("analysis_frame_paths") or []
+    return all(os.path.exists(path) for path in paths if path)
+
+async def run_agent(job: dict, agent_inputs: dict) -> dict:
+    """Runs the graph for a job, reusing or resuming its checkpoint when there is one."""
+    agent = await get_durable_agent_app()
+    config = {"configurable": {"thread_id": f"{job['job_id']}:{job['attempt']}"}}
+    snapshot = await agent.aget_state(config)
+
+    if snapshot.values and _paths_exist(snapshot.values):
+        if not snapshot.next:
+            print("♻️ Agent already finished for this job, reusing its output")
+            return snapshot.values
+        print(f"♻️ Resuming agent at {list(snapshot.next)}")
+        return await agent.ainvoke(None, config)
+
+    if snapshot.values:
+        # Intermediate files are gone (e.g. /tmp was wiped): start a fresh thread
+        job["attempt"] += 1
+        update_job(job["job_id"], attempt=job["attempt"])
+        config = {"configurable": {"thread_id": f"{job['job_id']}:{job['attempt']}"}}
+
+    return await agent.ainvoke(agent_inputs, config)
+
+async def run_job(job_id: str, skip_dedup: bool = False):
+    """
+    Drives one job from wherever it stopped to a draft + preview (+ final render).
+    skip_dedup: the sender rejected a duplicate match (OPNIEUW), process from scratch.
+    """
+    job = get_job(job_id)
+    tenant = tenant_for_sender(job["sender"])
+    with job_scope(job_id), tenant_scope(tenant):
+        try:
+            # Per-tenant quota: a burst from one shop queues behind its own jobs only
+            async with tenant_quota(tenant, "jobs"):
+                await _run_job_stages(job, skip_dedup)
+        finally:
+            finish_tracked_job(job["sender"], job_id)
+
+async def render_video(tenant: dict, local_path: str, job_id: str) -> str:
+    """Full-quality branding in an isolated worker, within the tenant's video quota."""
+    async with tenant_quota(tenant, "video_jobs"):
+        raise_if_superseded("rendering")
+        render = asyncio.ensure_future(profiled_to_thread(run_video_job, "brand_video", local_path, job_id=job_id,
+                                                          assets_dir=tenant["assets_dir"]))
+        try:
+            return await asyncio.shield(render)
+        except asyncio.CancelledError:
+            # Cancelling only stops the wait: kill the worker, and keep the quota slot until it is gone
+            terminate_job(job_id)
+            await asyncio.gather(render, return_exceptions=True)
+            raise
+
+def abandon_render(job_id: str, render_task: Optional[asyncio.Task]):
+    """Stops a job's full-quality render: the waiting task and the isolated worker (with its ffmpeg)."""
+    if render_task:
+        render_task.cancel()
+    terminate_job(job_id)
+
+async def _run_job_stages(job: dict, skip_dedup: bool = False):
+    job_id = job["job_id"]
+    sender_number = job["sender"]
+    render_task = None
+    try:
+        # 1. Download Content (skipped if the download survived a restart)
+        local_path = job["local_path"]
+        if not local_path or not os.path.exists(local_path):
+            local_path = await profiled_to_thread(download_image_from_url, job["media_url"])
+            # 2. Check if Video or Image (probe the content, mime is only a hint)
+            is_video = await profiled_to_thread(is_video_file, local_path)
+            update_job(job_id, local_path=local_path, is_video=int(is_video), branded_path=None)
+            job.update(local_path=local_path, is_video=int(is_video), branded_path=None)
+        is_video = bool(job["is_video"])
+
+        branded_path = job["branded_path"] if job["branded_path"] and os.path.exists(job["branded_path"]) else None
+
+        # 2b. Sent before (recropped / recompressed)? Reuse the processed media and caption
+        tenant_id = tenant_for_sender(sender_number)["id"]
+        signature, duplicate = await profiled_to_thread(check_duplicate, local_path, is_video, tenant_id, job_id)
+        if skip_dedup:
+            duplicate = None
+        reuse_caption = False
+        if duplicate:
+            # The caption only fits if the sender described it the same way
+            earlier_job = get_job(duplicate["job_id"]) or {}
+            reuse_caption = caption_reusable(earlier_job.get("context_text"), job["context_text"])
+            print(f"♻️ Near-duplicate of job {duplicate['job_id']} ({duplicate['distance']} bits apart), "
+                  + ("reusing its media and caption" if reuse_caption else "different or no context, generating a new caption"))
+            if is_video:
+                branded_path = duplicate["processed_path"]
+                update_job(job_id, branded_path=branded_path)
+
+        raise_if_superseded("rendering")
+        if is_video and not branded_path:
+            print("🎥 Video detected. Sending a quick preview, full-quality branding continues in the background...")
+            # A. Brand the video (Heavy Task) - the sender does not wait for this
+            # Runs in an isolated worker (own scratch dir, memory/CPU ceilings, ffmpeg cleanup)
+            render_task = asyncio.create_task(render_video(tenant_for_sender(sender_number), local_path, job_id))
+        elif not is_video:
             print("🖼️ Image detected. Starting standard processing...")
-            # A. Prepare Inputs (Image branding happens inside the Graph)
-            agent_inputs["input_path"] = local_path
-            agent_inputs["analysis_frame_paths"] = None 
 
-        # 3. Run Agent (Gemini)
-        result = agent_app.invoke(agent_inputs)
+        # 3. Run Agent (preview proxy / keyframes / image processing + Gemini)
+        agent_inputs = {
+            "input_path": local_path,
+            "context_text": job["context_text"] or "Maak een professionele post.",
+            "is_video": is_video,
+            "analysis_frame_paths": None
+        }
+        if reuse_caption:
+            result = {
+                "generated_caption": duplicate["caption"],
+                "caption_variants": duplicate["variants"],
+                "processed_path": duplicate["processed_path"],
+                "preview_path": duplicate["preview_path"],
+                "media_refs": None,
+            }
+        else:
+            result = await run_agent(job, agent_inputs)
         
-        final_caption = result['generated_caption']
-        final_media_path = result['processed_path'] # Branded Image OR Branded Video
+        # A caption edited by the sender before a restart wins over the generated one
+        final_caption = job["caption"] or result['generated_caption']
+        if is_video:
+            final_media_path = branded_path # None until attach_full_render
+        else:
+            final_media_path = result['processed_path'] # Branded Image
+        preview_media_path = result.get('preview_path') or final_media_path
         
         print("\n --- AGENT FINISHED ---")
         print(f"GENERATED CAPTION (RAW): {final_caption}")
         
-        # 4. SAVE DRAFT
-        save_draft(sender_number, final_media_path, final_caption)
+        # Share the final media so any instance can publish the draft (no-op for the local store)
+        if final_media_path:
+            await asyncio.to_thread(share_media, final_media_path)
+
+        # 4. SAVE DRAFT (no await between the check and the save: only the newest job writes it)
+        raise_if_superseded("saving the draft")
+        previous_draft = get_draft(sender_number)
+        if previous_draft and previous_draft.get("job_id") not in (None, job_id):
+            close_draft_job(previous_draft)
+        variants = result.get("caption_variants") or [final_caption]
+        save_draft(sender_number, final_media_path, final_caption, job_id=job_id, variants=variants,
+                   media_refs=result.get("media_refs"), context_text=agent_inputs["context_text"],
+                   duplicate={"job_id": duplicate["job_id"], "posted_at": duplicate["posted_at"]} if duplicate else None)
+        update_job(job_id, caption=final_caption)
+        if signature and not duplicate:
+            # Video renders are added to the entry by attach_full_render
+            await asyncio.to_thread(get_media_index().add, tenant_id, *signature, job_id, processed_path=final_media_path,
+                                    preview_path=preview_media_path, caption=final_caption, variants=variants)
+        if job["post_requested"]:
+            mark_post_when_ready(sender_number)
         
         # 5. SEND PREVIEW
-        # Dutch text, No Emoji
-        preview_message = (
-            f"{final_caption}\n\n"
-            "------------------\n"
-            "Antwoord *POST* om te publiceren.\n"
-            "Antwoord *VERWIJDER* om te annuleren.\n"
-            "Antwoord met een andere omschrijving om deze te vervangen."
-        )
-        
-        send_whatsapp_preview(
-            to_number=sender_number,
-            image_path=final_media_path, 
-            caption=preview_message
-        )
+        if not job["preview_sent"]:
+            # Dutch text, No Emoji
+            duplicate_note = ""
+            if duplicate:
+                duplicate_note = (f"Deze media is al eerder verwerkt ({format_date(duplicate['created_at'])}), "
+                                  + ("de bestaande versie wordt hergebruikt.\n" if reuse_caption else
+                                     "met een nieuwe beschrijving.\n"))
+                if duplicate["posted_at"]:
+                    duplicate_note += f"Let op: deze is op {format_date(duplicate['posted_at'])} al gepubliceerd.\n"
+                duplicate_note += "Antwoord *OPNIEUW* als het andere media is, dan wordt deze opnieuw verwerkt.\n"
+            preview_message = (
+                f"{final_caption}\n\n"
+                "------------------\n"
+                + duplicate_note
+                + ("Dit is een voorbeeld in lage kwaliteit, de definitieve video wordt nog afgewerkt.\n" if is_video else "")
+                + "Antwoord *POST* om te publiceren.\n"
+                "Antwoord *VERWIJDER* om te annuleren.\n"
+                + (f"Antwoord {' of '.join(f'*{i}*' for i in range(2, len(variants) + 1))} voor een andere versie.\n"
+                   if len(variants) > 1 else "")
+                + "Antwoord met *AI:* en een instructie (bijv. *AI: korter*) om de tekst te laten aanpassen, "
+                "of met een andere omschrijving om deze te vervangen."
+            )
+            
+            await profiled_to_thread(
+                send_whatsapp_preview,
+                to_number=sender_number,
+                image_path=preview_media_path, 
+                caption=preview_message
+            )
+            update_job(job_id, preview_sent=1)
+
+        # 6. WAIT FOR FULL-QUALITY VIDEO
+        if render_task:
+            await attach_full_render(sender_number, job_id, render_task)
+        else:
+            update_job(job_id, status="done")
+            if job["post_requested"] and final_media_path:
+                await attach_media(sender_number, job_id, final_media_path)
+
+    except JobSuperseded as e:
+        # Newer media from this sender: stop quietly, the new job owns the draft
+        print(f"⏭️ {e}, stopping")
+        update_job(job_id, status="closed", error="superseded")
+        abandon_render(job_id, render_task)
+        draft = get_draft(sender_number)
+        if draft and draft.get("job_id") == job_id:
+            clear_draft(sender_number)
+
+    except CaptionGenerationError as e:
+        # No draft is saved, the sender just resends the media
+        print(f"Caption Generation Failed: {e}")
+        update_job(job_id, status="failed", error=str(e))
+        abandon_render(job_id, render_task)
+        await asyncio.to_thread(send_reply, sender_number, "Het schrijven van de beschrijving is mislukt. Stuur de media opnieuw.")
 
     except Exception as e:
         import traceback
         traceback.print_exc()
         print(f"Processing Failed: {e}")
-        send_reply(sender_number, "Er is iets fout gegaan bij het verwerken van de media.")
+        update_job(job_id, status="failed", error=str(e))
+        abandon_render(job_id, render_task)
+        await asyncio.to_thread(send_reply, sender_number, "Er is iets fout gegaan bij het verwerken van de media.")
+
+async def recover_jobs():
+    """
+    Startup pass: resumes jobs a restart interrupted and restores their drafts.
+    Only the newest open job per sender matters, older ones were already replaced.
+    """
+    latest = {}
+    for job in await asyncio.to_thread(open_jobs):
+        previous = latest.get(job["sender"])
+        if previous:
+            update_job(previous["job_id"], status="closed")
+        latest[job["sender"]] = job
+
+    for job in latest.values():
+        if job["recoveries"] >= MAX_RECOVERIES:
+            print(f"⚠️ Job {job['job_id']} keeps failing after restarts, giving up")
+            update_job(job["job_id"], status="failed", error="too many recoveries")
+            continue
+        print(f"♻️ Recovering job {job['job_id']} for {job['sender']} ({job['status']})")
+        if job["status"] == "running":
+            update_job(job["job_id"], recoveries=job["recoveries"] + 1)
+        supersede(job["sender"], job["job_id"])
+        task = asyncio.create_task(run_job(job["job_id"]))
+        _recovered_tasks.add(task)
+        task.add_done_callback(_recovered_tasks.discard)
+
+# --- BACKGROUND TASK ---
+# Runs on the event loop; blocking steps are pushed to worker threads
+async def process_incoming_media(media_url: str, mime_type: str, context_text: str, sender_number: str,
+                                 skip_dedup: bool = False):
+    print(f"Background Processing Started for {sender_number} [{mime_type}]")
+    # Newest media wins: registered before any await so arrival order decides
+    job_id = str(uuid.uuid4())
+    replaced = supersede(sender_number, job_id)
+    if replaced:
+        print(f"⏭️ Job {replaced} superseded by {job_id}")
+        terminate_job(replaced)  # Kills its encoder worker now, the job stops at its next stage
+    try:
+        await get_durable_agent_app()
+        await asyncio.to_thread(create_job, sender_number, media_url, mime_type, context_text, job_id)
+    except Exception as e:
+        # Journal unavailable or the row could not be written: run_job will never release this job
+        print(f"❌ Could not start job {job_id}: {e}")
+        finish_tracked_job(sender_number, job_id)
+        await asyncio.to_thread(send_reply, sender_number, "De server kan op dit moment geen media verwerken. Probeer het later opnieuw.")
+        return
+    # Profiled only when switched on via /admin/profiling (or PROFILE_JOBS)
+    async with job_profile(job_id, sender=sender_number):
+        await run_job(job_id, skip_dedup)
 
 # --- ROUTES ---
 
@@ -186,12 +581,65 @@ def process_incoming_media(media_url: str, mime_type: str, context_text: str, se
 def health_check():
     return {"status": "online", "service": "Social Agent v1"}
 
+@app.get("/ready")
+def readiness_check():
+    """503 until the background warm-up has loaded the heavy modules."""
+    status_code = 200 if WARMUP_STATE["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=WARMUP_STATE)
+
+@app.get("/metrics/video-jobs")
+def video_job_metrics():
+    """Duration, peak RSS and CPU time of the most recent video jobs."""
+    return {"jobs": list(JOB_METRICS)}
+
+# --- ADMIN (profiling) ---
+# Disabled unless ADMIN_TOKEN is set; send it as the X-Admin-Token header
+
+def is_admin(request: Request) -> bool:
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    supplied = request.headers.get("X-Admin-Token", "")
+    # Bytes: compare_digest raises TypeError on non-ASCII str (a 500 instead of a 401)
+    return bool(admin_token) and secrets.compare_digest(supplied.encode(), admin_token.encode())
+
+def require_admin(request: Request):
+    if not is_admin(request):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+class ProfilingSettings(BaseModel):
+    enabled: bool
+    senders: list[str] = []         # Limit to these WhatsApp senders
+    max_jobs: Optional[int] = None  # Switch off again after this many jobs
+
+@app.post("/admin/profiling")
+def set_profiling(settings: ProfilingSettings, request: Request):
+    """Switches job profiling on/off for the next WhatsApp jobs."""
+    require_admin(request)
+    return configure_profiling(settings.enabled, settings.senders, settings.max_jobs)
+
+@app.get("/admin/profiles")
+def get_profiles(request: Request):
+    require_admin(request)
+    return {"profiles": list_profiles()}
+
+@app.get("/admin/profiles/{job_id}/{name}")
+def download_profile(job_id: str, name: str, request: Request):
+    """One artefact: summary.json, <stage>.prof (pstats/snakeviz), <stage>.txt, job.html, memory.txt."""
+    require_admin(request)
+    path = profile_file(job_id, name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=f"{job_id}_{name}")
+
 @app.post("/process-upload", response_model=SocialResponse)
 async def process_media(
+    request: Request,
     image: UploadFile = File(...),
     context: str = Form(...),
-    platform: str = Form("Instagram")
+    platform: str = Form("Instagram"),
+    profile: bool = Form(False),    # Admins only: profile this request
+    tenant: Optional[str] = Form(None)  # Tenant id from TENANTS_FILE (prompt + branding)
 ):
+    shop = resolve_tenant(tenant)
     try:
         file_extension = image.filename.split(".")[-1]
         input_filename = f"input_{uuid.uuid4()}.{file_extension}"
@@ -207,13 +655,18 @@ async def process_media(
             "analysis_frame_paths": None
         }
         print(f"Agent triggered for: {input_filename}")
-        result = agent_app.invoke(agent_inputs)
+        with tenant_scope(shop):
+            async with job_profile(f"upload_{uuid.uuid4().hex[:12]}", force=profile and is_admin(request)):
+                result = await get_agent_app().ainvoke(agent_inputs)
         
         return {
             "status": "success",
             "caption": result["generated_caption"],
             "platform": platform
         }
+    except CaptionGenerationError as e:
+        print(f"Caption Error: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         print(f"Server Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -252,33 +705,61 @@ async def handle_whatsapp(request: Request, background_tasks: BackgroundTasks):
     
     command = incoming_msg.upper()
 
+    duplicate = current_draft.get("duplicate")
     if command == "POST":
-        success = execute_post(current_draft["image_path"], current_draft["caption"])
-        
-        if success:
-            clear_draft(sender_number)
-            send_reply(sender_number, "Gepubliceerd op social media.")
+        if duplicate and duplicate["posted_at"] and not current_draft["duplicate_confirmed"]:
+            # Same media was already published: make the sender confirm
+            confirm_duplicate_post(sender_number)
+            send_reply(sender_number, f"Let op: deze media is op {format_date(duplicate['posted_at'])} al gepubliceerd. "
+                                      "Antwoord nogmaals *POST* om toch te publiceren.")
+        elif current_draft["image_path"] is None:
+            # Full-quality video still rendering, attach_full_render publishes it
+            mark_post_when_ready(sender_number)
+            update_job(current_draft["job_id"], post_requested=1)
+            send_reply(sender_number, "De video wordt nog afgewerkt en wordt automatisch gepubliceerd zodra hij klaar is.")
         else:
-            send_reply(sender_number, "Publicatie mislukt. Controleer de logs.")
+            # Graph uploads + container polling take far longer than Twilio's 15 s webhook timeout
+            send_reply(sender_number, "Bezig met publiceren, een moment geduld...")
+            background_tasks.add_task(publish_draft, sender_number, current_draft)
         
     elif command == "VERWIJDER" or command == "CANCEL":
         clear_draft(sender_number)
+        close_draft_job(current_draft)
+        if current_draft["image_path"] is None and current_draft.get("job_id"):
+            # Full-quality render still running: nobody needs it anymore
+            terminate_job(current_draft["job_id"])
         send_reply(sender_number, "Concept verwijderd.")
         
+    elif command == "OPNIEUW" and duplicate:
+        # Duplicate check was wrong (or the sender wants fresh processing): run the media through again
+        job = get_job(current_draft["job_id"])
+        send_reply(sender_number, "De media wordt opnieuw verwerkt, een moment geduld...")
+        background_tasks.add_task(process_incoming_media, job["media_url"], job["mime_type"], job["context_text"] or "",
+                                  sender_number, skip_dedup=True)
+
+    elif command.isdigit():
+        # Pre-generated alternative, no Gemini call
+        caption = select_variant(sender_number, int(command))
+        if caption is None:
+            send_reply(sender_number, f"Er zijn {len(current_draft['variants'])} versies, kies een nummer daartussen.")
+        else:
+            if current_draft.get("job_id"):
+                update_job(current_draft["job_id"], caption=caption)
+            send_caption_update(sender_number, caption, f"*Versie {command} gekozen!*")
+
+    elif revision_instruction(incoming_msg):
+        # "AI: korter": let Gemini rewrite the current caption
+        send_reply(sender_number, "Beschrijving wordt aangepast, een moment geduld...")
+        background_tasks.add_task(revise_draft, sender_number, current_draft, revision_instruction(incoming_msg))
+
     else:
         # Edit Caption
         update_draft_caption(sender_number, incoming_msg)
+        if current_draft.get("job_id"):
+            update_job(current_draft["job_id"], caption=incoming_msg)
         
         updated_draft = get_draft(sender_number)
-        msg_body = (
-            "*Beschrijving aangepast!*\n\n"
-            "Hier is de nieuwe versie:\n"
-            "------------------\n"
-            f"{updated_draft['caption']}\n"
-            "------------------\n"
-            "Antwoord *POST* om te publiceren."
-        )
-        send_reply(sender_number, msg_body)
+        send_caption_update(sender_number, updated_draft["caption"], "*Beschrijving aangepast!*")
 
     return str(resp)
 
@@ -286,12 +767,14 @@ async def handle_whatsapp(request: Request, background_tasks: BackgroundTasks):
 async def manual_post_endpoint(
     file: UploadFile = File(...),
     caption: str = Form(...),
-    dry_run: bool = Form(False)
+    dry_run: bool = Form(False),
+    tenant: Optional[str] = Form(None)  # Tenant id from TENANTS_FILE (whose pages to post to)
 ):
     """
     Directly posts an image/video and caption to Facebook & Instagram.
     Bypasses AI generation and WhatsApp.
     """
+    shop = resolve_tenant(tenant)
     try:
         # 1. Save the uploaded file
         file_extension = file.filename.split(".")[-1]
@@ -303,9 +786,15 @@ async def manual_post_endpoint(
             
         print(f"📂 Manual upload received: {input_filename}")
 
+        # Videos that already meet the Reels spec are posted as-is
+        # (ffprobe/ffmpeg and the Meta calls run in worker threads, WhatsApp jobs share this loop)
+        if await asyncio.to_thread(is_video_file, input_path):
+            input_path = await asyncio.to_thread(prepare_video_for_reels, input_path)
+
         # 2. Execute the post
         # execute_post handles the public URL construction and API calls
-        success = execute_post(input_path, caption, dry_run=dry_run)
+        with tenant_scope(shop):
+            success = await asyncio.to_thread(execute_post, input_path, caption, dry_run=dry_run)
 
         if success:
             return {"status": "success", "message": "Posted successfully!", "file": input_filename}
@@ -0,0 +1,268 @@
+"""
+Bulk ingestion for weekly stock drops.
+
+Takes a directory of product photos or a manifest and, per item:
+  1. processes the image locally (process_image, in a process pool),
+  2. generates a caption with Gemini (concurrent, bounded by GEMINI_MAX_CONCURRENCY)
+     unless the manifest already has one,
+  3. submits it to /manual-post (see post.py), waiting for its schedule if set.
+
+Progress is saved after every step, so rerunning the same command resumes.
+
+Usage:
+    python -m src.tools.bulk_post photos/ --context "Nieuwe partij gereedschap"
+    python -m src.tools.bulk_post drop.csv --dry-run
+    python -m src.tools.bulk_post drop.csv --tenant audiocom   # Prompt + pages of a TENANTS_FILE shop
+
+Manifest (.csv with a header row, .json list or .jsonl), columns/keys:
+    file      path to the image (relative to the manifest)
+    caption   optional, used verbatim
+    context   optional, extra context for Gemini
+    schedule  optional ISO datetime, e.g. 2026-10-20T09:00
+"""
+import os
+import csv
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Load .env before the tools read MEDIA_DIR / JPEG_*_BUDGET_KB at import time
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.tools.post import API_URL, upload_post
+from src.tools.image_ops import process_image
+from src.tools.tenants import get_tenant
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+DEFAULT_CONTEXT = "Maak een professionele post."
+
+
+# --- LOADING ---
+
+def load_items(source: str, default_context: str) -> list[dict]:
+    """Reads a directory or manifest into a list of {file, caption, context, schedule}."""
+    if os.path.isdir(source):
+        files = sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+        )
+        rows = [{"file": path} for path in files]
+        base_dir = source
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding="utf-8") as f:
+            if source.endswith(".csv"):
+                rows = list(csv.DictReader(f))
+            elif source.endswith(".jsonl"):
+                rows = [json.loads(line) for line in f if line.strip()]
+            else:
+                rows = json.load(f)
+
+    items = []
+    for row in rows:
+        path = row["file"]
+        if not os.path.isabs(path):
+            path = os.path.join(base_dir, path)
+        items.append({
+            "file": os.path.abspath(path),
+            "caption": (row.get("caption") or "").strip() or None,
+            "context": (row.get("context") or "").strip() or default_context,
+            "schedule": (row.get("schedule") or "").strip() or None,
+        })
+    return items
+
+
+def state_path_for(source: str) -> str:
+    if os.path.isdir(source):
+        return os.path.join(source, ".bulk_post_state.json")
+    return f"{source}.state.json"
+
+
+class BulkState:
+    """Per-file progress on disk: processed_path, caption, posted_at."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.items = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.items = json.load(f)
+            print(f"♻️ Resuming from {path}")
+
+    def get(self, file: str) -> dict:
+        return self.items.setdefault(file, {})
+
+    def save(self):
+        # Write + rename so an interrupt never leaves a half-written state file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.items, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+# --- STAGES ---
+
+def stage_process(items: list[dict], state: BulkState, workers: int) -> float:
+    todo = [
+        item for item in items
+        if not os.path.exists(state.get(item["file"]).get("processed_path") or "")
+    ]
+    print(f"\n🖼️ Processing {len(todo)} images ({len(items) - len(todo)} already done) on {workers} workers")
+    start = time.perf_counter()
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_image, item["file"]): item for item in todo}
+            for i, future in enumerate(as_completed(futures), 1):
+                item = futures[future]
+                name = os.path.basename(item["file"])
+                try:
+                    state.get(item["file"])["processed_path"] = future.result()
+                    state.save()
+                    print(f"   [{i}/{len(todo)}] {name}")
+                except Exception as e:
+                    print(f"   [{i}/{len(todo)}] ❌ {name}: {e}")
+    return time.perf_counter() - start
+
+
+async def stage_captions(items: list[dict], state: BulkState, tenant: dict) -> float:
+    todo = [
+        item for item in items
+        if not item["caption"] and not state.get(item["file"]).get("caption")
+        and state.get(item["file"]).get("processed_path")
+    ]
+    print(f"\n✍️ Generating {len(todo)} captions")
+    start = time.perf_counter()
+    if not todo:
+        return 0.0
+
+    # Imported here so runs that need no captions skip the Gemini SDK
+    from src.agent.gemini_client import generate_social_post, CaptionGenerationError
+    done = 0
+
+    async def caption_one(item):
+        nonlocal done
+        entry = state.get(item["file"])
+        try:
+            entry["caption"] = await generate_social_post(
+                media_paths=entry["processed_path"],
+                context_text=item["context"],
+                prompt_template=tenant["prompt"],
+                prompt_slot=tenant["prompt_slot"],
+            )
+            state.save()
+        except CaptionGenerationError as e:
+            print(f"   ❌ {os.path.basename(item['file'])}: {e}")
+        done += 1
+        print(f"   [{done}/{len(todo)}] {os.path.basename(item['file'])}")
+
+    # Concurrency is bounded by the Gemini client's own limiter
+    await asyncio.gather(*[caption_one(item) for item in todo])
+    return time.perf_counter() - start
+
+
+def parse_schedule(value: str) -> datetime:
+    """ISO datetime; without a UTC offset it is local time. Always timezone-aware."""
+    when = datetime.fromisoformat(value)
+    return when if when.tzinfo else when.astimezone()
+
+
+def stage_submit(items: list[dict], state: BulkState, api_url: str, dry_run: bool,
+                 tenant_id: str = None) -> tuple[float, int]:
+    todo = []
+    schedules = {}
+    for item in items:
+        if state.get(item["file"]).get("posted_at"):
+            continue
+        if item["schedule"]:
+            try:
+                schedules[item["file"]] = parse_schedule(item["schedule"])
+            except ValueError:
+                print(f"   ⚠️ {os.path.basename(item['file'])}: invalid schedule {item['schedule']!r}, skipped")
+                continue
+        todo.append(item)
+    unscheduled = datetime.min.replace(tzinfo=timezone.utc)
+    todo.sort(key=lambda item: schedules.get(item["file"], unscheduled))
+    already_posted = sum(1 for item in items if state.get(item["file"]).get("posted_at"))
+    print(f"\n🚀 Submitting {len(todo)} posts ({already_posted} already posted)")
+    start = time.perf_counter()
+    posted = 0
+
+    for i, item in enumerate(todo, 1):
+        entry = state.get(item["file"])
+        caption = item["caption"] or entry.get("caption")
+        name = os.path.basename(item["file"])
+        if not caption or not entry.get("processed_path"):
+            print(f"   [{i}/{len(todo)}] ⚠️ {name}: not processed or no caption, skipped (rerun to retry)")
+            continue
+
+        if item["file"] in schedules:
+            wait = (schedules[item["file"]] - datetime.now(timezone.utc)).total_seconds()
+            if wait > 0:
+                print(f"   ⏳ {name} scheduled for {item['schedule']}, waiting {wait / 60:.0f} min")
+                time.sleep(wait)
+
+        try:
+            response = upload_post(entry["processed_path"], caption, dry_run=dry_run, api_url=api_url,
+                                   tenant=tenant_id)
+            if response.status_code == 200:
+                entry["posted_at"] = datetime.now().isoformat(timespec="seconds")
+                state.save()
+                posted += 1
+                print(f"   [{i}/{len(todo)}] ✅ {name}")
+            else:
+                print(f"   [{i}/{len(todo)}] ❌ {name} (Status {response.status_code}): {response.text}")
+        except Exception as e:
+            print(f"   [{i}/{len(todo)}] ❌ {name}: {e}")
+
+    return time.perf_counter() - start, posted
+
+
+def _rate(count: int, seconds: float) -> str:
+    return f"{count / seconds:.2f}/s" if seconds > 0 and count else "-"
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory of images or a .csv/.json/.jsonl manifest")
+    parser.add_argument("--context", default=DEFAULT_CONTEXT, help="Default Gemini context for items without one")
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Image processing processes")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--state", help="Progress file (default: next to the source)")
+    parser.add_argument("--tenant", help="Tenant id from TENANTS_FILE (default: the default tenant)")
+    args = parser.parse_args()
+
+    try:
+        tenant = get_tenant(args.tenant)
+    except (KeyError, ValueError) as e:
+        parser.error(str(e))
+
+    items = load_items(args.source, args.context)
+    if not items:
+        print(f"❌ No images found in {args.source}")
+        return
+
+    state = BulkState(args.state or state_path_for(args.source))
+    print(f"📦 {len(items)} items for {tenant['name']} from {args.source} -> {args.api_url}"
+          f"{' (DRY RUN)' if args.dry_run else ''}")
+
+    total_start = time.perf_counter()
+    process_s = stage_process(items, state, args.workers)
+    caption_s = asyncio.run(stage_captions(items, state, tenant))
+    submit_s, posted = stage_submit(items, state, args.api_url, args.dry_run, args.tenant)
+    total_s = time.perf_counter() - total_start
+
+    print("\n📊 Summary")
+    print(f"   processing: {process_s:7.1f}s  ({_rate(len(items), process_s)})")
+    print(f"   captions:   {caption_s:7.1f}s")
+    print(f"   submitting: {submit_s:7.1f}s  ({_rate(posted, submit_s)})")
+    print(f"   total:      {total_s:7.1f}s  posted {posted}, "
+          f"{sum(1 for item in items if state.get(item['file']).get('posted_at'))}/{len(items)} done overall")
+
+
+if __name__ == "__main__":
+    run()
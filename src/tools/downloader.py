@@ -3,11 +3,7 @@ import requests
 import uuid
 import mimetypes
 from requests.auth import HTTPBasicAuth
-
-# Ensure /tmp exists
-TEMP_DIR = "/tmp"
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
+from src.tools.media_store import TEMP_DIR
 
 def download_image_from_url(url: str) -> str:
     """
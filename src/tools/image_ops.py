@@ -1,18 +1,16 @@
 import os
 import uuid
-from PIL import Image, ImageFilter
+import math
+from typing import Optional, List, Tuple
+from PIL import Image, ImageFilter, ImageDraw, ImageFont
 
-# Ensure /tmp exists
-TEMP_DIR = "/tmp"
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
+from src.tools.jpeg_encoder import save_jpeg, PUBLISH_BUDGET_BYTES, PREVIEW_BUDGET_BYTES
+from src.tools.media_store import TEMP_DIR
+from src.tools.tenants import load_brand_assets  # Per-tenant overlays (assets_dir=None: default)
 
-# --- HARDCODED PATHS ---
-PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
-ASSETS_DIR = os.path.join(PROJECT_ROOT, "src/assets")
-
-WATERMARK_PATH = os.path.join(ASSETS_DIR, "watermark.png")
-BOTTOM_FLAIR_PATH = os.path.join(ASSETS_DIR, "bottom.png")
+# Contact sheet (video analysis): tile size and byte budget of the single mosaic sent to Gemini
+CONTACT_SHEET_TILE = int(os.environ.get("CONTACT_SHEET_TILE", "384"))  # Long side of each frame (px)
+CONTACT_SHEET_BUDGET_BYTES = int(os.environ.get("CONTACT_SHEET_BUDGET_KB", "400")) * 1024
 
 
 def process_image(image_path: str, max_width: int = 1080) -> str:
@@ -29,62 +27,75 @@ def process_image(image_path: str, max_width: int = 1080) -> str:
                 new_height = int(float(img.height) * ratio)
                 img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
             
-            # 2. SAVE to temp first (so we have a file to work with)
-            filename = f"resized_{uuid.uuid4()}.jpg"
-            temp_path = os.path.join(TEMP_DIR, filename)
-            img.save(temp_path, "JPEG", quality=95)
+            # 2. ENFORCE ASPECT RATIO (Smart Padding), in memory so we only encode once
+            padded = pad_to_instagram_ratio(img)
+            if padded is not None:
+                img = padded
 
-            # 3. ENFORCE ASPECT RATIO (Smart Padding)
-            final_path = validate_and_pad_image(temp_path)
+            # 3. SAVE within the publish byte budget
+            filename = f"resized_{uuid.uuid4()}.jpg"
+            final_path = os.path.join(TEMP_DIR, filename)
+            save_jpeg(img, final_path, PUBLISH_BUDGET_BYTES)
             return final_path
             
     except Exception as e:
         print(f"❌ Error processing image: {e}")
         raise
 
-def validate_and_pad_image(image_path: str) -> str:
+def pad_to_instagram_ratio(img: Image.Image) -> Optional[Image.Image]:
     """
     Checks if image fits Instagram ratios (4:5 to 1.91:1).
-    If not, pads it with a blurred background to fit 4:5 (vertical) or 1.91:1 (horizontal).
+    If not, returns a copy padded with a blurred background to fit 4:5 (vertical)
+    or 1.91:1 (horizontal). Returns None when the image already fits.
+    """
+    w, h = img.size
+    aspect_ratio = w / h
+    
+    # Instagram limits
+    MIN_RATIO = 0.8  # 4:5 (Tallest allowed)
+    MAX_RATIO = 1.91 # Landscape
+    
+    # If it fits, nothing to do
+    if MIN_RATIO <= aspect_ratio <= MAX_RATIO:
+        return None
+    
+    print(f"⚠️ Image ratio {aspect_ratio:.2f} invalid. Applying smart padding...")
+    
+    # Calculate new canvas size
+    if aspect_ratio < MIN_RATIO:
+        # Too Tall (e.g. 9:16) -> Make it 4:5
+        new_h = h
+        new_w = int(h * MIN_RATIO)
+    else:
+        # Too Wide -> Make it 1.91:1
+        new_w = w
+        new_h = int(w / MAX_RATIO)
+        
+    # Create Blur Background
+    background = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    background = background.filter(ImageFilter.GaussianBlur(radius=50))
+    
+    # Center original image on background
+    bg_w, bg_h = background.size
+    offset = ((bg_w - w) // 2, (bg_h - h) // 2)
+    background.paste(img, offset)
+    return background
+
+def validate_and_pad_image(image_path: str) -> str:
+    """
+    File-based wrapper around pad_to_instagram_ratio.
+    Returns the original path if it already fits, otherwise a new padded JPEG.
     """
     try:
         with Image.open(image_path) as img:
-            w, h = img.size
-            aspect_ratio = w / h
-            
-            # Instagram limits
-            MIN_RATIO = 0.8  # 4:5 (Tallest allowed)
-            MAX_RATIO = 1.91 # Landscape
-            
-            # If it fits, return original
-            if MIN_RATIO <= aspect_ratio <= MAX_RATIO:
+            background = pad_to_instagram_ratio(img.convert("RGB"))
+            if background is None:
                 return image_path
             
-            print(f"⚠️ Image ratio {aspect_ratio:.2f} invalid. Applying smart padding...")
-            
-            # Calculate new canvas size
-            if aspect_ratio < MIN_RATIO:
-                # Too Tall (e.g. 9:16) -> Make it 4:5
-                new_h = h
-                new_w = int(h * MIN_RATIO)
-            else:
-                # Too Wide -> Make it 1.91:1
-                new_w = w
-                new_h = int(w / MAX_RATIO)
-                
-            # Create Blur Background
-            background = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-            background = background.filter(ImageFilter.GaussianBlur(radius=50))
-            
-            # Center original image on background
-            bg_w, bg_h = background.size
-            offset = ((bg_w - w) // 2, (bg_h - h) // 2)
-            background.paste(img, offset)
-            
             # Save
             output_filename = f"padded_{uuid.uuid4()}.jpg"
             output_path = os.path.join(TEMP_DIR, output_filename)
-            background.save(output_path, "JPEG", quality=95)
+            save_jpeg(background, output_path, PUBLISH_BUDGET_BYTES)
             
             return output_path
 
@@ -92,17 +103,18 @@ def validate_and_pad_image(image_path: str) -> str:
         print(f"❌ Padding Error: {e}")
         return image_path
     
-def apply_branding(base_image_path: str) -> str:
+def apply_branding(base_image_path: str, assets_dir: Optional[str] = None) -> str:
     """
-    Applies the bottom flair and top-right logo.
+    Applies the tenant's bottom flair and top-right logo.
     """
     try:
         base_img = Image.open(base_image_path).convert("RGB")
         base_w, base_h = base_img.size
+        assets = load_brand_assets(assets_dir)
         
         # 1. Apply Bottom Flair
-        if os.path.exists(BOTTOM_FLAIR_PATH):
-            flair = Image.open(BOTTOM_FLAIR_PATH).convert("RGBA")
+        if assets["flair"] is not None:
+            flair = assets["flair"]
             # Resize to match width
             flair_aspect = flair.height / flair.width
             new_flair_h = int(base_w * flair_aspect)
@@ -111,8 +123,8 @@ def apply_branding(base_image_path: str) -> str:
             base_img.paste(flair, (0, base_h - new_flair_h), flair)
 
         # 2. Apply Logo
-        if os.path.exists(WATERMARK_PATH):
-            logo = Image.open(WATERMARK_PATH).convert("RGBA")
+        if assets["watermark"] is not None:
+            logo = assets["watermark"]
             # Resize to 15% width
             target_w = int(base_w * 0.15)
             logo_aspect = logo.height / logo.width
@@ -124,10 +136,55 @@ def apply_branding(base_image_path: str) -> str:
         # 3. Save
         filename = f"branded_{uuid.uuid4()}.jpg"
         output_path = os.path.join(TEMP_DIR, filename)
-        base_img.save(output_path, "JPEG", quality=95)
+        save_jpeg(base_img, output_path, PUBLISH_BUDGET_BYTES)
         
         return output_path
 
     except Exception as e:
         print(f"❌ Branding Error: {e}")
-        raise
\ No newline at end of file
+        raise
+
+def make_preview_image(image_path: str) -> str:
+    """Smaller copy of a processed image for the WhatsApp preview (preview byte budget)."""
+    with Image.open(image_path) as img:
+        output_path = os.path.join(TEMP_DIR, f"preview_{uuid.uuid4()}.jpg")
+        save_jpeg(img.convert("RGB"), output_path, PREVIEW_BUDGET_BYTES)
+        return output_path
+
+def build_contact_sheet(frames: List[Tuple[float, Image.Image]]) -> str:
+    """
+    Tiles (timestamp, frame) pairs into one labelled grid image, in time order.
+    Each frame is downscaled to CONTACT_SHEET_TILE and stamped with its time (mm:ss.s).
+    """
+    if not frames:
+        raise ValueError("No frames for contact sheet")
+
+    tiles = []
+    for t, frame in frames:
+        tile = frame.convert("RGB")
+        tile.thumbnail((CONTACT_SHEET_TILE, CONTACT_SHEET_TILE), Image.Resampling.LANCZOS)
+        tiles.append((t, tile))
+
+    tile_w = max(tile.width for _, tile in tiles)
+    tile_h = max(tile.height for _, tile in tiles)
+    cols = math.ceil(math.sqrt(len(tiles)))
+    rows = math.ceil(len(tiles) / cols)
+    gap = 4
+
+    sheet = Image.new("RGB", (cols * tile_w + (cols - 1) * gap, rows * tile_h + (rows - 1) * gap), "black")
+    draw = ImageDraw.Draw(sheet)
+    font = ImageFont.load_default(size=max(14, tile_h // 16))
+
+    for i, (t, tile) in enumerate(tiles):
+        x = (i % cols) * (tile_w + gap) + (tile_w - tile.width) // 2
+        y = (i // cols) * (tile_h + gap) + (tile_h - tile.height) // 2
+        sheet.paste(tile, (x, y))
+
+        label = f"#{i + 1}  {int(t // 60):02d}:{t % 60:04.1f}"
+        left, top, right, bottom = draw.textbbox((x + 6, y + 6), label, font=font)
+        draw.rectangle((left - 4, top - 3, right + 4, bottom + 3), fill="black")
+        draw.text((x + 6, y + 6), label, fill="white", font=font)
+
+    output_path = os.path.join(TEMP_DIR, f"contact_sheet_{uuid.uuid4()}.jpg")
+    save_jpeg(sheet, output_path, CONTACT_SHEET_BUDGET_BYTES)
+    return output_path
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+from typing import Optional, List
+
+from src.tools.media_store import is_public_path
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+
+# Shared with the LangGraph checkpointer (separate tables, same file).
+# Point this at a persistent disk to survive redeploys. Never inside MEDIA_DIR:
+# that is served publicly under /static.
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(PROJECT_ROOT, "data", "social_agent_jobs.sqlite"))
+
+# Job lifecycle:
+#   running   -> pipeline in progress (download / graph / preview / render)
+#   done      -> preview sent and final media attached, draft waiting for POST
+#   closed    -> draft posted or cancelled, or job superseded by newer media
+#   failed    -> gave up, sender was told
+OPEN_STATUSES = ("running", "done")
+
+_COLUMNS = [
+    "job_id", "sender", "media_url", "mime_type", "context_text", "status",
+    "local_path", "is_video", "branded_path", "preview_sent", "post_requested",
+    "caption", "attempt", "recoveries", "error", "created_at", "updated_at",
+]
+
+
+@contextmanager
+def _connect():
+    """Short-lived connection per call: commits on success, always closes."""
+    conn = sqlite3.connect(JOB_DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def init_db():
+    if is_public_path(JOB_DB_PATH):
+        raise ValueError(f"JOB_DB_PATH {JOB_DB_PATH} is inside MEDIA_DIR, which is served under /static")
+    os.makedirs(os.path.dirname(os.path.abspath(JOB_DB_PATH)), exist_ok=True)
+    with _connect() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                sender TEXT NOT NULL,
+                media_url TEXT NOT NULL,
+                mime_type TEXT,
+                context_text TEXT,
+                status TEXT NOT NULL DEFAULT 'running',
+                local_path TEXT,
+                is_video INTEGER,
+                branded_path TEXT,
+                preview_sent INTEGER NOT NULL DEFAULT 0,
+                post_requested INTEGER NOT NULL DEFAULT 0,
+                caption TEXT,
+                attempt INTEGER NOT NULL DEFAULT 0,
+                recoveries INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+
+def create_job(sender: str, media_url: str, mime_type: str, context_text: str, job_id: Optional[str] = None) -> str:
+    job_id = job_id or str(uuid.uuid4())
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (job_id, sender, media_url, mime_type, context_text, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, sender, media_url, mime_type, context_text, now, now),
+        )
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def update_job(job_id: str, **fields):
+    """Records stage outputs / status, e.g. update_job(id, branded_path=path)."""
+    unknown = set(fields) - set(_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown job fields: {unknown}")
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with _connect() as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+
+def open_jobs() -> List[dict]:
+    """Jobs the startup recovery pass should look at, oldest first."""
+    placeholders = ", ".join("?" for _ in OPEN_STATUSES)
+    with _connect() as conn:
+        rows = conn.execute(
+            f"SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at", OPEN_STATUSES
+        ).fetchall()
+    return [dict(row) for row in rows]
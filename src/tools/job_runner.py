@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from typing import Dict, Optional
+
+from src.tools.media_store import TEMP_DIR
+
+# --- LIMITS (per video job) ---
+ISOLATION_ENABLED = os.environ.get("VIDEO_JOB_ISOLATION", "true").lower() == "true"
+MAX_RSS_MB = int(os.environ.get("VIDEO_JOB_MAX_RSS_MB", "2048"))        # Whole job: worker + pool + ffmpeg
+MAX_VMEM_MB = int(os.environ.get("VIDEO_JOB_MAX_VMEM_MB", "0"))         # Per process RLIMIT_AS, 0 = off
+MAX_CPU_SECONDS = int(os.environ.get("VIDEO_JOB_MAX_CPU_SECONDS", "1800"))  # Per process RLIMIT_CPU
+WALL_TIMEOUT = int(os.environ.get("VIDEO_JOB_TIMEOUT", "1800"))
+POLL_INTERVAL = 0.5
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+
+# Recent job metrics, exposed by the /metrics/video-jobs endpoint
+JOB_METRICS = deque(maxlen=100)
+
+# job_id -> Popen of running workers (see terminate_job)
+_RUNNING: Dict[str, subprocess.Popen] = {}
+_running_lock = threading.Lock()
+
+
+class VideoJobError(Exception):
+    """The isolated worker failed, hit a limit or was terminated."""
+
+
+def _group_rss_bytes(pgid: int) -> int:
+    """Sums RSS over every process in the job's process group (Linux /proc)."""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # comm may contain spaces, fields after the closing paren are stable
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[2]) == pgid:
+                total += int(fields[21]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+def _kill_group(pgid: int):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def terminate_job(job_id: str) -> bool:
+    """Kills a running worker and all its ffmpeg children. Returns False if not running."""
+    with _running_lock:
+        proc = _RUNNING.get(job_id)
+    if proc is None:
+        return False
+    print(f"🛑 Terminating video job {job_id}")
+    _kill_group(proc.pid)
+    return True
+
+
+def run_video_job(func: str, *args, job_id: Optional[str] = None, **kwargs) -> str:
+    """
+    Runs a video_ops function (by name) in an isolated worker process:
+    - own session/process group, so every ffmpeg child can be killed at once,
+    - own scratch directory (removed afterwards),
+    - RLIMIT_CPU / RLIMIT_AS applied inside the worker,
+    - total RSS of the group watched and the job killed above VIDEO_JOB_MAX_RSS_MB.
+    Arguments must be JSON-serialisable. Returns the function's result (the output path).
+    """
+    if not ISOLATION_ENABLED:
+        from src.tools import video_ops
+        return getattr(video_ops, func)(*args, **kwargs)
+
+    job_id = job_id or os.urandom(6).hex()
+    scratch_dir = tempfile.mkdtemp(prefix=f"job_{job_id}_", dir=TEMP_DIR)
+    result_path = os.path.join(scratch_dir, "result.json")
+    spec = {
+        "func": func,
+        "args": list(args),
+        "kwargs": kwargs,
+        "scratch_dir": scratch_dir,
+        "result_path": result_path,
+        "max_vmem_mb": MAX_VMEM_MB,
+        "max_cpu_seconds": MAX_CPU_SECONDS,
+    }
+
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "src.tools.video_worker", json.dumps(spec)],
+        cwd=PROJECT_ROOT,
+        start_new_session=True,
+    )
+    with _running_lock:
+        _RUNNING[job_id] = proc
+
+    peak_group_rss = 0
+    failure = None
+    rusage = None
+    try:
+        while True:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                break
+
+            group_rss = _group_rss_bytes(proc.pid)
+            peak_group_rss = max(peak_group_rss, group_rss)
+            if group_rss > MAX_RSS_MB * 1024 * 1024:
+                failure = f"memory ceiling exceeded ({group_rss // 2**20} MB > {MAX_RSS_MB} MB)"
+                _kill_group(proc.pid)
+            elif time.monotonic() - start > WALL_TIMEOUT:
+                failure = f"timed out after {WALL_TIMEOUT}s"
+                _kill_group(proc.pid)
+            time.sleep(POLL_INTERVAL)
+    finally:
+        # Deterministic teardown: nothing from this job outlives it
+        _kill_group(proc.pid)
+        with _running_lock:
+            _RUNNING.pop(job_id, None)
+
+        result = None
+        if os.path.exists(result_path):
+            with open(result_path) as f:
+                result = json.load(f)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+        metrics = {
+            "job_id": job_id,
+            "func": func,
+            "seconds": round(time.monotonic() - start, 2),
+            # ru_maxrss (KB) covers the worker and the children it waited for
+            "peak_rss_mb": round(max(peak_group_rss / 2**20, (rusage.ru_maxrss / 1024) if rusage else 0), 1),
+            "cpu_seconds": round(rusage.ru_utime + rusage.ru_stime, 2) if rusage else None,
+            "exit_code": proc.returncode,
+            "status": "ok" if proc.returncode == 0 and not failure else "failed",
+        }
+        JOB_METRICS.append(metrics)
+        print(f"📈 Video job {job_id} [{func}]: {metrics['seconds']}s, peak RSS {metrics['peak_rss_mb']} MB, "
+              f"exit {proc.returncode}")
+
+    if failure:
+        raise VideoJobError(f"{func} {failure}")
+    if proc.returncode != 0 or not result or not result.get("ok"):
+        error = (result or {}).get("error") or f"worker exited with {proc.returncode}"
+        raise VideoJobError(f"{func} failed: {error}")
+    return result["output"]
@@ -0,0 +1,58 @@
+"""
+Per-sender job tracking: a sender's newest media message wins.
+
+When new media arrives while an older job of the same sender is still running,
+the old job is marked superseded. It stops at its next stage boundary
+(raise_if_superseded), its encoder worker is killed by the caller
+(job_runner.terminate_job) and it never writes the draft.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Set
+
+_NEWEST: Dict[str, str] = {}   # sender -> job_id of their newest running job
+_SUPERSEDED: Set[str] = set()  # running jobs that lost to a newer one
+
+# Job id of the job the current task/thread works for (follows it into graph nodes and to_thread)
+_current_job: ContextVar[Optional[str]] = ContextVar("current_job", default=None)
+
+
+class JobSuperseded(Exception):
+    """A newer media message from the same sender replaced this job."""
+
+
+def supersede(sender: str, job_id: str) -> Optional[str]:
+    """Registers job_id as the sender's newest job. Returns the running job it replaces, if any."""
+    previous = _NEWEST.get(sender)
+    _NEWEST[sender] = job_id
+    if previous and previous != job_id:
+        _SUPERSEDED.add(previous)
+        return previous
+    return None
+
+
+def is_superseded(job_id: str) -> bool:
+    return job_id in _SUPERSEDED
+
+
+def finish(sender: str, job_id: str):
+    """The job's run is over (finished, failed or stopped)."""
+    _SUPERSEDED.discard(job_id)
+    if _NEWEST.get(sender) == job_id:
+        del _NEWEST[sender]
+
+
+@contextmanager
+def job_scope(job_id: str):
+    token = _current_job.set(job_id)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+
+def raise_if_superseded(stage: str):
+    """Stage boundary: stops the current job if a newer one replaced it."""
+    job_id = _current_job.get()
+    if job_id is not None and job_id in _SUPERSEDED:
+        raise JobSuperseded(f"Job {job_id} superseded before {stage}")
@@ -0,0 +1,80 @@
+import io
+import os
+import time
+from typing import Tuple
+from PIL import Image
+
+# --- BYTE BUDGETS ---
+# Publish: what Facebook/Instagram get (they re-encode anyway, detail above this is wasted upload time)
+# Preview: what Twilio/WhatsApp fetches for the approval message
+PUBLISH_BUDGET_BYTES = int(os.environ.get("JPEG_PUBLISH_BUDGET_KB", "1200")) * 1024
+PREVIEW_BUDGET_BYTES = int(os.environ.get("JPEG_PREVIEW_BUDGET_KB", "250")) * 1024
+
+MIN_QUALITY = 60
+MAX_QUALITY = 95
+HIGH_QUALITY_444 = 92     # At/above this quality keep full chroma (4:4:4), below use 4:2:0
+DOWNSCALE_STEP = 0.85     # When even MIN_QUALITY is over budget
+
+
+def _encode(img: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    img.save(
+        buffer, "JPEG",
+        quality=quality,
+        optimize=True,                                        # Optimized Huffman tables
+        progressive=True,                                     # Renders early on slow mobile links
+        subsampling=0 if quality >= HIGH_QUALITY_444 else 2,  # 4:4:4 vs 4:2:0
+    )
+    return buffer.getvalue()
+
+
+def encode_to_budget(img: Image.Image, max_bytes: int,
+                     min_quality: int = MIN_QUALITY, max_quality: int = MAX_QUALITY) -> Tuple[bytes, int, Image.Image]:
+    """
+    Binary-searches the highest JPEG quality that fits max_bytes.
+    If even min_quality is too big, the image is downscaled and searched again.
+    Returns (jpeg bytes, quality used, image actually encoded).
+    """
+    img = img.convert("RGB")
+    while True:
+        # Most small images fit at max quality: one encode, no search
+        data = _encode(img, max_quality)
+        if len(data) <= max_bytes:
+            return data, max_quality, img
+
+        best = None
+        low, high = min_quality, max_quality - 1
+        while low <= high:
+            quality = (low + high) // 2
+            data = _encode(img, quality)
+            if len(data) <= max_bytes:
+                best = (data, quality)
+                low = quality + 1
+            else:
+                high = quality - 1
+
+        if best:
+            return best[0], best[1], img
+        if min(img.size) < 320:
+            # Tiny image that still doesn't fit: ship the smallest we can make
+            return _encode(img, min_quality), min_quality, img
+
+        new_size = (int(img.width * DOWNSCALE_STEP), int(img.height * DOWNSCALE_STEP))
+        img = img.resize(new_size, Image.Resampling.LANCZOS)
+
+
+def save_jpeg(img: Image.Image, output_path: str, max_bytes: int = PUBLISH_BUDGET_BYTES) -> dict:
+    """Encodes img within max_bytes and writes it. Returns stats for logging/benchmarks."""
+    start = time.perf_counter()
+    data, quality, encoded = encode_to_budget(img, max_bytes)
+    with open(output_path, "wb") as f:
+        f.write(data)
+    stats = {
+        "bytes": len(data),
+        "quality": quality,
+        "size": encoded.size,
+        "encode_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    print(f"JPEG {os.path.basename(output_path)}: {stats['bytes'] // 1024} KB at q{quality} "
+          f"{encoded.width}x{encoded.height} ({stats['encode_ms']} ms)")
+    return stats
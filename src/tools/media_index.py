@@ -0,0 +1,327 @@
+"""
+Near-duplicate index of processed media (perceptual hashes).
+
+Staff resend the same product photo days later, recropped a little or
+recompressed by WhatsApp. Every processed photo/video gets a signature:
+
+- image: 64-bit pHash (DCT of a 32x32 grey thumbnail) + 64-bit dHash
+  (gradient of a 9x8 thumbnail) = 128 bits
+- video: the same 128 bits for VIDEO_FRAMES frames at fixed positions in the clip
+
+Two media are near-duplicates when the Hamming distance of their signatures is
+at most DEDUP_MAX_DISTANCE per 128 bits. Lookups use multi-index hashing: the
+signature is split into 16-bit chunks, and if the total distance is <= r, at least
+one of the m chunks differs by <= r // m bits (pigeonhole). Probing only those
+chunk values in per-chunk hash tables gives a handful of candidates, which are
+verified with the full distance: well under a millisecond at tens of thousands
+of entries (python -m benchmarks.media_index).
+
+Entries (signature, processed file, preview, caption, posted_at) are stored in
+SQLite next to the job journal and loaded into memory on first use. Matches are
+only looked up within the same tenant: another shop brands and words differently.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, List, Optional, Set, Tuple
+
+from PIL import Image
+
+from src.tools.job_journal import JOB_DB_PATH
+from src.tools.media_store import ensure_local
+
+DEDUP_ENABLED = os.environ.get("MEDIA_DEDUP", "true").lower() == "true"
+DEDUP_MAX_DISTANCE = int(os.environ.get("MEDIA_DEDUP_MAX_DISTANCE", "15"))  # Differing bits per 128-bit frame hash (<16 keeps lookups fast)
+VIDEO_FRAMES = 3            # Frames hashed per video (at 25/50/75% of the clip)
+FRAME_BITS = 128            # pHash (64) + dHash (64)
+CHUNK_BITS = 16             # Multi-index hashing chunk size
+PHASH_SIZE = 32             # Thumbnail the DCT runs on
+HASH_SIZE = 8               # 8x8 bits for both hashes
+
+
+# --- HASHES ---
+
+@lru_cache(maxsize=1)
+def _dct_matrix():
+    """Orthonormal DCT-II basis, phash does X -> D @ X @ D.T with it."""
+    import numpy as np  # Lazy like the other heavy imports, only needed once media arrives
+
+    n = np.arange(PHASH_SIZE)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * PHASH_SIZE))
+    matrix[0] *= 1 / np.sqrt(2)
+    return matrix * np.sqrt(2 / PHASH_SIZE)
+
+
+def _bits_to_int(bits) -> int:
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def phash(img: Image.Image) -> int:
+    """64-bit DCT hash: low frequencies above/below their median. Robust to recompression and rescaling."""
+    import numpy as np
+
+    grey = img.convert("L").resize((PHASH_SIZE, PHASH_SIZE), Image.Resampling.LANCZOS)
+    dct = _dct_matrix() @ np.asarray(grey, dtype=np.float64) @ _dct_matrix().T
+    low = dct[:HASH_SIZE, :HASH_SIZE].flatten()
+    median = np.median(low[1:])  # DC term would skew the median
+    return _bits_to_int(low > median)
+
+
+def dhash(img: Image.Image) -> int:
+    """64-bit gradient hash: is each pixel brighter than its right neighbour."""
+    grey = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = list(grey.getdata())
+    row = HASH_SIZE + 1
+    return _bits_to_int(
+        pixels[y * row + x] > pixels[y * row + x + 1] for y in range(HASH_SIZE) for x in range(HASH_SIZE)
+    )
+
+
+def frame_hash(img: Image.Image) -> int:
+    return (phash(img) << 64) | dhash(img)
+
+
+def image_signature(image_path: str) -> int:
+    with Image.open(image_path) as img:
+        img.draft("L", (PHASH_SIZE * 4, PHASH_SIZE * 4))  # JPEG: decode at reduced size
+        return frame_hash(img)
+
+
+def video_signature(video_path: str) -> int:
+    from src.tools.video_ops import grab_frames
+
+    frames = grab_frames(video_path, VIDEO_FRAMES, max_side=PHASH_SIZE * 4)
+    if len(frames) != VIDEO_FRAMES:
+        raise ValueError(f"Could not read {VIDEO_FRAMES} frames from {video_path}")
+    signature = 0
+    for _, frame in frames:
+        signature = (signature << FRAME_BITS) | frame_hash(frame)
+    return signature
+
+
+def media_signature(path: str, is_video: bool) -> Tuple[str, int]:
+    """(kind, signature) of a downloaded file."""
+    if is_video:
+        return "video", video_signature(path)
+    return "image", image_signature(path)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+# --- MULTI-INDEX HASHING ---
+
+@lru_cache(maxsize=None)
+def _probe_masks(radius: int) -> Tuple[int, ...]:
+    """Every CHUNK_BITS-bit mask with at most `radius` bits set."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for positions in combinations(range(CHUNK_BITS), r):
+            masks.append(sum(1 << p for p in positions))
+    return tuple(masks)
+
+
+class MultiIndexHash:
+    """Hamming-radius search over fixed-size signatures (one table per 16-bit chunk)."""
+
+    def __init__(self, bits: int, radius: int):
+        self.chunks = bits // CHUNK_BITS
+        self.radius = radius
+        self._masks = _probe_masks(radius // self.chunks)
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in range(self.chunks)]
+        self._signatures: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _split(self, signature: int) -> List[int]:
+        chunk_mask = (1 << CHUNK_BITS) - 1
+        return [(signature >> (i * CHUNK_BITS)) & chunk_mask for i in range(self.chunks)]
+
+    def add(self, entry_id: int, signature: int):
+        self._signatures[entry_id] = signature
+        for table, value in zip(self._tables, self._split(signature)):
+            table.setdefault(value, set()).add(entry_id)
+
+    def search(self, signature: int) -> List[Tuple[int, int]]:
+        """(distance, entry_id) of every entry within the radius, closest first."""
+        candidates = set()
+        for table, value in zip(self._tables, self._split(signature)):
+            for mask in self._masks:
+                bucket = table.get(value ^ mask)
+                if bucket:
+                    candidates |= bucket
+        matches = []
+        for entry_id in candidates:
+            distance = hamming(signature, self._signatures[entry_id])
+            if distance <= self.radius:
+                matches.append((distance, entry_id))
+        return sorted(matches)
+
+
+# --- PERSISTENT INDEX ---
+
+_COLUMNS = ["processed_path", "preview_path", "caption", "variants", "posted_at"]
+
+
+class MediaIndex:
+    """SQLite-backed store of processed media, searched in memory per (tenant, kind)."""
+
+    def __init__(self, db_path: str = JOB_DB_PATH, max_distance: int = DEDUP_MAX_DISTANCE):
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._indexes: Dict[Tuple[str, str], MultiIndexHash] = {}
+        self._entries: Dict[int, dict] = {}
+        self._by_job: Dict[str, List[int]] = {}
+        self._load()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _load(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS media_index (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tenant TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    job_id TEXT NOT NULL,
+                    processed_path TEXT,
+                    preview_path TEXT,
+                    caption TEXT,
+                    variants TEXT,
+                    posted_at REAL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS media_index_job ON media_index (job_id)")
+            rows = conn.execute("SELECT * FROM media_index").fetchall()
+        for row in rows:
+            self._remember(dict(row))
+        print(f"🧮 Media index loaded: {len(rows)} entries")
+
+    def _remember(self, entry: dict):
+        entry["signature"] = int(entry["signature"], 16)
+        entry["variants"] = json.loads(entry["variants"] or "[]")
+        key = (entry["tenant"], entry["kind"])
+        if key not in self._indexes:
+            frames = VIDEO_FRAMES if entry["kind"] == "video" else 1
+            self._indexes[key] = MultiIndexHash(FRAME_BITS * frames, self.max_distance * frames)
+        self._indexes[key].add(entry["id"], entry["signature"])
+        self._entries[entry["id"]] = entry
+        self._by_job.setdefault(entry["job_id"], []).append(entry["id"])
+
+    def find(self, tenant: str, kind: str, signature: int, exclude_job: Optional[str] = None) -> Optional[dict]:
+        """Closest earlier media with a processed file, or None."""
+        with self._lock:
+            index = self._indexes.get((tenant, kind))
+            if index is None:
+                return None
+            for distance, entry_id in index.search(signature):
+                entry = self._entries[entry_id]
+                if entry["processed_path"] and entry["job_id"] != exclude_job:
+                    return {**entry, "distance": distance}
+        return None
+
+    def add(self, tenant: str, kind: str, signature: int, job_id: str, **fields):
+        """Records processed media. fields: processed_path, preview_path, caption, variants."""
+        if job_id in self._by_job:
+            # Resumed job: already indexed
+            self.update(job_id, **fields)
+            return
+        entry = {"processed_path": None, "preview_path": None, "caption": None, "posted_at": None, **fields}
+        entry.update(tenant=tenant, kind=kind, signature=format(signature, "x"), job_id=job_id,
+                     variants=json.dumps(entry.get("variants") or []), created_at=time.time())
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"INSERT INTO media_index ({', '.join(entry)}) VALUES ({', '.join('?' for _ in entry)})",
+                tuple(entry.values()),
+            )
+            entry["id"] = cursor.lastrowid
+        with self._lock:
+            self._remember(entry)
+
+    def update(self, job_id: str, **fields):
+        """e.g. update(job_id, processed_path=render) once a video render is done, or posted_at/caption on publish."""
+        unknown = set(fields) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown media index fields: {unknown}")
+        stored = {name: json.dumps(value) if name == "variants" else value for name, value in fields.items()}
+        assignments = ", ".join(f"{name} = ?" for name in stored)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE media_index SET {assignments} WHERE job_id = ?", (*stored.values(), job_id))
+        with self._lock:
+            for entry_id in self._by_job.get(job_id, []):
+                self._entries[entry_id].update(fields)
+
+
+_index_lock = threading.Lock()
+_index: Optional[MediaIndex] = None
+
+
+def get_media_index() -> MediaIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MediaIndex()
+        return _index
+
+
+def caption_reusable(earlier_context: Optional[str], context: Optional[str]) -> bool:
+    """
+    A resend keeps the earlier caption only when both came with the same, non-empty
+    text (whitespace and case ignored). Without text there is nothing to show the
+    sender means the same post, so the caption is generated again.
+    """
+    earlier, current = (" ".join((text or "").split()).casefold() for text in (earlier_context, context))
+    return bool(current) and current == earlier
+
+
+def check_duplicate(path: str, is_video: bool, tenant: str, job_id: str):
+    """
+    Returns ((kind, signature), earlier entry) for a downloaded file. The entry is
+    None when nothing similar was processed before or its media is gone; the
+    signature is None when dedup is off or the file could not be hashed.
+    """
+    if not DEDUP_ENABLED:
+        return None, None
+    try:
+        kind, signature = media_signature(path, is_video)
+    except Exception as e:
+        print(f"⚠️ Could not hash media, skipping duplicate check: {e}")
+        return None, None
+
+    start = time.perf_counter()
+    match = get_media_index().find(tenant, kind, signature, exclude_job=job_id)
+    print(f"🧮 Duplicate lookup: {(time.perf_counter() - start) * 1000:.2f} ms")
+    if match is None:
+        return (kind, signature), None
+    try:
+        # Possibly processed on another instance (media store)
+        match["processed_path"] = ensure_local(match["processed_path"])
+    except Exception as e:
+        print(f"⚠️ Earlier media of job {match['job_id']} is not available: {e}")
+        return (kind, signature), None
+    if not os.path.exists(match["processed_path"]):
+        return (kind, signature), None
+    if not (match["preview_path"] and os.path.exists(match["preview_path"])):
+        match["preview_path"] = match["processed_path"]
+    return (kind, signature), match
@@ -0,0 +1,218 @@
+import os
+import json
+import mimetypes
+import subprocess
+from functools import lru_cache
+from typing import TypedDict, Optional, List, Tuple
+
+# Binaries (same env var moviepy uses, so both agree on which ffmpeg to run)
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.environ.get("FFPROBE_BINARY", "ffprobe")
+
+# --- INSTAGRAM REELS SPEC ---
+# https://developers.facebook.com/docs/instagram-platform/instagram-graph-api/reference/ig-user/media#reel-specifications
+REELS_CONTAINERS = {"mov", "mp4", "m4a", "3gp", "3g2", "mj2"}  # ffprobe reports "mov,mp4,m4a,3gp,3g2,mj2"
+REELS_VIDEO_CODECS = {"h264", "hevc"}
+REELS_AUDIO_CODECS = {"aac"}
+REELS_MAX_WIDTH = 1080            # Short side of the 1080x1920 Reels target
+REELS_MAX_HEIGHT = 1920           # Long side
+REELS_MIN_FPS = 23
+REELS_MAX_FPS = 60
+REELS_TARGET_FPS = 30             # Cap used when we have to re-encode anyway
+REELS_MIN_DURATION = 3
+REELS_MAX_DURATION = 15 * 60
+REELS_MAX_BITRATE = 25_000_000
+REELS_MAX_AUDIO_RATE = 48000
+
+# Encoder tuning (overridable for slower, smaller encodes)
+ENCODER_PRESET = os.environ.get("VIDEO_ENCODER_PRESET", "ultrafast")
+ENCODER_CRF = os.environ.get("VIDEO_ENCODER_CRF", "23")
+ENCODER_MAXRATE = os.environ.get("VIDEO_ENCODER_MAXRATE", "8M")
+
+IMAGE_CODECS = {"mjpeg", "png", "webp", "bmp", "tiff", "gif", "heic", "jpegls"}
+
+
+class MediaInfo(TypedDict):
+    path: str
+    kind: str                     # "video", "image" or "unknown"
+    container: Optional[str]
+    video_codec: Optional[str]
+    audio_codec: Optional[str]
+    width: int                    # Display width (rotation already applied)
+    height: int                   # Display height
+    rotation: int
+    duration: float
+    fps: float
+    bit_rate: int
+    pix_fmt: Optional[str]
+    audio_sample_rate: int
+    size_bytes: int
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    """Turns ffprobe's '30000/1001' into 29.97."""
+    try:
+        num, _, den = (rate or "0/1").partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _parse_rotation(stream: dict) -> int:
+    # Older muxers store it as a tag, newer ones as a display matrix
+    rotation = stream.get("tags", {}).get("rotate")
+    if rotation is None:
+        for side_data in stream.get("side_data_list", []):
+            if "rotation" in side_data:
+                rotation = side_data["rotation"]
+                break
+    try:
+        return int(float(rotation or 0)) % 360
+    except ValueError:
+        return 0
+
+
+def _guess_info(path: str, size_bytes: int) -> MediaInfo:
+    """Fallback when ffprobe is missing or chokes: trust the extension."""
+    mime, _ = mimetypes.guess_type(path)
+    kind = "unknown"
+    if mime and mime.startswith("video"):
+        kind = "video"
+    elif mime and mime.startswith("image"):
+        kind = "image"
+    return MediaInfo(
+        path=path, kind=kind, container=None, video_codec=None, audio_codec=None,
+        width=0, height=0, rotation=0, duration=0.0, fps=0.0, bit_rate=0,
+        pix_fmt=None, audio_sample_rate=0, size_bytes=size_bytes,
+    )
+
+
+@lru_cache(maxsize=256)
+def _probe_cached(path: str, mtime_ns: int, size_bytes: int) -> MediaInfo:
+    # mtime/size are part of the cache key so an overwritten file is re-probed
+    try:
+        result = subprocess.run(
+            [FFPROBE_BINARY, "-v", "error", "-print_format", "json",
+             "-show_format", "-show_streams", path],
+            capture_output=True, text=True, timeout=30, check=True,
+        )
+        data = json.loads(result.stdout)
+    except Exception as e:
+        print(f"⚠️ ffprobe failed for {os.path.basename(path)}: {e}")
+        return _guess_info(path, size_bytes)
+
+    fmt = data.get("format", {})
+    streams = data.get("streams", [])
+    video = next(
+        (s for s in streams
+         if s.get("codec_type") == "video" and not s.get("disposition", {}).get("attached_pic")),
+        None,
+    )
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+
+    if video is None:
+        return _guess_info(path, size_bytes)
+
+    rotation = _parse_rotation(video)
+    width, height = int(video.get("width", 0)), int(video.get("height", 0))
+    if rotation in (90, 270):
+        width, height = height, width
+
+    duration = float(fmt.get("duration") or video.get("duration") or 0)
+    is_still = video.get("codec_name") in IMAGE_CODECS and duration <= 0.1
+
+    return MediaInfo(
+        path=path,
+        kind="image" if is_still else "video",
+        container=fmt.get("format_name"),
+        video_codec=video.get("codec_name"),
+        audio_codec=audio.get("codec_name") if audio else None,
+        width=width,
+        height=height,
+        rotation=rotation,
+        duration=duration,
+        fps=_parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate")),
+        bit_rate=int(fmt.get("bit_rate") or 0),
+        pix_fmt=video.get("pix_fmt"),
+        audio_sample_rate=int(audio.get("sample_rate", 0)) if audio else 0,
+        size_bytes=size_bytes,
+    )
+
+
+def probe_media(path: str) -> MediaInfo:
+    """
+    Reads container/codec/resolution/duration/rotation once per file.
+    Results are cached, so calling this from several stages is free.
+    """
+    stat = os.stat(path)
+    return dict(_probe_cached(os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+
+
+def is_video(path: str) -> bool:
+    """Content-based video check (replaces mime string / '.mp4' suffix checks)."""
+    return probe_media(path)["kind"] == "video"
+
+
+def reels_spec_violations(info: MediaInfo) -> List[str]:
+    """Lists every reason this file can't go to Instagram Reels as-is (empty = compliant)."""
+    problems = []
+    container = set((info["container"] or "").split(","))
+    if not container & REELS_CONTAINERS:
+        problems.append(f"container {info['container']}")
+    if info["video_codec"] not in REELS_VIDEO_CODECS:
+        problems.append(f"video codec {info['video_codec']}")
+    if info["audio_codec"] is not None and info["audio_codec"] not in REELS_AUDIO_CODECS:
+        problems.append(f"audio codec {info['audio_codec']}")
+    if info["audio_sample_rate"] > REELS_MAX_AUDIO_RATE:
+        problems.append(f"audio rate {info['audio_sample_rate']}")
+    if info["pix_fmt"] != "yuv420p":
+        problems.append(f"pixel format {info['pix_fmt']}")
+    if min(info["width"], info["height"]) > REELS_MAX_WIDTH or max(info["width"], info["height"]) > REELS_MAX_HEIGHT:
+        problems.append(f"resolution {info['width']}x{info['height']}")
+    if not REELS_MIN_FPS <= info["fps"] <= REELS_MAX_FPS:
+        problems.append(f"fps {info['fps']:.2f}")
+    if not REELS_MIN_DURATION <= info["duration"] <= REELS_MAX_DURATION:
+        problems.append(f"duration {info['duration']:.1f}s")
+    if info["bit_rate"] > REELS_MAX_BITRATE:
+        problems.append(f"bitrate {info['bit_rate']}")
+    return problems
+
+
+def meets_reels_spec(info: MediaInfo) -> bool:
+    return info["kind"] == "video" and not reels_spec_violations(info)
+
+
+def reels_target_size(info: MediaInfo) -> Tuple[int, int]:
+    """
+    Display size to composite at: fits inside 1080x1920 (either orientation),
+    never upscales, and keeps both sides even for yuv420p.
+    """
+    w, h = info["width"], info["height"]
+    if not w or not h:
+        return w, h
+    scale = min(1.0, REELS_MAX_WIDTH / min(w, h), REELS_MAX_HEIGHT / max(w, h))
+    return int(w * scale) // 2 * 2, int(h * scale) // 2 * 2
+
+
+def reels_encoder_settings(info: MediaInfo) -> dict:
+    """
+    write_videofile() kwargs that land inside the Reels spec in one pass:
+    H.264 yuv420p, capped bitrate, source fps clamped to the allowed range, faststart.
+    """
+    fps = info["fps"] or REELS_TARGET_FPS
+    fps = min(max(fps, REELS_MIN_FPS + 1), REELS_TARGET_FPS)
+    return {
+        "codec": "libx264",
+        "audio_codec": "aac",
+        "audio_fps": 44100,
+        "audio_bitrate": "128k",
+        "preset": ENCODER_PRESET,
+        "fps": round(fps, 3),
+        "ffmpeg_params": [
+            "-crf", ENCODER_CRF,
+            "-maxrate", ENCODER_MAXRATE,
+            "-bufsize", ENCODER_MAXRATE,
+            "-pix_fmt", "yuv420p",
+            "-movflags", "+faststart",
+        ],
+    }
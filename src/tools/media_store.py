@@ -0,0 +1,160 @@
+"""
+Shared media store.
+
+Processing always happens on local disk (TEMP_DIR, ffmpeg/Pillow need files);
+the store is where finished media is shared so any instance can send previews
+and publish it:
+
+- local (default): files stay in TEMP_DIR and are served from {BASE_URL}/static/
+- s3: files are uploaded to an S3-compatible bucket (AWS, MinIO, R2, ...) and
+  Meta/Twilio fetch them through pre-signed URLs. Needs `pip install boto3`.
+
+Keys are file names; they are uuid-based everywhere in this project.
+"""
+import os
+import threading
+import mimetypes
+from functools import lru_cache
+
+# Local working directory for downloads, renders and previews (shared by all tools)
+TEMP_DIR = os.environ.get("MEDIA_DIR", "/tmp")
+if not os.path.exists(TEMP_DIR):
+    os.makedirs(TEMP_DIR)
+
+
+def is_public_path(path: str) -> bool:
+    """True for paths inside TEMP_DIR, which the /static mount serves to anyone."""
+    media_dir = os.path.realpath(TEMP_DIR)
+    return os.path.commonpath([os.path.realpath(path), media_dir]) == media_dir
+
+
+MEDIA_STORE = os.environ.get("MEDIA_STORE", "local").lower()   # "local" or "s3"
+S3_BUCKET = os.environ.get("S3_BUCKET")
+S3_PREFIX = os.environ.get("S3_PREFIX", "media/")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")             # e.g. http://minio:9000 (unset = AWS)
+S3_REGION = os.environ.get("S3_REGION")
+S3_URL_EXPIRY = int(os.environ.get("S3_URL_EXPIRY", "3600"))    # Pre-signed URL lifetime (seconds)
+S3_ADDRESSING_STYLE = os.environ.get("S3_ADDRESSING_STYLE", "auto")  # "path" for most MinIO setups
+
+
+class LocalMediaStore:
+    """Single instance: media stays in TEMP_DIR and is served by the /static mount."""
+
+    def put(self, path: str) -> str:
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return os.path.basename(path)
+
+    def url(self, key: str) -> str:
+        base_url = os.environ.get("BASE_URL", "").rstrip("/")
+        if not base_url:
+            raise ValueError("BASE_URL is not set, Meta/Twilio cannot fetch local media")
+        return f"{base_url}/static/{key}"
+
+    def ensure_local(self, path: str) -> str:
+        return path
+
+    def delete(self, key: str):
+        path = os.path.join(TEMP_DIR, key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class S3MediaStore:
+    """Multi-instance: media is shared through an S3-compatible bucket."""
+
+    def __init__(self):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError as e:
+            raise RuntimeError("MEDIA_STORE=s3 needs boto3 (pip install boto3)") from e
+        if not S3_BUCKET:
+            raise RuntimeError("MEDIA_STORE=s3 needs S3_BUCKET")
+
+        self.bucket = S3_BUCKET
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=S3_ENDPOINT_URL,
+            region_name=S3_REGION,
+            config=Config(signature_version="s3v4", s3={"addressing_style": S3_ADDRESSING_STYLE}),
+        )
+        # path -> (mtime, size) already uploaded by this instance
+        self._uploaded = {}
+        self._lock = threading.Lock()
+
+    def _object_key(self, key: str) -> str:
+        return f"{S3_PREFIX}{key}"
+
+    def put(self, path: str) -> str:
+        """
+        Uploads a local file (streamed, multipart for large videos) once.
+        If the file only exists on another instance, checks the bucket already has it.
+        """
+        key = os.path.basename(path)
+        if not os.path.exists(path):
+            # Created on another instance: it must have shared it already
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return key
+
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if self._uploaded.get(path) == version:
+                return key
+
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.client.upload_file(path, self.bucket, self._object_key(key), ExtraArgs={"ContentType": content_type})
+        with self._lock:
+            self._uploaded[path] = version
+        print(f"☁️ Stored {key} in s3://{self.bucket}/{self._object_key(key)}")
+        return key
+
+    def url(self, key: str) -> str:
+        """Pre-signed GET URL, so Meta/Twilio can fetch from a private bucket."""
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=S3_URL_EXPIRY,
+        )
+
+    def ensure_local(self, path: str) -> str:
+        """Streams the object to TEMP_DIR if this instance does not have the file."""
+        if os.path.exists(path):
+            return path
+        key = os.path.basename(path)
+        local_path = os.path.join(TEMP_DIR, key)
+        if not os.path.exists(local_path):
+            partial = f"{local_path}.part"
+            self.client.download_file(self.bucket, self._object_key(key), partial)
+            os.replace(partial, local_path)
+            print(f"☁️ Fetched {key} from the media store")
+        return local_path
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+
+@lru_cache(maxsize=1)
+def get_media_store():
+    if MEDIA_STORE == "s3":
+        return S3MediaStore()
+    if MEDIA_STORE != "local":
+        raise ValueError(f"Unknown MEDIA_STORE: {MEDIA_STORE}")
+    return LocalMediaStore()
+
+
+def share_media(path: str) -> str:
+    """Makes a local file available to every instance. Returns its key."""
+    return get_media_store().put(path)
+
+
+def public_media_url(path: str) -> str:
+    """URL Meta/Twilio can fetch the media from (shares it first if needed)."""
+    store = get_media_store()
+    return store.url(store.put(path))
+
+
+def ensure_local(path: str) -> str:
+    """Local path of shared media, fetched from the store if it was made on another instance."""
+    return get_media_store().ensure_local(path)
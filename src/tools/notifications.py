@@ -1,6 +1,22 @@
 import os
 import time
-from twilio.rest import Client
+from functools import lru_cache
+
+from src.tools.media_store import public_media_url
+
+
+@lru_cache(maxsize=1)
+def get_twilio_client():
+    """Shared Twilio REST client, the SDK is only imported on first use."""
+    from twilio.rest import Client
+
+    client = Client(os.environ.get("TWILIO_ACCOUNT_SID"), os.environ.get("TWILIO_AUTH_TOKEN"))
+    # Local stand-in for load tests (see benchmarks/loadtest)
+    api_base = os.environ.get("TWILIO_API_BASE")
+    if api_base:
+        client.api.base_url = api_base.rstrip("/")
+    return client
+
 
 def send_whatsapp_preview(to_number: str, image_path: str, caption: str):
     """
@@ -10,29 +26,26 @@ def send_whatsapp_preview(to_number: str, image_path: str, caption: str):
     """
     account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
     auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
-    
-    # Remove trailing slash from base URL
-    base_url = os.environ.get("BASE_URL", "").rstrip("/") 
 
-    if not all([account_sid, auth_token, base_url]):
-        print("Missing Twilio credentials or BASE_URL in .env")
+    if not all([account_sid, auth_token]):
+        print("Missing Twilio credentials in .env")
         return
 
     try:
-        client = Client(account_sid, auth_token)
+        client = get_twilio_client()
         from_number = os.environ.get("WHATSAPP_NUMBER")
         
-        filename = os.path.basename(image_path)
-        public_media_url = f"{base_url}/static/{filename}"
+        # Local: {BASE_URL}/static/..., S3: pre-signed URL (see media_store)
+        media_url = public_media_url(image_path)
         
         print(f"Sending preview to {to_number}...")
-        print(f"Media Link: {public_media_url}")
+        print(f"Media Link: {media_url}")
 
         # --- Media ---
         media_msg = client.messages.create(
             from_=from_number,
             to=to_number,
-            media_url=[public_media_url]
+            media_url=[media_url]
             # No body here, just the file
         )
         print(f"Media sent! SID: {media_msg.sid}")
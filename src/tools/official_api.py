@@ -1,30 +1,51 @@
 import os
-import requests
+import json
 import time
+import threading
+import requests
+from urllib.parse import urlencode
+
+from src.tools.media_probe import is_video as is_video_file
+from src.tools.media_store import public_media_url, ensure_local
+from src.tools.tenants import current_tenant
+
+# --- CONFIGURATION ---
+# Page ID, IG user ID and token come from the tenant of the current job
+# (src/tools/tenants.py; FB_PAGE_ID / IG_USER_ID / META_ACCESS_TOKEN without TENANTS_FILE)
 
-# --- CONFIGURATION FROM ENV ---
-FB_PAGE_ID = os.environ.get("FB_PAGE_ID")
-IG_USER_ID = os.environ.get("IG_USER_ID")
-META_ACCESS_TOKEN = os.environ.get("META_ACCESS_TOKEN") # <--- Using Env Var
-BASE_URL = os.environ.get("BASE_URL", "https://localhost:8000").rstrip("/")
+# Graph API hosts (overridable so load tests can point at local stand-ins)
+GRAPH_API_VERSION = "v21.0"
+GRAPH_URL = f"{os.environ.get('META_GRAPH_API_BASE', 'https://graph.facebook.com').rstrip('/')}/{GRAPH_API_VERSION}"
+GRAPH_VIDEO_URL = f"{os.environ.get('META_GRAPH_VIDEO_API_BASE', 'https://graph-video.facebook.com').rstrip('/')}/{GRAPH_API_VERSION}"
 
-def get_auth_headers():
-    """Injects the Env Var Token into the header"""
-    if not META_ACCESS_TOKEN:
-        raise ValueError("❌ Missing META_ACCESS_TOKEN in environment variables.")
+# Container status polls for all pending IG uploads share one batch request per tick
+CONTAINER_POLL_INTERVAL = float(os.environ.get("META_CONTAINER_POLL_INTERVAL", "5"))
+BATCH_LIMIT = 50  # Graph API maximum per batch
+
+def get_auth_headers(access_token: str = None):
+    """Injects the tenant's token into the header"""
+    access_token = access_token or current_tenant()["meta_access_token"]
+    if not access_token:
+        raise ValueError(f"❌ Missing Meta access token for tenant '{current_tenant()['id']}'.")
     return {
-        "Authorization": f"Bearer {META_ACCESS_TOKEN}"
+        "Authorization": f"Bearer {access_token}"
     }
 
+def page_id():
+    return current_tenant()["fb_page_id"]
+
+def ig_user_id():
+    return current_tenant()["ig_user_id"]
+
 def execute_post(media_path: str, caption: str, dry_run: bool = False):
     """
     Orchestrator: Generates public URL -> Posts to FB & IG
     """
     # 1. Generate the Public URL so Meta can download the file
-    filename = os.path.basename(media_path)
-    public_url = f"{BASE_URL}/static/{filename}"
+    media_path = ensure_local(media_path)
+    public_url = public_media_url(media_path)
     
-    is_video = media_path.lower().endswith(".mp4")
+    is_video = is_video_file(media_path)
 
     print(f"🚀 Starting Upload Process")
     print(f"📂 Local: {media_path}")
@@ -47,7 +68,7 @@ def post_to_facebook(media_path_or_url: str, caption: str, dry_run: bool = False
     Tries Local File upload first (Reliable), falls back to URL.
     Returns the 'post_id' (str) on success, or False on failure.
     """
-    endpoint = f"https://graph.facebook.com/v21.0/{FB_PAGE_ID}/photos"
+    endpoint = f"{GRAPH_URL}/{page_id()}/photos"
     
     # 1. Check if it is a local file
     files = None
@@ -91,7 +112,7 @@ def get_fb_picture_url(photo_id: str):
     Helper: Gets the source URL of a photo already uploaded to Facebook.
     Used to give Instagram a reliable URL.
     """
-    endpoint = f"https://graph.facebook.com/v21.0/{photo_id}"
+    endpoint = f"{GRAPH_URL}/{photo_id}"
     params = {
         "fields": "images",
     }
@@ -104,7 +125,7 @@ def get_fb_picture_url(photo_id: str):
         print(f"❌ Failed to get FB Source URL: {e}")
         return None
 def post_video_to_facebook(video_url: str, caption: str, dry_run: bool = False):
-    endpoint = f"https://graph-video.facebook.com/v21.0/{FB_PAGE_ID}/videos"
+    endpoint = f"{GRAPH_VIDEO_URL}/{page_id()}/videos"
     payload = {"file_url": video_url, "description": caption}
 
     if dry_run: return True
@@ -121,41 +142,37 @@ def post_video_to_facebook(video_url: str, caption: str, dry_run: bool = False):
 # --- INSTAGRAM FUNCTIONS ---
 
 def post_to_instagram(image_url: str, caption: str, dry_run: bool = False):
-    create_url = f"https://graph.facebook.com/v21.0/{IG_USER_ID}/media"
-    publish_url = f"https://graph.facebook.com/v21.0/{IG_USER_ID}/media_publish"
+    create_url = f"{GRAPH_URL}/{ig_user_id()}/media"
 
     if dry_run:
         print(f"[DRY RUN] IG Photo: {image_url}")
         return True
 
-    # Step 1: Create Container
-    for i in range(10):
-        time.sleep(2)
-        try:
-            payload = {"image_url": image_url, "caption": caption}
-            req1 = requests.post(create_url, json=payload, headers=get_auth_headers())
-            if req1.status_code != 200:
-                print(f"❌ IG Create Error: {req1.text}")
-                return False
-            creation_id = req1.json().get("id")
-        except Exception as e:
-            print(f"❌ IG Net Error: {e}")
-            return False
-    
-    # Step 2: Publish Container
+    # Step 1: Create Container (once)
     try:
-        req2 = requests.post(publish_url, json={"creation_id": creation_id}, headers=get_auth_headers())
-        req2.raise_for_status()
-        print(f"✅ Instagram Posted: {req2.json().get('id')}")
-        return True
+        payload = {"image_url": image_url, "caption": caption}
+        req1 = requests.post(create_url, json=payload, headers=get_auth_headers())
+        if req1.status_code != 200:
+            print(f"❌ IG Create Error: {req1.text}")
+            return False
+        creation_id = req1.json().get("id")
     except Exception as e:
-        print(f"❌ IG Publish Error: {e}")
+        print(f"❌ IG Net Error: {e}")
+        return False
+    if not creation_id:
+        print(f"❌ IG Create Error, no container id: {req1.text}")
         return False
 
+    # Step 2: Wait until Instagram has fetched the image, then publish
+    status = get_container_poller().wait(creation_id, timeout=60)
+    if status != "FINISHED":
+        print(f"❌ IG container {creation_id} not ready: {status}")
+        return False
+    return publish_container(creation_id, "Instagram")
+
 def post_reel_to_instagram(video_url: str, caption: str, dry_run: bool = False):
-    # Same logic as above but with media_type='REELS' and polling
-    create_url = f"https://graph.facebook.com/v21.0/{IG_USER_ID}/media"
-    publish_url = f"https://graph.facebook.com/v21.0/{IG_USER_ID}/media_publish"
+    # Same logic as above but with media_type='REELS' and a longer wait
+    create_url = f"{GRAPH_URL}/{ig_user_id()}/media"
 
     if dry_run: return True
 
@@ -166,22 +183,174 @@ def post_reel_to_instagram(video_url: str, caption: str, dry_run: bool = False):
     except Exception as e:
         print(f"❌ IG Reel Error: {e}")
         return False
+    if not creation_id:
+        print(f"❌ IG Reel Create Error, no container id: {req1.text}")
+        return False
 
-    # Poll status
     print("⏳ Waiting for IG processing...")
-    status_url = f"https://graph.facebook.com/v21.0/{creation_id}"
-    for _ in range(20):
-        time.sleep(5)
-        r = requests.get(status_url, params={"fields": "status_code"}, headers=get_auth_headers())
-        status = r.json().get("status_code")
-        if status == "FINISHED": break
-        if status == "ERROR": return False
-    
-    # Publish
+    status = get_container_poller().wait(creation_id, timeout=300)
+    if status != "FINISHED":
+        print(f"❌ IG Reel container {creation_id} not ready: {status}")
+        return False
+    return publish_container(creation_id, "IG Reel")
+
+def publish_container(creation_id: str, label: str):
+    publish_url = f"{GRAPH_URL}/{ig_user_id()}/media_publish"
     try:
         req2 = requests.post(publish_url, json={"creation_id": creation_id}, headers=get_auth_headers())
-        print(f"✅ IG Reel Posted: {req2.json().get('id')}")
+        req2.raise_for_status()
+        print(f"✅ {label} Posted: {req2.json().get('id')}")
         return True
     except Exception as e:
-        print(f"❌ IG Reel Publish Error: {e}")
-        return False
\ No newline at end of file
+        print(f"❌ {label} Publish Error: {e}")
+        return False
+
+# --- BATCH REQUESTS ---
+
+def graph_batch(batch: list, files: dict = None, access_token: str = None) -> list:
+    """
+    Runs several Graph calls in one HTTP request.
+    Items are {"method", "relative_url", "body"?, "name"?, "attached_files"?}; later items
+    can reference earlier results with JSONPath, e.g. "{result=upload:$.id}?fields=images".
+    Returns one (status code, parsed body) tuple per item, (None, None) if it was not run.
+    Uses the current tenant's token unless access_token is given.
+    """
+    response = requests.post(
+        f"{GRAPH_URL}/",
+        data={"batch": json.dumps(batch), "include_headers": "false"},
+        files=files,
+        headers=get_auth_headers(access_token),
+        timeout=120,
+    )
+    response.raise_for_status()
+    results = []
+    for item in response.json():
+        if item is None:
+            # Skipped because a dependency failed
+            results.append((None, None))
+            continue
+        try:
+            body = json.loads(item.get("body") or "null")
+        except ValueError:
+            body = item.get("body")
+        results.append((item.get("code"), body))
+    return results
+
+def upload_photo_with_source(image_path: str, caption: str, dry_run: bool = False):
+    """
+    Uploads PHOTO to the Facebook Page and fetches its CDN URL (for Instagram) in a single batch.
+    Returns (post_id, source_url); post_id is False on failure, source_url None if it could not be read.
+    """
+    if dry_run:
+        print(f"[DRY RUN] FB Photo: {image_path}")
+        return "DRY_RUN_ID_123", None
+
+    batch = [
+        {
+            "method": "POST",
+            "name": "upload",
+            "relative_url": f"{page_id()}/photos",
+            "body": urlencode({"caption": caption, "published": "true"}),
+            "attached_files": "source",
+            # Referenced by the next item, so Meta would drop its response (the post id) otherwise
+            "omit_response_on_success": False,
+        },
+        {
+            "method": "GET",
+            "relative_url": "{result=upload:$.id}?fields=images",
+        },
+    ]
+    print("Sending batch request to Facebook API (upload + CDN URL)...")
+    try:
+        with open(image_path, "rb") as source:
+            (upload_code, upload), (images_code, images) = graph_batch(batch, files={"source": source})
+    except Exception as e:
+        print(f"❌ Facebook Batch Error: {e}")
+        return False, None
+
+    if upload_code != 200 or not upload.get("id"):
+        print(f"❌ Facebook Error: {upload}")
+        return False, None
+    print(f"✅ Facebook Posted! ID: {upload['id']}")
+
+    try:
+        source_url = images["images"][0]["source"] if images_code == 200 else None
+    except (KeyError, IndexError, TypeError):
+        source_url = None
+    if not source_url:
+        print(f"❌ Failed to get FB Source URL: {images}")
+    return upload["id"], source_url
+
+
+class ContainerPoller:
+    """
+    Polls IG media containers until they leave IN_PROGRESS.
+    One background thread checks every pending container with a single batch
+    request per tick, instead of one GET per container every few seconds.
+    Containers are batched per access token (one batch per tenant).
+    """
+
+    def __init__(self, interval: float = CONTAINER_POLL_INTERVAL):
+        self.interval = interval
+        self._pending = {}  # creation_id -> {"event", "status", "token"}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wait(self, creation_id: str, timeout: float) -> str:
+        """Blocks until the container is FINISHED/ERROR/EXPIRED. Returns the status, "TIMEOUT" otherwise."""
+        # The poller thread has no tenant context, remember whose container this is
+        entry = {"event": threading.Event(), "status": None, "token": current_tenant()["meta_access_token"]}
+        with self._lock:
+            self._pending[creation_id] = entry
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ig-container-poller", daemon=True)
+                self._thread.start()
+        finished = entry["event"].wait(timeout)
+        with self._lock:
+            self._pending.pop(creation_id, None)
+        return entry["status"] if finished else "TIMEOUT"
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                pending = list(self._pending.items())
+                if not pending:
+                    # Idle: stop, the next wait() starts a fresh thread
+                    self._thread = None
+                    return
+            by_token = {}
+            for creation_id, entry in pending:
+                by_token.setdefault(entry["token"], []).append((creation_id, entry))
+            for token, entries in by_token.items():
+                for start in range(0, len(entries), BATCH_LIMIT):
+                    try:
+                        self._poll(entries[start:start + BATCH_LIMIT], token)
+                    except Exception as e:
+                        # Never let one bad response kill the thread every wait() depends on
+                        print(f"⚠️ IG status check failed, retrying next tick: {e}")
+
+    def _poll(self, chunk: list, access_token: str):
+        batch = [{"method": "GET", "relative_url": f"{creation_id}?fields=status_code"} for creation_id, _ in chunk]
+        try:
+            results = graph_batch(batch, access_token=access_token)
+        except Exception as e:
+            print(f"⚠️ IG status batch failed, retrying next tick: {e}")
+            return
+        print(f"⏳ Checked {len(chunk)} IG container(s) in one request")
+        for (creation_id, entry), (code, body) in zip(chunk, results):
+            status = body.get("status_code") if code == 200 and isinstance(body, dict) else None
+            if status in ("FINISHED", "ERROR", "EXPIRED"):
+                entry["status"] = status
+                entry["event"].set()
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+def get_container_poller() -> ContainerPoller:
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = ContainerPoller()
+        return _poller
\ No newline at end of file
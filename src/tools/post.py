@@ -24,6 +24,20 @@ We helpen u graag met deskundig advies!
 # 4. Set to True to test the connection without actually posting to Meta
 DRY_RUN = False 
 
+def upload_post(file_path: str, caption: str, dry_run: bool = DRY_RUN, api_url: str = API_URL, timeout: float = 300,
+                tenant: str = None):
+    """Sends one file + caption to /manual-post and returns the response (tenant: id from TENANTS_FILE)."""
+    with open(file_path, "rb") as f:
+        # Prepare the payload
+        files = {"file": f}
+        data = {
+            "caption": caption,
+            "dry_run": str(dry_run) # Send as string, FastAPI converts it
+        }
+        if tenant:
+            data["tenant"] = tenant
+        return requests.post(api_url, files=files, data=data, timeout=timeout)
+
 def run():
     print(f"🚀 Starting Manual Upload...")
     print(f"TARGET: {API_URL}")
@@ -34,34 +48,25 @@ def run():
         print(f"❌ Error: File not found at {IMAGE_PATH}")
         return
 
-    # Open the file in binary mode
-    with open(IMAGE_PATH, "rb") as f:
-        # Prepare the payload
-        files = {"file": f}
-        data = {
-            "caption": CAPTION,
-            "dry_run": str(DRY_RUN) # Send as string, FastAPI converts it
-        }
+    try:
+        # Send POST request
+        print("⏳ Uploading to server...")
+        response = upload_post(IMAGE_PATH, CAPTION)
         
-        try:
-            # Send POST request
-            print("⏳ Uploading to server...")
-            response = requests.post(API_URL, files=files, data=data)
+        # Print Result
+        if response.status_code == 200:
+            print("\n✅ SUCCESS!")
+            print(response.json())
+        else:
+            print(f"\n❌ FAILED (Status {response.status_code})")
+            print("Response:", response.text)
             
-            # Print Result
-            if response.status_code == 200:
-                print("\n✅ SUCCESS!")
-                print(response.json())
-            else:
-                print(f"\n❌ FAILED (Status {response.status_code})")
-                print("Response:", response.text)
-                
-        except requests.exceptions.ConnectionError:
-            print("\n❌ Error: Could not connect to the server.")
-            print("   - Is main.py running?")
-            print("   - Did you check the API_URL?")
-        except Exception as e:
-            print(f"\n❌ Error: {e}")
+    except requests.exceptions.ConnectionError:
+        print("\n❌ Error: Could not connect to the server.")
+        print("   - Is main.py running?")
+        print("   - Did you check the API_URL?")
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""
+On-demand profiling of single jobs.
+
+A job runs under job_profile(job_id) when profiling is switched on (admin
+endpoint, PROFILE_JOBS env var) or requested for that one job. The active
+profile lives in a ContextVar, so it follows the job into LangGraph nodes,
+asyncio tasks and asyncio.to_thread workers without touching other jobs
+running on the same event loop:
+
+- profile_stage(name)      async stages (graph nodes): wall time
+- profiled_to_thread(f)    blocking tools: wall time + cProfile of that call
+- whole job                pyinstrument (sampling, async-aware) when installed
+- memory                   tracemalloc snapshot diff over the job
+
+Artefacts go to PROFILE_DIR/<job_id>/ (summary.json, <stage>.prof/.txt,
+job.html, memory.txt) and are served by the /admin/profiles endpoints.
+"""
+import os
+import json
+import time
+import shutil
+import pstats
+import asyncio
+import cProfile
+import functools
+import threading
+import tracemalloc
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional, List
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler  # Optional: pip install pyinstrument
+except ImportError:
+    SamplingProfiler = None
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(PROJECT_ROOT, "data", "profiles"))  # Not in MEDIA_DIR (public /static)
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))          # Newest job profiles kept on disk
+TRACEMALLOC_FRAMES = int(os.environ.get("PROFILE_TRACEMALLOC_FRAMES", "10"))
+TOP_ENTRIES = 30
+
+# Toggled by POST /admin/profiling
+PROFILING_STATE = {
+    "enabled": os.environ.get("PROFILE_JOBS", "false").lower() == "true",
+    "senders": [],            # Only profile these senders (empty = everyone)
+    "remaining": None,        # Profile this many more jobs, then switch off (None = no limit)
+    "sampling_available": SamplingProfiler is not None,
+}
+
+_current: ContextVar[Optional["JobProfile"]] = ContextVar("job_profile", default=None)
+_state_lock = threading.Lock()
+_tracing_jobs = 0
+
+
+def should_profile(sender: Optional[str] = None) -> bool:
+    """Consumes one slot of the admin toggle if it applies to this job."""
+    with _state_lock:
+        if not PROFILING_STATE["enabled"]:
+            return False
+        if PROFILING_STATE["senders"] and sender not in PROFILING_STATE["senders"]:
+            return False
+        if PROFILING_STATE["remaining"] is not None:
+            PROFILING_STATE["remaining"] -= 1
+            if PROFILING_STATE["remaining"] <= 0:
+                PROFILING_STATE["enabled"] = False
+        return True
+
+
+def configure(enabled: bool, senders: Optional[List[str]] = None, max_jobs: Optional[int] = None) -> dict:
+    with _state_lock:
+        PROFILING_STATE["enabled"] = enabled
+        PROFILING_STATE["senders"] = list(senders or [])
+        PROFILING_STATE["remaining"] = max_jobs
+        return dict(PROFILING_STATE)
+
+
+def _start_tracemalloc():
+    global _tracing_jobs
+    with _state_lock:
+        _tracing_jobs += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def _stop_tracemalloc():
+    global _tracing_jobs
+    with _state_lock:
+        _tracing_jobs -= 1
+        if _tracing_jobs == 0:
+            tracemalloc.stop()
+
+
+class JobProfile:
+    """Collects the artefacts of one profiled job."""
+
+    def __init__(self, job_id: str, label: str = ""):
+        self.job_id = job_id
+        self.label = label
+        self.dir = os.path.join(PROFILE_DIR, job_id)
+        self.stages = []
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._sampler = None
+        self._snapshot = None
+        self._started_at = None
+        self._start = None
+
+    def start(self):
+        os.makedirs(self.dir, exist_ok=True)
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        _start_tracemalloc()
+        tracemalloc.reset_peak()
+        self._snapshot = tracemalloc.take_snapshot()
+
+    def start_sampler(self):
+        """Must run on the event loop, inside the job's task (pyinstrument follows that context)."""
+        if SamplingProfiler is not None:
+            self._sampler = SamplingProfiler(async_mode="enabled")
+            self._sampler.start()
+
+    def stop_sampler(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def _artefact_name(self, stage: str) -> str:
+        with self._lock:
+            count = self._counts.get(stage, 0)
+            self._counts[stage] = count + 1
+        return stage if count == 0 else f"{stage}_{count}"
+
+    def record(self, stage: str, seconds: float, kind: str, artefact: Optional[str] = None):
+        with self._lock:
+            self.stages.append({
+                "stage": stage,
+                "kind": kind,
+                "seconds": round(seconds, 4),
+                "offset": round(time.perf_counter() - self._start - seconds, 4),
+                "artefact": artefact,
+            })
+
+    def run_stage(self, stage: str, func, *args, **kwargs):
+        """Runs a blocking call under cProfile (in the calling thread only)."""
+        name = self._artefact_name(stage)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            self.record(stage, time.perf_counter() - start, "thread", f"{name}.prof")
+            profiler.dump_stats(os.path.join(self.dir, f"{name}.prof"))
+            with open(os.path.join(self.dir, f"{name}.txt"), "w") as f:
+                stats = pstats.Stats(profiler, stream=f)
+                stats.sort_stats("cumulative").print_stats(TOP_ENTRIES)
+
+    def stop(self) -> dict:
+        elapsed = time.perf_counter() - self._start
+        if self._sampler is not None:
+            with open(os.path.join(self.dir, "job.html"), "w") as f:
+                f.write(self._sampler.output_html())
+
+        # tracemalloc is process-wide: allocations of jobs running at the same time show up too
+        current, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().compare_to(self._snapshot, "lineno")[:TOP_ENTRIES]
+        _stop_tracemalloc()
+        with open(os.path.join(self.dir, "memory.txt"), "w") as f:
+            f.write(f"traced now {current / 2**20:.1f} MB, peak during job {peak / 2**20:.1f} MB\n\n")
+            f.write("\n".join(str(stat) for stat in top))
+
+        summary = {
+            "job_id": self.job_id,
+            "label": self.label,
+            "started_at": self._started_at,
+            "seconds": round(elapsed, 3),
+            "peak_traced_mb": round(peak / 2**20, 1),
+            "stages": self.stages,
+            "files": sorted(os.listdir(self.dir)) + ["summary.json"],
+        }
+        with open(os.path.join(self.dir, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"🔬 Profile for {self.job_id} saved to {self.dir} ({summary['seconds']}s)")
+        _prune()
+        return summary
+
+
+def _prune():
+    """Keeps the PROFILE_KEEP newest job profiles."""
+    entries = list_profiles()
+    for entry in entries[PROFILE_KEEP:]:
+        shutil.rmtree(os.path.join(PROFILE_DIR, entry["job_id"]), ignore_errors=True)
+
+
+@asynccontextmanager
+async def job_profile(job_id: str, sender: Optional[str] = None, force: bool = False):
+    """Profiles everything awaited inside the block if profiling applies to this job."""
+    if not (force or should_profile(sender)):
+        yield None
+        return
+
+    profile = JobProfile(job_id, label=sender or "")
+    await asyncio.to_thread(profile.start)
+    profile.start_sampler()
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        profile.stop_sampler()
+        await asyncio.to_thread(profile.stop)
+
+
+def profile_stage(name: str):
+    """Decorator for async stages (e.g. graph nodes): records wall time when the job is profiled."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                profile.record(name, time.perf_counter() - start, "async")
+        return wrapper
+    return decorator
+
+
+async def profiled_to_thread(func, *args, **kwargs):
+    """asyncio.to_thread that cProfiles the call when the current job is profiled."""
+    profile = _current.get()
+    if profile is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await asyncio.to_thread(profile.run_stage, func.__name__, func, *args, **kwargs)
+
+
+def list_profiles() -> List[dict]:
+    """Saved profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    entries = []
+    for job_id in os.listdir(PROFILE_DIR):
+        summary_path = os.path.join(PROFILE_DIR, job_id, "summary.json")
+        if os.path.exists(summary_path):
+            with open(summary_path) as f:
+                summary = json.load(f)
+            entries.append({key: summary[key] for key in ("job_id", "label", "started_at", "seconds", "files")})
+    return sorted(entries, key=lambda entry: entry["started_at"], reverse=True)
+
+
+def profile_file(job_id: str, name: str) -> Optional[str]:
+    """Path of one artefact, or None (also for anything outside PROFILE_DIR)."""
+    if os.path.basename(job_id) != job_id or os.path.basename(name) != name:
+        return None
+    path = os.path.join(PROFILE_DIR, job_id, name)
+    return path if os.path.isfile(path) else None
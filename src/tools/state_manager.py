@@ -1,18 +1,54 @@
 # src/tools/state_manager.py
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
-# In-memory storage: { "whatsapp_number": { "image": "path", "caption": "text" } }
+# In-memory storage: { "whatsapp_number": { "image_path": "path", "caption": "text", ... } }
 # Does reset on restart, but should be fine for most usecases
 _DRAFTS: Dict[str, dict] = {}
 
-def save_draft(user_id: str, image_path: str, caption: str):
-    """Saves or overwrites a draft for a user."""
+def save_draft(user_id: str, image_path: Optional[str], caption: str, job_id: Optional[str] = None,
+               variants: Optional[List[str]] = None, media_refs: Optional[List[dict]] = None, context_text: str = "",
+               duplicate: Optional[dict] = None):
+    """
+    Saves or overwrites a draft for a user.
+    image_path may be None while the full-quality video is still rendering.
+    variants / media_refs / context_text let the sender swap or revise the caption without a new upload.
+    duplicate ({"job_id", "posted_at"}) is set when the media was reused from an earlier job.
+    """
     _DRAFTS[user_id] = {
         "image_path": image_path,
-        "caption": caption
+        "caption": caption,
+        "job_id": job_id,
+        "post_when_ready": False,
+        "variants": variants or [caption],
+        "media_refs": media_refs or [],
+        "context_text": context_text,
+        "duplicate": duplicate,
+        "duplicate_confirmed": False
     }
     print(f"Draft saved for {user_id}")
 
+def set_draft_media(user_id: str, job_id: str, image_path: str) -> Optional[dict]:
+    """
+    Attaches the finished render to the draft of the job that started it.
+    Returns None if the draft was cancelled or replaced in the meantime.
+    """
+    draft = _DRAFTS.get(user_id)
+    if not draft or draft.get("job_id") != job_id:
+        return None
+    draft["image_path"] = image_path
+    print(f"Draft media ready for {user_id}")
+    return draft
+
+def mark_post_when_ready(user_id: str):
+    """POST arrived before the render finished: publish as soon as it is attached."""
+    if user_id in _DRAFTS:
+        _DRAFTS[user_id]["post_when_ready"] = True
+
+def confirm_duplicate_post(user_id: str):
+    """The sender was warned this media was posted before, the next POST publishes anyway."""
+    if user_id in _DRAFTS:
+        _DRAFTS[user_id]["duplicate_confirmed"] = True
+
 def get_draft(user_id: str) -> Optional[dict]:
     """Retrieves the current draft."""
     return _DRAFTS.get(user_id)
@@ -23,6 +59,15 @@ def update_draft_caption(user_id: str, new_caption: str):
         _DRAFTS[user_id]["caption"] = new_caption
         print(f"Draft updated for {user_id}")
 
+def select_variant(user_id: str, number: int) -> Optional[str]:
+    """Makes pre-generated variant `number` (1-based) the caption. Returns it, or None if there is no such variant."""
+    draft = _DRAFTS.get(user_id)
+    if not draft or not 1 <= number <= len(draft["variants"]):
+        return None
+    draft["caption"] = draft["variants"][number - 1]
+    print(f"Draft variant {number} selected for {user_id}")
+    return draft["caption"]
+
 def clear_draft(user_id: str):
     """Removes the draft after posting or cancelling."""
     if user_id in _DRAFTS:
@@ -0,0 +1,219 @@
+"""
+Tenant (shop) profiles: one deployment posting for several shops.
+
+TENANTS_FILE points at a JSON file with one profile per shop, matched on the
+WhatsApp sender number:
+
+    {
+      "kooistra": {
+        "name": "Kooistra Opkopers",
+        "senders": ["whatsapp:+316..."],
+        "default": true,
+        "prompt": "KOOISTRA_PROMPT",             # name in src/agent/prompts.py ...
+        "assets_dir": "src/assets",              # watermark.png + bottom.png
+        "fb_page_id": "123", "ig_user_id": "456",
+        "meta_access_token_env": "META_ACCESS_TOKEN",
+        "max_jobs": 3, "max_video_jobs": 1
+      },
+      "audiocom": {
+        "senders": ["whatsapp:+316..."],
+        "prompt_file": "prompts/audiocom.txt",   # ... or a text file
+        ...
+      }
+    }
+
+fb_page_id, ig_user_id and meta_access_token_env (set in the environment) are
+required per profile; a profile missing one fails at load time instead of
+posting to another shop's pages. Without TENANTS_FILE there is a single tenant
+built from the env vars (FB_PAGE_ID, IG_USER_ID, META_ACCESS_TOKEN,
+KOOISTRA_PROMPT, src/assets).
+
+The tenant of the running job/request lives in a ContextVar (tenant_scope),
+so graph nodes, the Meta client and worker threads pick it up without
+extra parameters. Each tenant gets its own Gemini prompt-cache slot (its id),
+decoded branding overlays and concurrency quotas.
+"""
+import os
+import json
+import asyncio
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+TENANTS_FILE = os.environ.get("TENANTS_FILE")
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+DEFAULT_ASSETS_DIR = os.path.join(PROJECT_ROOT, "src/assets")
+WATERMARK_FILE = "watermark.png"   # Logo, top right
+BOTTOM_FLAIR_FILE = "bottom.png"   # Banner across the bottom
+
+# Default quotas: concurrent jobs per tenant, and how many of those may render video
+DEFAULT_MAX_JOBS = int(os.environ.get("TENANT_MAX_JOBS", "3"))
+DEFAULT_MAX_VIDEO_JOBS = int(os.environ.get("TENANT_MAX_VIDEO_JOBS", "1"))
+
+REQUIRED_FIELDS = ("fb_page_id", "ig_user_id", "meta_access_token_env")
+
+
+class Tenant(TypedDict):
+    id: str
+    name: str
+    senders: List[str]
+    prompt: str
+    prompt_slot: str          # Gemini context-cache slot
+    assets_dir: str
+    fb_page_id: Optional[str]
+    ig_user_id: Optional[str]
+    meta_access_token: Optional[str]
+    max_jobs: int
+    max_video_jobs: int
+
+
+_current: ContextVar[Optional[Tenant]] = ContextVar("tenant", default=None)
+
+# (tenant id, kind) -> semaphore, created on the event loop on first use
+_quotas: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+
+
+def _resolve_path(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(PROJECT_ROOT, path)
+
+
+def _load_prompt(profile: dict) -> str:
+    from src.agent import prompts
+
+    if profile.get("prompt_file"):
+        with open(_resolve_path(profile["prompt_file"]), encoding="utf-8") as f:
+            return f.read()
+    return getattr(prompts, profile.get("prompt", "KOOISTRA_PROMPT"))
+
+
+def _validate(tenant_id: str, profile: dict):
+    """TENANTS_FILE profiles carry their own Meta IDs and token, no env var fallback."""
+    missing = [field for field in REQUIRED_FIELDS if not profile.get(field)]
+    if missing:
+        raise ValueError(f"Tenant {tenant_id!r} in {TENANTS_FILE} is missing {', '.join(missing)}")
+    if not os.environ.get(profile["meta_access_token_env"]):
+        raise ValueError(f"Tenant {tenant_id!r} in {TENANTS_FILE}: {profile['meta_access_token_env']} is not set")
+
+
+def _build(tenant_id: str, profile: dict) -> Tenant:
+    return {
+        "id": tenant_id,
+        "name": profile.get("name", tenant_id),
+        "senders": list(profile.get("senders", [])),
+        "prompt": _load_prompt(profile),
+        "prompt_slot": tenant_id,
+        "assets_dir": _resolve_path(profile.get("assets_dir", DEFAULT_ASSETS_DIR)),
+        "fb_page_id": profile.get("fb_page_id"),
+        "ig_user_id": profile.get("ig_user_id"),
+        "meta_access_token": os.environ.get(profile["meta_access_token_env"]),
+        "max_jobs": int(profile.get("max_jobs", DEFAULT_MAX_JOBS)),
+        "max_video_jobs": int(profile.get("max_video_jobs", DEFAULT_MAX_VIDEO_JOBS)),
+    }
+
+
+@lru_cache(maxsize=1)
+def load_tenants() -> Tuple[Dict[str, Tenant], str]:
+    """Returns (tenants by id, default tenant id). Read once per process."""
+    if not TENANTS_FILE:
+        profile = {
+            "name": "Kooistra Opkopers",
+            "fb_page_id": os.environ.get("FB_PAGE_ID"),
+            "ig_user_id": os.environ.get("IG_USER_ID"),
+            "meta_access_token_env": "META_ACCESS_TOKEN",
+        }
+        return {"kooistra": _build("kooistra", profile)}, "kooistra"
+
+    with open(_resolve_path(TENANTS_FILE), encoding="utf-8") as f:
+        profiles = json.load(f)
+    if not profiles:
+        raise ValueError(f"{TENANTS_FILE} defines no tenants")
+    for tenant_id, profile in profiles.items():
+        _validate(tenant_id, profile)
+    tenants = {tenant_id: _build(tenant_id, profile) for tenant_id, profile in profiles.items()}
+    default_id = next((tenant_id for tenant_id, profile in profiles.items() if profile.get("default")), next(iter(profiles)))
+    print(f"🏪 Loaded {len(tenants)} tenants from {TENANTS_FILE} (default: {default_id})")
+    return tenants, default_id
+
+
+def get_tenant(tenant_id: Optional[str] = None) -> Tenant:
+    """Tenant by id (the default tenant for None). Raises KeyError for unknown ids."""
+    tenants, default_id = load_tenants()
+    if tenant_id is None:
+        return tenants[default_id]
+    if tenant_id not in tenants:
+        raise KeyError(f"Unknown tenant: {tenant_id}")
+    return tenants[tenant_id]
+
+
+def tenant_for_sender(sender: str) -> Tenant:
+    tenants, default_id = load_tenants()
+    for tenant in tenants.values():
+        if sender in tenant["senders"]:
+            return tenant
+    return tenants[default_id]
+
+
+def current_tenant() -> Tenant:
+    """Tenant of the running job/request (default tenant outside a tenant_scope)."""
+    return _current.get() or get_tenant()
+
+
+@contextmanager
+def tenant_scope(tenant: Tenant):
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+
+@asynccontextmanager
+async def tenant_quota(tenant: Tenant, kind: str = "jobs"):
+    """
+    Per-tenant concurrency slot ("jobs" or "video_jobs"), so one shop's burst
+    queues behind its own quota instead of starving the other shops.
+    """
+    key = (tenant["id"], kind)
+    if key not in _quotas:
+        _quotas[key] = asyncio.Semaphore(tenant["max_video_jobs"] if kind == "video_jobs" else tenant["max_jobs"])
+    semaphore = _quotas[key]
+    if semaphore.locked():
+        print(f"⏳ {tenant['name']}: {kind} quota full, queued")
+    async with semaphore:
+        yield
+
+
+# --- BRANDING ASSETS ---
+
+def brand_asset_paths(assets_dir: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """(bottom flair, watermark) in a tenant's assets dir, None where the file is missing."""
+    assets_dir = assets_dir or DEFAULT_ASSETS_DIR
+    paths = (os.path.join(assets_dir, BOTTOM_FLAIR_FILE), os.path.join(assets_dir, WATERMARK_FILE))
+    return tuple(path if os.path.exists(path) else None for path in paths)
+
+
+@lru_cache(maxsize=32)
+def load_brand_assets(assets_dir: Optional[str] = None) -> dict:
+    """
+    Decoded RGBA overlays {"flair", "watermark"} (None where missing), read once
+    per assets dir and process. Callers resize copies, never the cached images.
+    """
+    from PIL import Image
+
+    flair_path, watermark_path = brand_asset_paths(assets_dir)
+    assets = {}
+    for name, path in (("flair", flair_path), ("watermark", watermark_path)):
+        if path:
+            with Image.open(path) as img:
+                assets[name] = img.convert("RGBA")
+        else:
+            assets[name] = None
+    return assets
+
+
+def preload_brand_assets():
+    """Warm-up: decodes every tenant's overlays so the first job does not pay for it."""
+    tenants, _ = load_tenants()
+    for tenant in tenants.values():
+        load_brand_assets(tenant["assets_dir"])
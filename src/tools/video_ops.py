@@ -1,33 +1,49 @@
 import os
 import uuid
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 import PIL.Image
 # Bandaid version mismatch fix between pillow and moviepy
 if not hasattr(PIL.Image, 'ANTIALIAS'):
     PIL.Image.ANTIALIAS = PIL.Image.LANCZOS
-from moviepy.editor import VideoFileClip, ImageClip, CompositeVideoClip
 
-# Ensure /tmp exists
-TEMP_DIR = "/tmp"
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
+from src.tools.media_probe import (
+    FFMPEG_BINARY, FFPROBE_BINARY, probe_media, meets_reels_spec, reels_spec_violations,
+    reels_target_size, reels_encoder_settings,
+)
+from src.tools.media_store import TEMP_DIR
+from src.tools.tenants import brand_asset_paths, load_brand_assets  # Per-tenant overlays (assets_dir=None: default)
 
-# Paths
-PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
-ASSETS_DIR = os.path.join(PROJECT_ROOT, "src/assets")
+# Preview proxy (WhatsApp only, never published)
+PREVIEW_SHORT_SIDE = int(os.environ.get("PREVIEW_SHORT_SIDE", "480"))
+PREVIEW_CRF = os.environ.get("PREVIEW_CRF", "32")
+PREVIEW_FPS = 24
 
-WATERMARK_PATH = os.path.join(ASSETS_DIR, "watermark.png")
-BOTTOM_FLAIR_PATH = os.path.join(ASSETS_DIR, "bottom.png")
+# Segment-parallel encoding: "auto" (long clips on multi-core hosts), "always" or "never"
+PARALLEL_MODE = os.environ.get("VIDEO_PARALLEL_ENCODING", "auto").lower()
+PARALLEL_WORKERS = int(os.environ.get("VIDEO_ENCODE_WORKERS", "0"))  # 0 = one per core
+PARALLEL_MIN_DURATION = float(os.environ.get("VIDEO_PARALLEL_MIN_DURATION", "20"))
+PARALLEL_MIN_SEGMENT = 3.0
+
+def keyframe_timestamps(duration: float, num_frames: int) -> List[float]:
+    """Evenly spread sample times, skipping the very first and last frame."""
+    return [duration * (i + 1) / (num_frames + 1) for i in range(num_frames)]
 
 def extract_keyframes(video_path: str, num_frames: int = 5) -> list[str]:
     """
     Extracts keyframes from the video to send to Gemini
     """
+    from moviepy.editor import VideoFileClip  # Lazy: pulls in imageio/ffmpeg discovery
+
     print(f"Extracting {num_frames} keyframes...")
     keyframe_paths = []
     try:
         with VideoFileClip(video_path) as clip:
-            duration = clip.duration
-            timestamps = [duration * (i + 1) / (num_frames + 1) for i in range(num_frames)]
+            timestamps = keyframe_timestamps(clip.duration, num_frames)
             
             for i, t in enumerate(timestamps):
                 filename = f"frame_{uuid.uuid4()}_{i}.jpg"
@@ -39,55 +55,136 @@ def extract_keyframes(video_path: str, num_frames: int = 5) -> list[str]:
         print(f"Error extracting frames: {e}")
         return []
 
-def brand_video(video_path: str) -> str:
+def grab_frames(video_path: str, num_frames: int, max_side: int) -> List[Tuple[float, PIL.Image.Image]]:
+    """(timestamp, frame) for num_frames evenly spread frames, decoded in memory at most max_side px."""
+    from moviepy.editor import VideoFileClip
+
+    info = probe_media(video_path)
+    # Decode straight to the target size instead of full resolution
+    scale = max_side / max(info["width"], info["height"], 1)
+    target = (int(info["height"] * scale), int(info["width"] * scale)) if scale < 1 else None
+    with VideoFileClip(video_path, audio=False, target_resolution=target) as clip:
+        return [
+            (t, PIL.Image.fromarray(clip.get_frame(t)))
+            for t in keyframe_timestamps(clip.duration, num_frames)
+        ]
+
+def extract_contact_sheet(video_path: str, num_frames: int = 6) -> list[str]:
+    """
+    Grabs num_frames frames (in memory, at a reduced decode size) and tiles them
+    into one labelled contact sheet. Returns [sheet path], or [] on failure like extract_keyframes.
+    """
+    from src.tools.image_ops import build_contact_sheet, CONTACT_SHEET_TILE
+
+    print(f"Building contact sheet from {num_frames} frames...")
+    try:
+        frames = grab_frames(video_path, num_frames, CONTACT_SHEET_TILE)
+        return [build_contact_sheet(frames)]
+    except Exception as e:
+        print(f"Error building contact sheet: {e}")
+        return []
+
+def _open_scaled(video_path: str, info: dict):
+    """Opens the source, letting ffmpeg scale while decoding so 4K phone footage is never composited at full size."""
+    from moviepy.editor import VideoFileClip
+
+    target_w, target_h = reels_target_size(info)
+    if (target_w, target_h) != (info["width"], info["height"]):
+        return VideoFileClip(video_path, target_resolution=(target_h, target_w))
+    return VideoFileClip(video_path)
+
+def _close_all(*clips):
+    """Closes clips (and their ffmpeg readers) even if one of them fails to close."""
+    for clip in clips:
+        try:
+            clip.close()
+        except Exception as e:
+            print(f"Warning: failed to close clip: {e}")
+
+def _composite_branding(video, assets_dir: Optional[str] = None):
+    """
+    Stacks the tenant's bottom flair and logo on top of the clip.
+    Returns (composite, overlays); close both, CompositeVideoClip does not close its children.
+    """
+    import numpy as np
+    from moviepy.editor import ImageClip, CompositeVideoClip
+
+    w, h = video.size
+    overlays = [video]
+    # Decoded once per process and assets dir (segment workers brand many clips)
+    assets = load_brand_assets(assets_dir)
+
+    # 1. BOTTOM FLAIR
+    if assets["flair"] is not None:
+        flair = ImageClip(np.array(assets["flair"]))
+        # Resize width to match video, maintain aspect ratio
+        flair_new_h = int(w * (flair.h / flair.w))
+        flair = flair.resize(width=w, height=flair_new_h)
+        # Position: Center Bottom, Duration: Full Video
+        flair = flair.set_position(("center", "bottom")).set_duration(video.duration)
+        overlays.append(flair)
+    else:
+        print("Bottom flair asset not found")
+
+    # 2. LOGO
+    if assets["watermark"] is not None:
+        logo = ImageClip(np.array(assets["watermark"]))
+        # Resize to 15% width
+        target_w = int(w * 0.15)
+        target_h = int(target_w * (logo.h / logo.w))
+        logo = logo.resize(width=target_w, height=target_h)
+        # Position: Top Right with padding
+        padding = 20
+        logo = logo.set_position((w - target_w - padding, padding)).set_duration(video.duration)
+        overlays.append(logo)
+    else:
+        print("Watermark asset not found")
+
+    return CompositeVideoClip(overlays), overlays
+
+def brand_video(video_path: str, parallel: Optional[bool] = None, scratch_dir: Optional[str] = None,
+                assets_dir: Optional[str] = None) -> str:
+    """
+    Brands the full video at Reels spec with the overlays in assets_dir (default: src/assets).
+    parallel=None decides automatically (long clips on multi-core hosts are split
+    at keyframes and encoded in a process pool, see brand_video_parallel).
+    Intermediate files (audio, segments) live in a per-job scratch dir; the
+    result is written to TEMP_DIR.
+    """
     print(f"Starting video branding on: {video_path}")
-    
+
+    owns_scratch = scratch_dir is None
+    if owns_scratch:
+        scratch_dir = tempfile.mkdtemp(prefix="job_", dir=TEMP_DIR)
+
+    clips = []
     try:
-        video = VideoFileClip(video_path)
-        w, h = video.size
-        overlays = [video]
-
-        # 1. BOTTOM FLAIR
-        if os.path.exists(BOTTOM_FLAIR_PATH):
-            flair = ImageClip(BOTTOM_FLAIR_PATH)
-            # Resize width to match video, maintain aspect ratio
-            flair_new_h = int(w * (flair.h / flair.w))
-            flair = flair.resize(width=w, height=flair_new_h)
-            # Position: Center Bottom, Duration: Full Video
-            flair = flair.set_position(("center", "bottom")).set_duration(video.duration)
-            overlays.append(flair)
-        else:
-            print("Bottom flair asset not found")
-
-        # 2. LOGO
-        if os.path.exists(WATERMARK_PATH):
-            logo = ImageClip(WATERMARK_PATH)
-            # Resize to 15% width
-            target_w = int(w * 0.15)
-            target_h = int(target_w * (logo.h / logo.w))
-            logo = logo.resize(width=target_w, height=target_h)
-            # Position: Top Right with padding
-            padding = 20
-            logo = logo.set_position((w - target_w - padding, padding)).set_duration(video.duration)
-            overlays.append(logo)
-        else:
-            print("Watermark asset not found")
+        info = probe_media(video_path)
+        if parallel is None:
+            parallel = PARALLEL_MODE == "always" or (
+                PARALLEL_MODE == "auto" and _encode_workers() > 1 and info["duration"] >= PARALLEL_MIN_DURATION
+            )
+        if parallel:
+            return brand_video_parallel(video_path, info, scratch_dir, assets_dir)
+
+        video = _open_scaled(video_path, info)
+        clips.append(video)
+        if tuple(video.size) != (info["width"], info["height"]):
+            print(f"Downscaling {info['width']}x{info['height']} -> {video.size[0]}x{video.size[1]}")
 
         # 3. WRITE FILE
-        final = CompositeVideoClip(overlays)
+        final, overlays = _composite_branding(video, assets_dir)
+        clips = [final] + overlays
         output_filename = f"branded_video_{uuid.uuid4()}.mp4"
         output_path = os.path.join(TEMP_DIR, output_filename)
         
-        # Use preset='ultrafast' for speed, audio=True for sound
+        # Encoder settings are derived from the probe so one pass lands inside the Reels spec
         final.write_videofile(
             output_path, 
-            codec="libx264", 
-            audio_codec="aac", 
-            temp_audiofile=os.path.join(TEMP_DIR, "temp-audio.m4a"),
+            temp_audiofile=os.path.join(scratch_dir, "temp-audio.m4a"),
             remove_temp=True,
-            preset="ultrafast", 
-            fps=24,
-            logger=None
+            logger=None,
+            **reels_encoder_settings(info)
         )
         
         print(f"Video branding complete: {output_path}")
@@ -95,4 +192,205 @@ def brand_video(video_path: str) -> str:
 
     except Exception as e:
         print(f"Error branding video: {e}")
-        raise
\ No newline at end of file
+        raise
+
+    finally:
+        _close_all(*clips)
+        if owns_scratch:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+# --- SEGMENT-PARALLEL ENCODING ---
+
+def _encode_workers() -> int:
+    return max(1, min(PARALLEL_WORKERS or os.cpu_count() or 1, os.cpu_count() or 1))
+
+def get_keyframe_times(video_path: str) -> List[float]:
+    """Keyframe timestamps from packet flags (no decoding needed)."""
+    cmd = [
+        FFPROBE_BINARY, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            times.append(float(pts_time))
+    return sorted(times)
+
+def plan_segments(duration: float, keyframes: List[float], workers: int) -> List[Tuple[float, float]]:
+    """
+    Splits [0, duration] into about `workers` segments whose cut points sit on
+    keyframes, so every segment starts on a cleanly decodable frame.
+    """
+    cuts = []
+    for i in range(1, workers):
+        ideal = duration * i / workers
+        nearest = min(keyframes, key=lambda k: abs(k - ideal), default=None)
+        if nearest is None:
+            continue
+        previous = cuts[-1] if cuts else 0.0
+        if nearest - previous >= PARALLEL_MIN_SEGMENT and duration - nearest >= PARALLEL_MIN_SEGMENT:
+            cuts.append(nearest)
+    bounds = [0.0] + cuts + [duration]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _brand_segment(video_path: str, info: dict, start: float, end: float, output_path: str, threads: int,
+                   assets_dir: Optional[str] = None) -> str:
+    """Process-pool worker: brands one segment, video only (audio is muxed once at the end)."""
+    video = _open_scaled(video_path, info)
+    clips = [video]
+    try:
+        segment = video.subclip(start, end)
+        final, overlays = _composite_branding(segment, assets_dir)
+        clips += [final] + overlays
+        settings = reels_encoder_settings(info)
+        for key in ("audio_codec", "audio_fps", "audio_bitrate"):
+            settings.pop(key)
+        final.write_videofile(output_path, audio=False, threads=threads, logger=None, **settings)
+        return output_path
+    finally:
+        _close_all(*clips)
+
+def brand_video_parallel(video_path: str, info: Optional[dict] = None, scratch_dir: str = TEMP_DIR,
+                         assets_dir: Optional[str] = None) -> str:
+    """
+    Splits the source at keyframes, brands + encodes the segments concurrently
+    in a process pool, then concatenates them losslessly (stream copy) and
+    muxes the original audio track back in.
+    """
+    info = info or probe_media(video_path)
+    workers = _encode_workers()
+    segments = plan_segments(info["duration"], get_keyframe_times(video_path), workers)
+    if len(segments) < 2:
+        print("Not enough keyframes to split, falling back to single-process encode")
+        return brand_video(video_path, parallel=False, scratch_dir=scratch_dir, assets_dir=assets_dir)
+
+    print(f"Parallel branding: {len(segments)} segments on {workers} workers")
+    job_id = uuid.uuid4()
+    segment_paths = [os.path.join(scratch_dir, f"segment_{job_id}_{i:03d}.mp4") for i in range(len(segments))]
+    threads = max(1, (os.cpu_count() or 1) // len(segments))
+
+    # spawn: the server process is multi-threaded, forking it is not safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(_brand_segment, video_path, info, start, end, path, threads, assets_dir)
+            for (start, end), path in zip(segments, segment_paths)
+        ]
+        for future in futures:
+            future.result()
+
+    # Concat demuxer + stream copy: no second video encode
+    list_path = os.path.join(scratch_dir, f"segments_{job_id}.txt")
+    with open(list_path, "w") as f:
+        f.writelines(f"file '{path}'\n" for path in segment_paths)
+
+    output_path = os.path.join(TEMP_DIR, f"branded_video_{uuid.uuid4()}.mp4")
+    settings = reels_encoder_settings(info)
+    cmd = [
+        FFMPEG_BINARY, "-y", "-v", "error",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-i", video_path,
+        "-map", "0:v", "-map", "1:a?",
+        "-c:v", "copy",
+        "-c:a", settings["audio_codec"], "-b:a", settings["audio_bitrate"], "-ar", str(settings["audio_fps"]),
+        "-shortest", "-movflags", "+faststart",
+        output_path,
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Error concatenating segments: {e.stderr}")
+        raise
+    finally:
+        for path in segment_paths + [list_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    print(f"Video branding complete: {output_path}")
+    return output_path
+
+def prepare_video_for_reels(video_path: str) -> str:
+    """
+    For unbranded uploads: returns the file untouched if it already meets the
+    Reels spec, otherwise transcodes it once with ffmpeg (no compositing).
+    """
+    info = probe_media(video_path)
+    if meets_reels_spec(info):
+        print(f"Video already meets Reels spec, skipping transcode: {video_path}")
+        return video_path
+
+    print(f"Transcoding for Reels ({', '.join(reels_spec_violations(info))})")
+    target_w, target_h = reels_target_size(info)
+    settings = reels_encoder_settings(info)
+    output_path = os.path.join(TEMP_DIR, f"reels_{uuid.uuid4()}.mp4")
+
+    cmd = [
+        FFMPEG_BINARY, "-y", "-v", "error", "-i", video_path,
+        "-vf", f"scale={target_w}:{target_h}",
+        "-r", str(settings["fps"]),
+        "-c:v", settings["codec"], "-preset", settings["preset"],
+        *settings["ffmpeg_params"],
+        "-c:a", settings["audio_codec"], "-b:a", settings["audio_bitrate"],
+        "-ar", str(settings["audio_fps"]),
+        output_path,
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Error transcoding video: {e.stderr}")
+        raise
+
+    print(f"Transcode complete: {output_path}")
+    return output_path
+
+def make_preview_proxy(video_path: str, assets_dir: Optional[str] = None) -> str:
+    """
+    Small, low-bitrate branded copy for the WhatsApp preview.
+    Single ffmpeg pass straight from the source (no MoviePy compositing),
+    so it is ready within seconds while the full-quality render continues.
+    """
+    info = probe_media(video_path)
+    w, h = info["width"], info["height"]
+    scale = min(1.0, PREVIEW_SHORT_SIDE / min(w, h)) if w and h else 1.0
+    w, h = int(w * scale) // 2 * 2, int(h * scale) // 2 * 2
+
+    # Same layout as brand_video: flair across the bottom, logo top right at 15% width
+    # The PNGs are looped (one frame otherwise) and the overlays end with the clip
+    flair_path, watermark_path = brand_asset_paths(assets_dir)
+    inputs = ["-i", video_path]
+    filters = [f"[0:v]scale={w or -2}:{h or -2}[v0]"]
+    last = "v0"
+    if flair_path:
+        inputs += ["-loop", "1", "-i", flair_path]
+        idx = inputs.count("-i") - 1
+        filters.append(f"[{idx}:v][{last}]scale2ref=w=main_w:h=ow*ih/iw[flair][base{idx}]")
+        filters.append(f"[base{idx}][flair]overlay=0:main_h-overlay_h:shortest=1[v{idx}]")
+        last = f"v{idx}"
+    if watermark_path:
+        inputs += ["-loop", "1", "-i", watermark_path]
+        idx = inputs.count("-i") - 1
+        padding = max(2, int(w * 0.02))
+        filters.append(f"[{idx}:v][{last}]scale2ref=w=main_w*0.15:h=ow*ih/iw[logo][base{idx}]")
+        filters.append(f"[base{idx}][logo]overlay=main_w-overlay_w-{padding}:{padding}:shortest=1[v{idx}]")
+        last = f"v{idx}"
+
+    output_path = os.path.join(TEMP_DIR, f"preview_{uuid.uuid4()}.mp4")
+    cmd = [
+        FFMPEG_BINARY, "-y", "-v", "error", *inputs,
+        "-filter_complex", ";".join(filters),
+        "-map", f"[{last}]", "-map", "0:a?",
+        "-r", str(PREVIEW_FPS),
+        "-c:v", "libx264", "-preset", "ultrafast", "-crf", PREVIEW_CRF, "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "64k", "-ac", "1",
+        "-movflags", "+faststart",
+        output_path,
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Error creating preview proxy: {e.stderr}")
+        raise
+
+    print(f"Preview proxy ready: {output_path}")
+    return output_path
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+Entry point for isolated video jobs (started by job_runner.run_video_job).
+
+    python -m src.tools.video_worker '<json spec>'
+
+Applies the resource limits to itself (inherited by its ffmpeg children),
+runs one video_ops function and writes {"ok", "output"|"error"} to the
+result file.
+"""
+import sys
+import json
+import resource
+import traceback
+
+# Only these can be run in a worker
+ALLOWED_FUNCS = {"brand_video"}
+
+
+def _apply_limits(max_vmem_mb: int, max_cpu_seconds: int):
+    if max_cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (max_cpu_seconds, max_cpu_seconds))
+    if max_vmem_mb:
+        limit = max_vmem_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def main():
+    spec = json.loads(sys.argv[1])
+    _apply_limits(spec["max_vmem_mb"], spec["max_cpu_seconds"])
+
+    result = {"ok": False}
+    try:
+        if spec["func"] not in ALLOWED_FUNCS:
+            raise ValueError(f"Unknown video job: {spec['func']}")
+
+        from src.tools import video_ops
+        output = getattr(video_ops, spec["func"])(*spec["args"], scratch_dir=spec["scratch_dir"], **spec["kwargs"])
+        result = {"ok": True, "output": output}
+    except BaseException as e:
+        traceback.print_exc()
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        with open(spec["result_path"], "w") as f:
+            json.dump(result, f)
+
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
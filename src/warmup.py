@@ -0,0 +1,66 @@
+import time
+import threading
+import importlib
+
+# Heavy imports we don't want on the request path after a scale-from-zero
+HEAVY_MODULES = [
+    "twilio.rest",
+    "src.agent.gemini_client",
+    "src.agent.graph",
+    "moviepy.editor",
+]
+
+# Read by the /ready endpoint
+WARMUP_STATE = {
+    "status": "pending",      # pending -> warming -> ready | failed
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},              # step name -> seconds
+    "error": None,
+}
+
+_started = threading.Lock()
+
+
+def _timed(name: str, func):
+    start = time.perf_counter()
+    result = func()
+    WARMUP_STATE["steps"][name] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def warm_up():
+    """Imports the heavy modules and builds the shared clients. Safe to call twice."""
+    WARMUP_STATE["status"] = "warming"
+    WARMUP_STATE["started_at"] = time.time()
+    try:
+        for module in HEAVY_MODULES:
+            _timed(f"import {module}", lambda m=module: importlib.import_module(m))
+
+        from src.agent.graph import get_agent_app
+        from src.agent.gemini_client import get_client
+        from src.tools.notifications import get_twilio_client
+        from src.tools.tenants import preload_brand_assets
+
+        _timed("compile graph", get_agent_app)
+        _timed("gemini client", get_client)
+        _timed("twilio client", get_twilio_client)
+        _timed("tenant brand assets", preload_brand_assets)
+
+        WARMUP_STATE["status"] = "ready"
+    except Exception as e:
+        # Not fatal: whatever failed is retried lazily on first use
+        print(f"⚠️ Warm-up failed: {e}")
+        WARMUP_STATE["status"] = "failed"
+        WARMUP_STATE["error"] = str(e)
+    finally:
+        WARMUP_STATE["finished_at"] = time.time()
+        total = WARMUP_STATE["finished_at"] - WARMUP_STATE["started_at"]
+        print(f"Warm-up {WARMUP_STATE['status']} in {total:.2f}s")
+
+
+def start_background_warmup():
+    """Runs warm_up() in a daemon thread so the server can start listening immediately."""
+    if not _started.acquire(blocking=False):
+        return
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
@@ -0,0 +1,19 @@
+"""Caption reuse decision for near-duplicate resends."""
+import pytest
+
+pytest.importorskip("PIL")
+
+from src.tools.media_index import caption_reusable
+
+
+def test_same_context_reuses_caption():
+    assert caption_reusable("Nieuwe partij boormachines", "nieuwe partij  boormachines ")
+
+
+def test_different_context_regenerates():
+    assert not caption_reusable("Nieuwe partij boormachines", "Nu met 20% korting")
+
+
+@pytest.mark.parametrize("earlier, current", [("", ""), (None, None), ("", "   "), ("Boormachines", "")])
+def test_empty_context_regenerates(earlier, current):
+    assert not caption_reusable(earlier, current)
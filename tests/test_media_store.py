@@ -0,0 +1,64 @@
+"""S3MediaStore against an in-memory S3-compatible endpoint (moto), no network."""
+import os
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from src.tools import media_store
+
+BUCKET = "social-agent-test"
+
+
+@pytest.fixture
+def s3_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setattr(media_store, "MEDIA_STORE", "s3")
+    monkeypatch.setattr(media_store, "S3_BUCKET", BUCKET)
+    monkeypatch.setattr(media_store, "S3_REGION", "us-east-1")
+    monkeypatch.setattr(media_store, "TEMP_DIR", str(tmp_path / "instance_b"))
+    os.makedirs(media_store.TEMP_DIR)
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        media_store.get_media_store.cache_clear()
+        yield media_store.get_media_store()
+        media_store.get_media_store.cache_clear()
+
+
+def test_share_url_and_fetch_on_another_instance(s3_store, tmp_path):
+    path = tmp_path / "render_1234.mp4"
+    path.write_bytes(b"video bytes")
+
+    key = media_store.share_media(str(path))
+    assert key == "render_1234.mp4"
+    stored = s3_store.client.get_object(Bucket=BUCKET, Key=f"{media_store.S3_PREFIX}{key}")
+    assert stored["Body"].read() == b"video bytes"
+    assert stored["ContentType"] == "video/mp4"
+
+    url = media_store.public_media_url(str(path))
+    assert f"{media_store.S3_PREFIX}{key}" in url and "X-Amz-Signature" in url
+
+    # Another instance only knows the path the draft recorded
+    path.unlink()
+    local = media_store.ensure_local(str(path))
+    assert local == os.path.join(media_store.TEMP_DIR, key)
+    with open(local, "rb") as f:
+        assert f.read() == b"video bytes"
+
+
+def test_share_skips_unchanged_upload(s3_store, tmp_path):
+    path = tmp_path / "photo_1.jpg"
+    path.write_bytes(b"jpeg")
+    media_store.share_media(str(path))
+    s3_store.client.delete_object(Bucket=BUCKET, Key=f"{media_store.S3_PREFIX}photo_1.jpg")
+
+    media_store.share_media(str(path))  # Same mtime and size: not uploaded again
+    assert s3_store.client.list_objects_v2(Bucket=BUCKET).get("KeyCount") == 0
+
+
+def test_local_store_without_base_url(monkeypatch):
+    monkeypatch.delenv("BASE_URL", raising=False)
+    with pytest.raises(ValueError):
+        media_store.LocalMediaStore().url("photo.jpg")
@@ -0,0 +1,45 @@
+"""make_preview_proxy on a generated clip: the branded proxy must cover the whole source."""
+import shutil
+import subprocess
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from src.tools.media_probe import FFMPEG_BINARY, FFPROBE_BINARY
+
+if not (shutil.which(FFMPEG_BINARY) and shutil.which(FFPROBE_BINARY)):
+    pytest.skip("ffmpeg/ffprobe not installed", allow_module_level=True)
+
+from src.tools.media_probe import probe_media
+from src.tools.video_ops import make_preview_proxy, PREVIEW_FPS
+
+SOURCE_SECONDS = 3
+
+
+def _ffmpeg(*args):
+    subprocess.run([FFMPEG_BINARY, "-y", "-v", "error", *args], check=True)
+
+
+def _frame_count(path: str) -> int:
+    result = subprocess.run(
+        [FFPROBE_BINARY, "-v", "error", "-select_streams", "v:0", "-count_frames",
+         "-show_entries", "stream=nb_read_frames", "-of", "csv=p=0", path],
+        check=True, capture_output=True, text=True,
+    )
+    return int(result.stdout.strip())
+
+
+def test_proxy_keeps_full_clip_with_branding(tmp_path):
+    source = str(tmp_path / "source.mp4")
+    _ffmpeg("-f", "lavfi", "-i", f"testsrc=size=640x360:rate=30:duration={SOURCE_SECONDS}",
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", source)
+    assets = tmp_path / "assets"
+    assets.mkdir()
+    _ffmpeg("-f", "lavfi", "-i", "color=c=red:size=400x60", "-frames:v", "1", str(assets / "bottom.png"))
+    _ffmpeg("-f", "lavfi", "-i", "color=c=blue:size=100x100", "-frames:v", "1", str(assets / "watermark.png"))
+
+    proxy = make_preview_proxy(source, assets_dir=str(assets))
+
+    assert abs(probe_media(proxy)["duration"] - probe_media(source)["duration"]) < 0.5
+    assert _frame_count(proxy) >= (SOURCE_SECONDS - 0.5) * PREVIEW_FPS
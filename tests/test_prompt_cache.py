@@ -0,0 +1,163 @@
+"""PromptCache against a fake Gemini client (no network) and a manual clock."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("google.genai")
+
+from src.agent.prompt_cache import PromptCache, FAILURE_BACKOFF_SECONDS
+
+TTL = 3600
+MARGIN = 300
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCaches:
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.deleted = []
+        self.fail_create = False
+        self.fail_update = False
+
+    async def create(self, model, config):
+        if self.fail_create:
+            raise RuntimeError("create failed")
+        name = f"cachedContents/{len(self.created) + 1}"
+        self.created.append((name, config.system_instruction))
+        return SimpleNamespace(name=name)
+
+    async def update(self, name, config):
+        if self.fail_update:
+            raise RuntimeError("cache expired")
+        self.updated.append(name)
+
+    async def delete(self, name):
+        self.deleted.append(name)
+
+
+class FakeModels:
+    def __init__(self, tokens=2000):
+        self.tokens = tokens
+        self.counted = 0
+
+    async def count_tokens(self, model, contents):
+        self.counted += 1
+        return SimpleNamespace(total_tokens=self.tokens)
+
+
+def make_cache(tokens=2000):
+    caches, models, clock = FakeCaches(), FakeModels(tokens), FakeClock()
+    client = SimpleNamespace(aio=SimpleNamespace(caches=caches, models=models))
+    cache = PromptCache(client, "gemini-2.5-flash", ttl_seconds=TTL, refresh_margin=MARGIN, clock=clock)
+    return cache, caches, models, clock
+
+
+def test_creates_once_and_reuses():
+    cache, caches, _, clock = make_cache()
+
+    async def scenario():
+        first = await cache.get("kooistra", "prompt v1")
+        clock.now += 60
+        second = await cache.get("kooistra", "prompt v1")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second == "cachedContents/1"
+    assert len(caches.created) == 1
+    assert caches.updated == []
+
+
+def test_refreshes_ttl_near_expiry():
+    cache, caches, _, clock = make_cache()
+
+    async def scenario():
+        await cache.get("kooistra", "prompt v1")
+        clock.now += TTL - MARGIN + 1
+        name = await cache.get("kooistra", "prompt v1")
+        # Refreshed: a full TTL again from now, no second refresh right away
+        clock.now += MARGIN
+        await cache.get("kooistra", "prompt v1")
+        return name
+
+    assert asyncio.run(scenario()) == "cachedContents/1"
+    assert caches.updated == ["cachedContents/1"]
+    assert len(caches.created) == 1
+
+
+def test_recreates_when_refresh_fails():
+    cache, caches, _, clock = make_cache()
+
+    async def scenario():
+        await cache.get("kooistra", "prompt v1")
+        caches.fail_update = True
+        clock.now += TTL - MARGIN + 1
+        return await cache.get("kooistra", "prompt v1")
+
+    assert asyncio.run(scenario()) == "cachedContents/2"
+    assert len(caches.created) == 2
+
+
+def test_recreates_on_prompt_change():
+    cache, caches, _, _ = make_cache()
+
+    async def scenario():
+        await cache.get("kooistra", "prompt v1")
+        return await cache.get("kooistra", "prompt v2")
+
+    assert asyncio.run(scenario()) == "cachedContents/2"
+    assert caches.deleted == ["cachedContents/1"]
+    assert caches.created[-1][1] == "prompt v2"
+
+
+def test_failure_backoff():
+    cache, caches, _, clock = make_cache()
+    caches.fail_create = True
+
+    async def scenario():
+        results = [await cache.get("kooistra", "prompt v1")]
+        caches.fail_create = False
+        clock.now += FAILURE_BACKOFF_SECONDS - 1
+        results.append(await cache.get("kooistra", "prompt v1"))  # Still backing off
+        clock.now += 2
+        results.append(await cache.get("kooistra", "prompt v1"))
+        return results
+
+    assert asyncio.run(scenario()) == [None, None, "cachedContents/1"]
+    assert len(caches.created) == 1
+
+
+def test_skips_prompts_below_cache_minimum():
+    cache, caches, models, clock = make_cache(tokens=600)
+
+    async def scenario():
+        results = [await cache.get("kooistra", "short prompt")]
+        clock.now += FAILURE_BACKOFF_SECONDS * 10
+        results.append(await cache.get("kooistra", "short prompt"))
+        return results
+
+    assert asyncio.run(scenario()) == [None, None]
+    assert caches.created == []
+    assert models.counted == 1
+
+
+def test_missing_token_count_stays_uncached():
+    cache, caches, models, clock = make_cache(tokens=None)
+
+    async def scenario():
+        results = [await cache.get("kooistra", "prompt v1")]
+        models.tokens = 2000
+        clock.now += FAILURE_BACKOFF_SECONDS + 1
+        results.append(await cache.get("kooistra", "prompt v1"))
+        return results
+
+    assert asyncio.run(scenario()) == [None, "cachedContents/1"]
+    assert models.counted == 2